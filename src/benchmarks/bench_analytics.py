@@ -0,0 +1,60 @@
+"""Benchmark of the returns and growth calculations used by get_history, $stonk plots and stock_worth
+
+Compares the old per element list comprehensions against functions.analytics
+on synthetic price series of increasing length (~30 years of trading days at the top end).
+
+usage (from src/): python -m benchmarks.bench_analytics
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from functions.analytics import summarize_growth
+
+SIZES = [21, 252, 2520, 7560]
+REPEAT = 5
+
+
+def legacy_growth(history: pd.DataFrame) -> dict:
+    # calculations as they were done before functions.analytics
+    buy_price = history.head(1).Close.iloc[0]
+    current_price = history.tail(1).Close.iloc[0]
+    returns = [(history.Close.iloc[x] / history.Close.iloc[x-1] - 1) for x in range(1, len(history.Close))]
+    returns.insert(0, 0)
+    percent_increase = [100*(history.Close.iloc[x]-buy_price)/buy_price for x in range(len(history.Close))]
+
+    return {
+        'returns': returns,
+        'percent_increase': percent_increase,
+        'annual_returns': 100 * ((1 + np.mean(returns))**252 - 1),
+        'total_increase': 100 * (current_price-buy_price) / buy_price
+    }
+
+
+def vectorized_growth(history: pd.DataFrame) -> dict:
+    return summarize_growth(history.Close.to_numpy())
+
+
+def synthetic_history(days: int) -> pd.DataFrame:
+    rng = np.random.default_rng(days)
+    close = 100 * np.cumprod(1 + rng.normal(0.0004, 0.01, days))
+    return pd.DataFrame({'Close': close}, index=pd.bdate_range('1990-01-01', periods=days))
+
+
+def main() -> None:
+    print(f"{'days':>6} {'legacy (ms)':>12} {'vectorized (ms)':>16} {'speedup':>8}")
+    for days in SIZES:
+        history = synthetic_history(days)
+
+        legacy, vectorized = legacy_growth(history), vectorized_growth(history)
+        assert np.allclose(legacy['percent_increase'], vectorized['percent_increase'])
+        assert np.isclose(legacy['annual_returns'], vectorized['annual_returns'])
+
+        legacy_time = min(timeit.repeat(lambda: legacy_growth(history), number=1, repeat=REPEAT))
+        vectorized_time = min(timeit.repeat(lambda: vectorized_growth(history), number=1, repeat=REPEAT))
+        print(f'{days:>6} {1000*legacy_time:>12.2f} {1000*vectorized_time:>16.3f} {legacy_time/vectorized_time:>7.0f}x')
+
+
+if __name__ == "__main__":
+    main()
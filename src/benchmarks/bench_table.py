@@ -0,0 +1,83 @@
+"""Benchmark of the $summary holdings table renderers
+
+Times plotting.render_table against the old dataframe_image export and reports peak memory.
+Each renderer runs in its own subprocess so peak RSS is not shared, the headless browser
+started by dataframe_image is counted through the child process usage.
+The first call includes importing the renderer (and launching the browser for dataframe_image).
+Peak RSS comes from the resource module, which is only available on unix.
+
+usage (from src/): python -m benchmarks.bench_table --calls 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+COLUMNS = ['Name', 'Ticker', 'Currency', 'Shares', 'Average Price', 'Market Price', 'Change (%)', 'Total Change', 'Market Value']
+ROWS = [[f'Company {i}', f'T{i}', 'USD', 10 + i, 100.0 + i, 110.5 + i, 10.5, 105.0, 1105.0 + i] for i in range(10)]
+
+
+def render_native(directory: str) -> None:
+    from functions.plotting import render_table
+    render_table(COLUMNS, ROWS)
+
+
+def render_dfi(directory: str) -> None:
+    import dataframe_image as dfi
+    import pandas as pd
+    df = pd.DataFrame(ROWS, columns=COLUMNS).set_index('Name')
+    dfi.export(df, os.path.join(directory, 'stock_table.png'))
+
+
+RENDERERS = {'native': render_native, 'dfi': render_dfi}
+
+
+def measure(method: str, calls: int) -> dict:
+    import resource
+
+    render = RENDERERS[method]
+    latencies = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(calls):
+            start = time.perf_counter()
+            render(directory)
+            latencies.append(time.perf_counter() - start)
+
+    # ru_maxrss is in kilobytes on linux
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {
+        'method': method,
+        'calls': calls,
+        'first_call_ms': 1000*latencies[0],
+        'mean_ms': 1000*sum(latencies[1:] or latencies)/len(latencies[1:] or latencies),
+        'peak_rss_mb': peak/1024
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=10)
+    parser.add_argument('--method', choices=list(RENDERERS), help='run a single renderer in this process')
+    args = parser.parse_args()
+
+    if args.method:
+        print(json.dumps(measure(args.method, args.calls)))
+        return
+
+    print(f"{'method':>8} {'first call (ms)':>16} {'mean (ms)':>10} {'peak rss (MB)':>14}")
+    for method in RENDERERS:
+        result = subprocess.run([sys.executable, '-m', 'benchmarks.bench_table', '--method', method, '--calls', str(args.calls)],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f'{method:>8} failed: {result.stderr.strip().splitlines()[-1]}')
+            continue
+
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{method:>8} {stats['first_call_ms']:>16.1f} {stats['mean_ms']:>10.1f} {stats['peak_rss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
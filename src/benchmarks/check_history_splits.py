@@ -0,0 +1,74 @@
+"""Check of the history store against a stock split
+
+A ticker's history is stored, then fake_yfinance splits it 10:1, which re-adjusts every earlier close.
+Refreshing the stored history and extending it further back should both download the whole range again
+instead of merging new rows into stale ones, so the stored closes match yahoo and show no -90% day.
+A ticker without a split should still only download its newest rows.
+
+usage (from src/): python -m benchmarks.check_history_splits
+"""
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import fake_yfinance
+fake_yfinance.install()
+
+from functions import history_store
+from functions.history_store import HISTORY_STORE
+
+START = date.today() - timedelta(days=365)
+
+
+def expire(ticker: str) -> None:
+    # makes the next read refresh the newest rows
+    path = os.path.join(HISTORY_STORE.path, ticker, 'meta.json')
+    with open(path, 'r') as read_path:
+        meta = json.load(read_path)
+    meta['checked'] = '2000-01-03T12:00:00-05:00'
+    with open(path, 'w') as write_path:
+        json.dump(meta, write_path)
+
+
+def check(name: str, ticker: str, start: date, downloads: int) -> None:
+    before = fake_yfinance.CALLS['history']
+    history = HISTORY_STORE.get(ticker, start)
+    calls = fake_yfinance.CALLS['history'] - before
+
+    expected = fake_yfinance._slice(ticker, start=start).Close.to_numpy()
+    worst = 100 * history.Close.pct_change().min()
+    print(f'{name:<28} {len(history)} rows, downloads: {calls}, worst day: {worst:.1f}%')
+    assert np.allclose(history.Close.to_numpy(), expected), f'{name}: stored closes differ from yahoo'
+    assert worst > -50, f'{name}: the split shows up as a {worst:.1f}% day'
+    assert calls == downloads, f'{name}: made {calls} downloads, expected {downloads}'
+
+
+def main() -> None:
+    HISTORY_STORE.path = tempfile.mkdtemp(prefix='bot-splits-')
+    split_day = pd.bdate_range(date.today() - timedelta(days=14), date.today())[-3].date()
+
+    # no split, the refresh only downloads the newest rows
+    HISTORY_STORE.get('STEADY', START)
+    expire('STEADY')
+    check('refresh without split', 'STEADY', START, 1)
+
+    # split after the history was stored, the refresh finds the re-adjusted overlap and downloads everything again
+    HISTORY_STORE.get('SPLITA', START)
+    fake_yfinance.split('SPLITA', split_day)
+    expire('SPLITA')
+    check('refresh after split', 'SPLITA', START, 2)
+
+    # split after the history was stored, extending it further back does the same
+    HISTORY_STORE.get('SPLITB', START)
+    fake_yfinance.split('SPLITB', split_day)
+    check('backfill after split', 'SPLITB', START - timedelta(days=365), 2)
+
+    print('ok')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Deterministic local stand in for the parts of yfinance the bot uses
+
+Install it before anything imports yfinance:
+
+    from benchmarks import fake_yfinance
+    fake_yfinance.install(latency=0.05)
+
+Every ticker gets a reproducible 30 year random walk of daily prices (seeded by its name).
+Tickers starting with INVALID behave like unknown symbols (empty history, no price).
+split() adds a stock split, after which every earlier price is re-adjusted like yahoo does.
+Each simulated request sleeps for LATENCY seconds and is counted in CALLS.
+"""
+import sys
+import time
+import zlib
+from collections import Counter
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+YEARS = 30
+LATENCY = 0.0
+CALLS = Counter()
+SPLITS = {}
+# while set, download answers like yfinance does on a network error or rate limit: an empty frame
+OUTAGE = False
+TIMEZONE = 'America/New_York'
+
+
+def install(latency: float = 0.0) -> None:
+    """Replaces yfinance in sys.modules with this module
+
+        Args:
+            latency (float): seconds every simulated request takes
+    """
+    configure(latency)
+    sys.modules['yfinance'] = sys.modules[__name__]
+
+
+def configure(latency: float) -> None:
+    global LATENCY
+    LATENCY = latency
+
+
+def split(ticker: str, day: date, ratio: float = 10.0) -> None:
+    """Splits a ticker's shares, prices from now on are divided by ratio and earlier prices are re-adjusted to match
+
+        Args:
+            ticker (str): ticker to split
+            day (date): first trading day after the split
+            ratio (float): new shares per old share
+    """
+    SPLITS.setdefault(ticker.upper(), []).append((day, ratio))
+
+
+def _request(kind: str) -> None:
+    CALLS[kind] += 1
+    if LATENCY:
+        time.sleep(LATENCY)
+
+
+def _valid(ticker: str) -> bool:
+    return not ticker.upper().startswith('INVALID')
+
+
+@lru_cache(maxsize=None)
+def _full_history(ticker: str) -> pd.DataFrame:
+    today = date.today()
+    index = pd.bdate_range(today - timedelta(days=365*YEARS), today, tz=TIMEZONE)
+
+    rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+    close = 20 * np.cumprod(1 + rng.normal(0.0003, 0.015, len(index)))
+    spread = close * rng.uniform(0, 0.01, len(index))
+
+    return pd.DataFrame({
+        'Open': close - spread/2,
+        'High': close + spread,
+        'Low': close - spread,
+        'Close': close,
+        'Volume': rng.integers(10**5, 10**7, len(index)).astype(float),
+        'Dividends': 0.0,
+        'Stock Splits': 0.0
+    }, index=index.rename('Date'))
+
+
+def _history(ticker: str) -> pd.DataFrame:
+    history = _full_history(ticker)
+    if ticker not in SPLITS:
+        return history
+
+    # adjusted closes divide every price by all splits so far, the split itself is recorded on its day
+    history = history.copy()
+    for day, ratio in SPLITS[ticker]:
+        history[['Open', 'High', 'Low', 'Close']] /= ratio
+        history['Volume'] *= ratio
+        history.iloc[history.index.searchsorted(_timestamp(day)), history.columns.get_loc('Stock Splits')] = ratio
+    return history
+
+
+def _slice(ticker: str, period: str = None, start=None, end=None) -> pd.DataFrame:
+    ticker = ticker.upper()
+    if not _valid(ticker):
+        return pd.DataFrame()
+
+    history = _history(ticker)
+    if period is not None and period != 'max':
+        if period.endswith('d'):
+            return history.tail(int(period[:-1])).copy()
+        today = pd.Timestamp(date.today(), tz=TIMEZONE)
+        if period == 'ytd':
+            start = pd.Timestamp(date.today().year, 1, 1, tz=TIMEZONE)
+        elif period.endswith('mo'):
+            start = today - pd.DateOffset(months=int(period[:-2]))
+        else:
+            start = today - pd.DateOffset(years=int(period[:-1]))
+
+    if start is not None:
+        history = history[history.index >= _timestamp(start)]
+    if end is not None:
+        history = history[history.index < _timestamp(end)]
+    return history.copy()
+
+
+def _timestamp(value) -> pd.Timestamp:
+    value = pd.Timestamp(value)
+    return value.tz_localize(TIMEZONE) if value.tzinfo is None else value
+
+
+class Ticker:
+    def __init__(self, ticker: str) -> None:
+        self.ticker = ticker.upper()
+
+    @property
+    def info(self) -> dict:
+        _request('info')
+        if not _valid(self.ticker):
+            return {'trailingPegRatio': None}
+
+        close = _history(self.ticker).Close
+        return {
+            'longName': f'{self.ticker} Incorporated',
+            'financialCurrency': 'USD',
+            'exchange': 'NMS',
+            'quoteType': 'EQUITY',
+            'currentPrice': float(close.iloc[-1]),
+            'lastPrice': float(close.iloc[-1]),
+            'dayHigh': float(close.iloc[-1]) * 1.01,
+            'dayLow': float(close.iloc[-1]) * 0.99,
+            'fiftyDayAverage': float(close.tail(50).mean()),
+            'marketCap': 10**10,
+            'yearHigh': float(close.tail(252).max()),
+            'yearLow': float(close.tail(252).min()),
+            'yearChange': float(close.iloc[-1] / close.iloc[-252] - 1)
+        }
+
+    @property
+    def news(self) -> list:
+        _request('news')
+        if not _valid(self.ticker):
+            return []
+        return [{'title': f'{self.ticker} story {i}', 'link': f'https://example.com/{self.ticker}/{i}'} for i in range(5)]
+
+    def history(self, period: str = None, start=None, end=None, **kwargs) -> pd.DataFrame:
+        _request('history')
+        if period is None and start is None:
+            period = '1mo'
+        return _slice(self.ticker, period, start, end)
+
+
+class Tickers:
+    def __init__(self, tickers) -> None:
+        tickers = tickers.split() if isinstance(tickers, str) else tickers
+        self.tickers = {ticker.upper(): Ticker(ticker) for ticker in tickers}
+
+
+def download(tickers, period: str = None, start=None, end=None, **kwargs) -> pd.DataFrame:
+    _request('download')
+    if OUTAGE:
+        return pd.DataFrame()
+    tickers = tickers.split() if isinstance(tickers, str) else list(tickers)
+    if period is None and start is None:
+        period = '1mo'
+
+    frames = {ticker.upper(): _slice(ticker, period, start, end) for ticker in tickers}
+    frames = {ticker: frame for ticker, frame in frames.items() if len(frame)}
+    if not frames:
+        return pd.DataFrame()
+
+    data = pd.concat(frames, axis=1)
+    # yfinance groups columns by field first
+    return data.swaplevel(0, 1, axis=1).sort_index(axis=1)
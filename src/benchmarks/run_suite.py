@@ -0,0 +1,192 @@
+"""Offline benchmark suite of the bot's hot paths
+
+yfinance is replaced by benchmarks.fake_yfinance and all data lives in a temporary folder,
+so nothing here touches Yahoo or the real databases.
+Market data functions are timed from 5 days to 30 years of history and
+portfolio/todo functions from 10 to 10k users. Results are written as json so runs on
+different commits can be compared.
+
+usage (from src/): python -m benchmarks.run_suite --latency 0.05 --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks import fake_yfinance
+fake_yfinance.install()
+
+from functions import history_store, portfolio_game, stock_info, storage, ticker_store, todo_list
+from functions.executor import EXECUTOR
+from functions.plotting import render_price_plot
+from functions.quote_cache import QUOTE_CACHE
+from functions.render_cache import PLOT_CACHE
+
+USER_SCALES = [10, 100, 1000, 10000]
+# get_history needs at least two days of data to compute returns, so the shortest period is 5d
+PERIODS = ['5d', '1mo', '1y', '10y', 'max']
+WORTH_SPANS = {'1w': 7, '1mo': 30, '1y': 365, '10y': 3650, '30y': 365*30 - 30}
+TICKER_POOL = [f'TK{i}' for i in range(50)]
+HOLDINGS_PER_USER = 5
+TODO_ITEMS_PER_USER = 5
+
+
+class Suite:
+    def __init__(self, directory: str, repeat: int) -> None:
+        self.directory = directory
+        self.repeat = repeat
+        self.results = []
+        # one loop for every render, like the bot's
+        self.loop = asyncio.new_event_loop()
+
+        history_store.HISTORY_STORE.path = os.path.join(directory, 'history')
+        ticker_store.TICKER_STORE.path = os.path.join(directory, 'tickers.db')
+
+    def time(self, name: str, params: dict, func, *args, setup=None) -> None:
+        """Times func over several runs and records the result
+
+            Args:
+                name (str): name of the benchmark
+                params (dict): scale of the run
+                func (callable): function to time
+                *args: arguments passed to func
+                setup (callable): called before every run, not timed
+        """
+        timings = []
+        calls = 0
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            before = sum(fake_yfinance.CALLS.values())
+            start = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - start)
+            calls += sum(fake_yfinance.CALLS.values()) - before
+
+        result = {
+            'name': name,
+            'params': params,
+            'min_ms': 1000*min(timings),
+            'mean_ms': 1000*sum(timings)/len(timings),
+            'upstream_calls': calls / self.repeat
+        }
+        self.results.append(result)
+        print(f"{name:<32} {json.dumps(params):<36} min {result['min_ms']:>10.2f} ms  mean {result['mean_ms']:>10.2f} ms  "
+              f"upstream {result['upstream_calls']:.1f}")
+
+    def plot_price(self, ticker: str, period: str) -> bytes:
+        # the path of $stonk, the plot is rendered on the process pool unless PLOT_CACHE has it
+        history = stock_info.get_history(ticker, period)
+        key = stock_info.price_plot_key(ticker, period, history)
+        return self.loop.run_until_complete(EXECUTOR.render_cached('stonk', key, render_price_plot, ticker, history))
+
+    def market_data(self) -> None:
+        # the warm runs read from a history store that already holds the full range
+        stock_info.get_history('TK0', 'max')
+        stock_worth_start = date.today() - timedelta(days=max(WORTH_SPANS.values()))
+        stock_info.stock_worth('TK1', 1000, stock_worth_start)
+
+        for period in PERIODS:
+            cold = iter(f'COLD{period.upper()}{i}' for i in range(self.repeat))
+            self.time('get_history/cold', {'period': period}, lambda: stock_info.get_history(next(cold), period))
+            self.time('get_history/warm', {'period': period}, stock_info.get_history, 'TK0', period)
+            self.time('plot_price/render', {'period': period}, self.plot_price, 'TK0', period, setup=PLOT_CACHE.clear)
+            self.time('plot_price/cached', {'period': period}, self.plot_price, 'TK0', period)
+
+        for span, days in WORTH_SPANS.items():
+            start = date.today() - timedelta(days=days)
+            self.time('stock_worth', {'span': span}, stock_info.stock_worth, 'TK1', 1000, start)
+
+    def setup_users(self, users: int) -> None:
+        # profiles are written as an old pysondb file and imported in one transaction
+        rng = random.Random(users)
+        profiles = []
+        for i in range(users):
+            portfolio = {ticker: {'name': f'{ticker} Incorporated', 'shares': rng.randint(1, 50), 'average_price': 20.0, 'currency': 'USD'}
+                         for ticker in rng.sample(TICKER_POOL, HOLDINGS_PER_USER)}
+            profiles.append({'username': f'user{i}', 'create_date': str(date.today() - timedelta(days=365)),
+                             'funds_available': 5000.0, 'portfolio': portfolio})
+
+        path = os.path.join(self.directory, f'portfolios_{users}.json')
+        with open(path, 'w') as write_path:
+            json.dump({'data': profiles}, write_path)
+
+        storage._storage = storage.Storage(os.path.join(self.directory, f'portfolios_{users}.db'))
+        storage._storage.migrate_from_pysondb(path, os.path.join(self.directory, 'missing.json'))
+
+    def setup_todo(self, users: int) -> None:
+        path = os.path.join(self.directory, f'todo_{users}.json')
+        with open(path, 'w') as write_path:
+            json.dump({f'user{i}': [f'item {j}' for j in range(TODO_ITEMS_PER_USER)] for i in range(users)}, write_path)
+
+        if todo_list._todo_log is not None:
+            todo_list._todo_log.close()
+        todo_list._todo_log = todo_list.TodoLog(path)
+
+    def portfolios(self, users: int) -> None:
+        self.setup_users(users)
+        params = {'users': users}
+
+        self.time('profile_summary/cold_quotes', params, portfolio_game.profile_summary, 'user0', setup=QUOTE_CACHE.clear)
+        self.time('profile_summary/warm_quotes', params, portfolio_game.profile_summary, 'user0')
+        self.time('get_leaderboard/cold_quotes', params, portfolio_game.get_leaderboard, setup=QUOTE_CACHE.clear)
+        self.time('get_leaderboard/warm_quotes', params, portfolio_game.get_leaderboard)
+
+        held = list(storage._storage.get_profile('user1')['portfolio'])[0]
+        self.time('buy_stock', params, portfolio_game.buy_stock, 'user1', held, 1, 20.0)
+        self.time('sell_stock', params, portfolio_game.sell_stock, 'user1', held, 1, 20.0)
+
+    def todo(self, users: int) -> None:
+        self.setup_todo(users)
+        params = {'users': users}
+
+        self.time('todo/get_list', params, todo_list.get_list, 'user0')
+        self.time('todo/add_item', params, todo_list.add_item, 'user0', 'benchmark item')
+        self.time('todo/mark_complete', params, todo_list.mark_complete, 'user0', 0)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every fake yfinance request takes')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--users', type=int, nargs='+', default=USER_SCALES)
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    fake_yfinance.configure(args.latency)
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        suite = Suite(directory, args.repeat)
+        suite.market_data()
+        for users in args.users:
+            suite.portfolios(users)
+            suite.todo(users)
+    EXECUTOR.shutdown()
+    suite.loop.close()
+
+    with open(args.output, 'w') as write_path:
+        json.dump({
+            'commit': git_commit(),
+            'created': datetime.now().isoformat(),
+            'latency': args.latency,
+            'repeat': args.repeat,
+            'results': suite.results
+        }, write_path, indent=4)
+
+    print(f'results written to {args.output}')
+
+
+if __name__ == "__main__":
+    main()
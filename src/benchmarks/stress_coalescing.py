@@ -0,0 +1,124 @@
+"""Stress test of request coalescing
+
+A burst of identical get_price, get_info, get_history and get_news calls is fired at the same
+time against fake_yfinance with a fixed latency, once from the event loop through the command
+executor (as the cogs do) and once from plain threads. Each burst should reach yahoo once,
+and a burst for an unknown ticker should fail for every caller (its empty quote is confirmed by one
+metadata lookup). Repeated lookups of an unknown ticker, and the price of a ticker whose metadata was
+just fetched, should not reach yahoo at all, and a failed download should not mark a ticker invalid.
+
+usage (from src/): python -m benchmarks.stress_coalescing --burst 50 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import fake_yfinance
+fake_yfinance.install()
+
+from functions import history_store, ticker_store
+from functions.executor import EXECUTOR
+from functions.quote_cache import QUOTE_CACHE
+from functions.stock_info import get_price, get_info, get_history, get_news
+from functions.ticker_store import TICKER_STORE
+
+CALLS = [
+    ('get_price', get_price, ('AAPL',), 1),
+    ('get_info', get_info, ('AAPL',), 1),
+    ('get_history', get_history, ('MSFT', '1y'), 1),
+    ('get_news', get_news, ('AAPL',), 1),
+    # an empty quote download is confirmed by the metadata lookup before the ticker is remembered as invalid
+    ('get_price (invalid)', get_price, ('INVALID',), 2)
+]
+
+
+def report(name: str, results: list, calls: int, elapsed: float, expected: int = 1) -> None:
+    errors = sum(isinstance(result, Exception) for result in results)
+    print(f'{name:<32} {len(results)} calls in {1000*elapsed:>8.1f} ms, upstream requests: {calls}, errors: {errors}')
+    assert calls == expected, f'{name} made {calls} upstream requests, expected {expected}'
+    assert errors in (0, len(results)), f'{name} failed for {errors} of {len(results)} callers'
+
+
+async def executor_bursts(size: int) -> None:
+    for name, func, args, expected in CALLS:
+        QUOTE_CACHE.clear()
+        before = sum(fake_yfinance.CALLS.values())
+        start = time.perf_counter()
+        results = await asyncio.gather(*[EXECUTOR.run_io_shared('stress', (name,) + args, func, *args) for _ in range(size)],
+                                       return_exceptions=True)
+        report(f'{name} (executor)', results, sum(fake_yfinance.CALLS.values()) - before, time.perf_counter() - start, expected)
+
+
+def thread_bursts(size: int) -> None:
+    def call(func, args):
+        try:
+            return func(*args)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=size) as pool:
+        for name, func, args, expected in CALLS:
+            QUOTE_CACHE.clear()
+            before = sum(fake_yfinance.CALLS.values())
+            start = time.perf_counter()
+            results = list(pool.map(lambda _: call(func, args), range(size)))
+            report(f'{name} (threads)', results, sum(fake_yfinance.CALLS.values()) - before, time.perf_counter() - start, expected)
+
+
+def repeat_lookups() -> None:
+    QUOTE_CACHE.clear()
+    before = sum(fake_yfinance.CALLS.values())
+    start = time.perf_counter()
+    results = []
+    for _ in range(3):
+        try:
+            results.append(get_price('INVALIDX'))
+        except Exception as e:
+            results.append(e)
+    report('get_price (invalid, repeated)', results, sum(fake_yfinance.CALLS.values()) - before, time.perf_counter() - start, 2)
+
+    # a new ticker in $buy: the metadata lookup also fills the quote cache
+    before = sum(fake_yfinance.CALLS.values())
+    start = time.perf_counter()
+    TICKER_STORE.get('NEWCO')
+    results = [get_price('NEWCO')]
+    report('metadata then get_price', results, sum(fake_yfinance.CALLS.values()) - before, time.perf_counter() - start)
+
+    # a failed download of a known ticker is not remembered, the next lookup gets the price
+    TICKER_STORE.get('FLAKY')
+    QUOTE_CACHE.clear()
+    fake_yfinance.OUTAGE = True
+    try:
+        get_price('FLAKY')
+    except Exception as e:
+        print(f'{"get_price (outage)":<32} {e}')
+    fake_yfinance.OUTAGE = False
+    assert not TICKER_STORE.is_invalid('FLAKY'), 'an outage marked FLAKY as invalid'
+    print(f'{"get_price (after outage)":<32} {get_price("FLAKY"):.2f}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--burst', type=int, default=50, help='identical calls fired at once')
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds every fake yfinance request takes')
+    args = parser.parse_args()
+
+    fake_yfinance.configure(args.latency)
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        history_store.HISTORY_STORE.path = directory
+        ticker_store.TICKER_STORE.path = os.path.join(directory, 'tickers.db')
+        asyncio.run(executor_bursts(args.burst))
+        # the history is stored locally after the first burst, so the thread burst uses another ticker
+        CALLS[2] = ('get_history', get_history, ('NVDA', '1y'), 1)
+        # the unknown ticker is remembered as invalid after the first burst
+        CALLS[4] = ('get_price (invalid)', get_price, ('INVALIDY',), 2)
+        thread_bursts(args.burst)
+        repeat_lookups()
+    EXECUTOR.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Stress test of concurrent buy/sell commands
+
+Every user fires a burst of trades at the same time through the command executor.
+Trades are run once behind a single global lock (every trade waits on every other trade)
+and once behind per-user locks, then the final funds, holdings and ledger of each user are checked.
+
+usage (from src/): python -m benchmarks.stress_trades --users 50 --trades 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from functions import storage
+from functions.executor import EXECUTOR
+from functions.portfolio_game import create_user_profile, buy_stock, sell_stock, get_profile
+from functions.user_locks import UserLocks
+
+# constants
+from functions.constants import STARTING_FUNDS
+
+PRICE = 10.0
+TICKER = 'TEST'
+
+
+def setup_storage(path: str, users: int) -> None:
+    storage._storage = storage.Storage(path)
+    for i in range(users):
+        username = f'user{i}'
+        create_user_profile(username)
+        # seeding the holding means buys never look up ticker info
+        storage._storage.update_profile(username, STARTING_FUNDS, {TICKER: {'name': 'Test', 'shares': 1, 'average_price': PRICE, 'currency': 'USD'}})
+
+
+async def trade(lock: asyncio.Lock, username: str, i: int) -> None:
+    func = buy_stock if i % 2 == 0 else sell_stock
+    async with lock:
+        await EXECUTOR.run_io('stress', func, username, TICKER, 1, PRICE)
+
+
+async def run(users: int, trades: int, per_user: bool) -> float:
+    locks = UserLocks()
+    global_lock = asyncio.Lock()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[trade(locks(f'user{u}') if per_user else global_lock, f'user{u}', i)
+                           for i in range(trades) for u in range(users)])
+    return time.perf_counter() - start
+
+
+def check(users: int, trades: int) -> None:
+    # buys and sells alternate so every user ends where they started
+    for i in range(users):
+        username = f'user{i}'
+        profile = get_profile(username)
+        assert round(profile['funds_available'], 2) == STARTING_FUNDS - (trades % 2) * PRICE, profile
+        assert profile['portfolio'][TICKER]['shares'] == 1 + trades % 2, profile
+        assert len(storage._storage.get_transactions(username)) == trades
+
+
+async def compare(users: int, trades: int) -> None:
+    # both runs share one event loop since the executor's semaphores are bound to it
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        for per_user in [False, True]:
+            setup_storage(os.path.join(directory, f'stress_{per_user}.db'), users)
+            elapsed = await run(users, trades, per_user)
+            check(users, trades)
+
+            total = users * trades
+            print(f"{'per user locks' if per_user else 'global lock':>15}: {total} trades in {elapsed:.2f}s "
+                  f'({total/elapsed:.0f} trades/s), ledger and balances consistent')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--trades', type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(compare(args.users, args.trades))
+    EXECUTOR.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
+import io
 import random
 import os
 import discord
 from discord.ext import commands
 
+from functions.executor import EXECUTOR
+from functions.ledger import export_ledger
+from functions.metrics import METRICS
+
 # constants
 VIDEO_PATH = "C:/Users/Yang/Documents/Projects/discord bot/videos/"
 
@@ -23,9 +28,48 @@ class GeneralCommands(commands.Cog):
             await ctx.send(file=discord.File(f"{VIDEO_PATH}{random.choice([x for x in os.listdir(VIDEO_PATH) if os.path.isfile(os.path.join(VIDEO_PATH, x))])}"))
 
         except Exception as e:
+            ctx.command_failed = True
             print(e)
             await ctx.send(e)
 
+    @commands.command(name='stats',
+                      help='- (admin) latency, error and cache stats of the bot. example: $stats')
+    @commands.has_permissions(administrator=True)
+    async def stats(self, ctx):
+        try:
+            snapshot = METRICS.snapshot()
+
+            lines = [f"{'name':<28}{'count':>7}{'errors':>7}{'mean':>9}{'p95':>9}"]
+            for (family, name), histogram in snapshot['histograms'].items():
+                lines.append(f"{f'{family}:{name}'[:27]:<28}{histogram['count']:>7}{histogram['errors']:>7}"
+                             f"{1000*histogram['mean']:>7.0f}ms{1000*histogram['p95']:>7.0f}ms")
+
+            lines.append('')
+            for source, values in snapshot['gauges'].items():
+                lines.append(f'{source}: ' + ', '.join(f'{key}={round(value, 2)}' for key, value in values.items()))
+
+            # discord messages are capped at 2000 characters
+            await ctx.send('```' + '\n'.join(lines)[:1990] + '```')
+
+        except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
+    @commands.command(name='exportledger',
+                      help='- (admin) exports the transactions ledger as a parquet file. example: $exportledger billjohn')
+    @commands.has_permissions(administrator=True)
+    async def export(self, ctx,
+                     username: str=commands.parameter(default=None, description='- discord username (defaults to every user)'),
+                     ticker: str=commands.parameter(default=None, description='- stock ticker (defaults to every ticker)')):
+        try:
+            buffer = io.BytesIO()
+            rows = await EXECUTOR.run_io('exportledger', export_ledger, buffer, username, ticker)
+            await ctx.send(f'{rows} transactions', file=discord.File(io.BytesIO(buffer.getvalue()), filename='transactions.parquet'))
+
+        except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
 
 async def setup(bot):
     await bot.add_cog(GeneralCommands(bot))
@@ -1,15 +1,24 @@
+import io
 import discord
 from discord.ext import commands
-import pandas as pd
-import dataframe_image as dfi
 import datetime as dt
 
 from functions.portfolio_game import (check_user_exists, create_user_profile, profile_summary,
-                                       buy_stock, sell_stock, get_available_funds, check_user_owns_stock, get_stock_info, get_leaderboard)
-from functions.stock_info import get_price
+                                       buy_stock, sell_stock, get_available_funds, check_user_owns_stock, get_stock_info,
+                                       get_performance_history, history_plot_key, day_performance, parse_order, execute_order)
+from functions.stock_info import get_price, get_prices
+from functions.executor import EXECUTOR
+from functions.leaderboard import LEADERBOARDS
+from functions.ledger import get_ledger
+from functions.order_book import ORDER_MATCHER
+from functions.plotting import render_history_plot, render_table
+from functions.price_refresher import PRICE_REFRESHER
+from functions.prompts import wait_for_reply
+from functions.ticker_store import TICKER_STORE
+from functions.user_locks import USER_LOCKS
 
 # constants
-from functions.constants import STARTING_FUNDS, STOCK_TABLE_PATH
+from functions.constants import STARTING_FUNDS, RANKINGS_PAGE_SIZE, RANKINGS_NEIGHBORS
 
 
 class PortfolioGame(commands.Cog):
@@ -40,11 +49,12 @@ class PortfolioGame(commands.Cog):
                       help='- creates a portfolio for the simulation :). example: $create')
     async def create_port(self, ctx):
         try:
-            if create_user_profile(ctx.message.author.name):
+            if await EXECUTOR.run_io('create', create_user_profile, ctx.message.author.name):
                 await ctx.send('Profile created!')
             else:
                 await ctx.send('User profile already exists!')
         except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
 
     # summarizes user portfolio
@@ -53,14 +63,22 @@ class PortfolioGame(commands.Cog):
     async def port_sum(self, ctx, *, 
                        username: str=commands.parameter(description='- discord username')):
         try:
-            if check_user_exists(username):
-                summary = profile_summary(username)
+            if await EXECUTOR.run_io('summary', check_user_exists, username):
+                snapshot = PRICE_REFRESHER.snapshot
+                if snapshot is None:
+                    await ctx.send('Prices are still loading, please try again in a moment')
+                    return
+
+                summary = await EXECUTOR.run_io('summary', profile_summary, username, snapshot)
                 response = f"""Portfolio performance on {dt.datetime.now().strftime('%A %b %d %Y, %H:%M:%S')}
+                    > ***Prices As Of***: {price_age(snapshot)}
                     > ***Date Created***: {summary['create_date']}
                     > ***Funds Available***: ${round(summary['funds_available'],2)}
                     > ***Total Market Value of Portfolio***: ${round(summary['current_value'],2)}
                     
                     Here's the breakdown:"""
+                if summary['estimated']:
+                    response += f"\n> *No price yet for {', '.join(summary['estimated'])}, valued at the average price paid*"
                 
                 current_values = summary['current_stock_values']
                 portfolio = summary['portfolio']
@@ -82,19 +100,19 @@ class PortfolioGame(commands.Cog):
                     ])
 
                 columns = ['Name', 'Ticker', 'Currency', 'Shares', 'Average Price', 'Market Price', 'Change (%)', 'Total Change', 'Market Value']
-                df = pd.DataFrame(data, columns=columns).set_index('Name')
-                dfi.export(df, STOCK_TABLE_PATH)
+                png = await EXECUTOR.render_cached('summary', ('table',) + tuple(map(tuple, data)), render_table, columns, data)
                 
                 message = discord.Embed(color=0xa3a3ff,
                                         title=f":money_mouth: {username}'s Portfolio Summary :money_mouth:",
                                         description=response)
-                file = discord.File(STOCK_TABLE_PATH, filename="stock_summary_table.jpg")
-                message.set_image(url=f'attachment://stock_summary_table.jpg')
+                file = discord.File(io.BytesIO(png), filename="stock_summary_table.png")
+                message.set_image(url=f'attachment://stock_summary_table.png')
                 await ctx.send(file=file, embed=message)
             else:
                 await ctx.send(f'{username} does not have a profile! Please create one with ***$create*** first.')
 
         except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
     
     # buy a stock
@@ -103,30 +121,32 @@ class PortfolioGame(commands.Cog):
     async def buy(self, ctx, 
                   ticker: str=commands.parameter(description='- stock ticker')):
         try:
-            if check_user_exists(ctx.message.author.name):
-                price = get_price(ticker)
-                funds = round(get_available_funds(ctx.message.author.name),2)
+            if await EXECUTOR.run_io('buy', check_user_exists, ctx.message.author.name):
+                # metadata of a new ticker is fetched with its price, so the trade makes no request after the prompt
+                await EXECUTOR.run_io('buy', TICKER_STORE.get, ticker)
+                price = await EXECUTOR.run_io_shared('buy', ('price', ticker.upper()), get_price, ticker)
+                funds = round(await EXECUTOR.run_io('buy', get_available_funds, ctx.message.author.name),2)
                 
-                await ctx.send(f"""> The current price of ***{ticker.upper()}*** is ***${round(get_price(ticker), 2)}***
+                await ctx.send(f"""> The current price of ***{ticker.upper()}*** is ***${round(price, 2)}***
                                > You have ***${funds}*** available to be invested.
                                > With this money, you can buy a maximum of ***{int(funds/price)} shares***.
                                > **How many shares would you like to buy?** (enter a whole number... 'no' to cancel transaction)""")
 
-                response = await self.bot.wait_for('message',
-                                                check=lambda message:message.author == ctx.author and message.channel.id == ctx.channel.id,
-                                                timeout=20.0)
+                response = await wait_for_reply(self.bot, ctx)
                 
                 if response.content in ['n', 'N', 'No', 'NO', 'no']:
                     await ctx.send('Transaction Cancelled')
                 elif int(response.content) > int(funds/price):
                     await ctx.send(f'You cant afford {int(response.content)} shares right now')
                 else:
-                    buy_stock(ctx.message.author.name, ticker, int(response.content), price)
+                    async with USER_LOCKS(ctx.message.author.name):
+                        await EXECUTOR.run_io('buy', buy_stock, ctx.message.author.name, ticker, int(response.content), price)
                     await ctx.send(f'Congrats, you just bought {int(response.content)} shares of {ticker} at {price}!')
             else:
                 await ctx.send('You do not have a profile! Create one with ***$create***')
 
         except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
 
     # sell a stock
@@ -135,10 +155,10 @@ class PortfolioGame(commands.Cog):
     async def sell(self, ctx,
                    ticker: str=commands.parameter(description='- stock ticker')):
         try:
-            if check_user_owns_stock(ctx.message.author.name, ticker):
-                price = get_price(ticker)
-                funds = round(get_available_funds(ctx.message.author.name),2)
-                info = get_stock_info(ctx.message.author.name, ticker)
+            if await EXECUTOR.run_io('sell', check_user_owns_stock, ctx.message.author.name, ticker):
+                price = await EXECUTOR.run_io_shared('sell', ('price', ticker.upper()), get_price, ticker)
+                funds = round(await EXECUTOR.run_io('sell', get_available_funds, ctx.message.author.name),2)
+                info = await EXECUTOR.run_io('sell', get_stock_info, ctx.message.author.name, ticker)
 
 
                 
@@ -148,43 +168,271 @@ class PortfolioGame(commands.Cog):
                                > If you were to sell now, you would make ***${price-info['average_price']}*** per share.
                                > **How many shares would you like to sell?** (enter a whole number... 'no' to cancel transaction)""")
 
-                response = await self.bot.wait_for('message',
-                                                check=lambda message:message.author == ctx.author and message.channel.id == ctx.channel.id,
-                                                timeout=20.0)
+                response = await wait_for_reply(self.bot, ctx)
                 
                 if response.content in ['n', 'N', 'No', 'NO', 'no']:
                     await ctx.send('Transaction Cancelled')
                 elif int(response.content) > info['shares']:
                     await ctx.send(f'You dont own that many shares!')
                 else:
-                    sell_stock(ctx.message.author.name, ticker, int(response.content), price)
+                    async with USER_LOCKS(ctx.message.author.name):
+                        await EXECUTOR.run_io('sell', sell_stock, ctx.message.author.name, ticker, int(response.content), price)
                     await ctx.send(f"""Congrats, **you just sold {int(response.content)} shares of {ticker.upper()} at ${price}**!
                                    you now have ***${funds+int(response.content)*price}*** available to invest""")
             else:
                 await ctx.send(f'You do not own any shares of {ticker}!')
 
         except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
+    # buy and sell several stocks at once
+    @commands.command(name='order',
+                      help='- buy and sell several stocks at once! example: $order buy AAPL 10, sell TSLA 5, buy MSFT 3')
+    async def order(self, ctx, *,
+                    basket: str=commands.parameter(description='- comma separated trades, each one buy/sell, ticker and shares')):
+        try:
+            legs = parse_order(basket)
+            if await EXECUTOR.run_io('order', check_user_exists, ctx.message.author.name):
+                # metadata of new tickers is fetched with their prices, so the trade makes no request after the prompt
+                await EXECUTOR.run_io('order', TICKER_STORE.prepopulate, [ticker for status, ticker, _ in legs if status == 'buy'])
+                prices = await EXECUTOR.run_io('order', get_prices, [ticker for _, ticker, _ in legs])
+                funds = round(await EXECUTOR.run_io('order', get_available_funds, ctx.message.author.name),2)
+
+                lines = [f'> {status.capitalize()} ***{amount}*** shares of ***{ticker}*** at ***${round(prices[ticker], 2)}***'
+                         for status, ticker, amount in legs]
+                net = round(sum((amount if status == 'sell' else -amount) * prices[ticker] for status, ticker, amount in legs), 2)
+                lines.append(f'> Your funds would go from ***${funds}*** to ***${round(funds + net, 2)}***')
+                lines.append("> **Place this order?** (yes/no)")
+                await ctx.send('\n'.join(lines))
+
+                response = await wait_for_reply(self.bot, ctx)
+
+                if response.content.lower() not in ['y', 'yes']:
+                    await ctx.send('Order Cancelled')
+                else:
+                    async with USER_LOCKS(ctx.message.author.name):
+                        remaining = await EXECUTOR.run_io('order', execute_order, ctx.message.author.name, legs, prices)
+                    await ctx.send(f'Congrats, your order of {len(legs)} trades went through! you now have ***${remaining}*** available to invest')
+            else:
+                await ctx.send('You do not have a profile! Create one with ***$create***')
+
+        except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
+    # pending orders
+    @commands.command(name='limit',
+                      help='- buy or sell once the price reaches a limit! example: $limit buy QBTS 10 4.50')
+    async def limit(self, ctx,
+                    side: str=commands.parameter(description='- buy or sell'),
+                    ticker: str=commands.parameter(description='- stock ticker'),
+                    shares: int=commands.parameter(description='- number of shares'),
+                    limit_price: float=commands.parameter(description='- highest price to buy at or lowest price to sell at')):
+        await self.place_order(ctx, side, ticker, shares, 'limit', limit_price, None)
+
+    @commands.command(name='stop',
+                      help='- buy or sell at market once the price crosses a stop! example: $stop sell QBTS 10 3.80')
+    async def stop(self, ctx,
+                   side: str=commands.parameter(description='- buy or sell'),
+                   ticker: str=commands.parameter(description='- stock ticker'),
+                   shares: int=commands.parameter(description='- number of shares'),
+                   stop_price: float=commands.parameter(description='- price that triggers the order')):
+        await self.place_order(ctx, side, ticker, shares, 'stop', None, stop_price)
+
+    @commands.command(name='stoplimit',
+                      help='- place a limit order once the price crosses a stop! example: $stoplimit sell QBTS 10 3.80 3.70')
+    async def stop_limit(self, ctx,
+                         side: str=commands.parameter(description='- buy or sell'),
+                         ticker: str=commands.parameter(description='- stock ticker'),
+                         shares: int=commands.parameter(description='- number of shares'),
+                         stop_price: float=commands.parameter(description='- price that triggers the order'),
+                         limit_price: float=commands.parameter(description='- highest price to buy at or lowest price to sell at')):
+        await self.place_order(ctx, side, ticker, shares, 'stop_limit', limit_price, stop_price)
+
+    async def place_order(self, ctx, side: str, ticker: str, shares: int, kind: str, limit_price: float, stop_price: float):
+        try:
+            async with USER_LOCKS(ctx.message.author.name):
+                order = await EXECUTOR.run_io('orders', ORDER_MATCHER.place, ctx.message.author.name, side.lower(), ticker, shares, kind, limit_price, stop_price)
+            await ctx.send(f'Order #{order["id"]} placed: {describe_order(order)}. It is checked against every price refresh, see ***$orders***')
+        except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
+    @commands.command(name='orders',
+                      help='- shows your pending orders. example: $orders')
+    async def orders(self, ctx):
+        try:
+            orders = await EXECUTOR.run_io('orders', ORDER_MATCHER.user_orders, ctx.message.author.name)
+            if not orders:
+                await ctx.send('No pending orders!')
+                return
+
+            response = ''.join(f'> #{order["id"]} {describe_order(order)}\n' for order in orders)
+            message = discord.Embed(color=0xa3a3ff,
+                                    title=f":hourglass: {ctx.message.author.name}'s Pending Orders :hourglass:",
+                                    description=response)
+            await ctx.send(embed=message)
+        except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
+    @commands.command(name='cancelorder',
+                      help='- cancels a pending order. example: $cancelorder 12')
+    async def cancel_order(self, ctx,
+                           order_id: int=commands.parameter(description='- order number from $orders')):
+        try:
+            async with USER_LOCKS(ctx.message.author.name):
+                cancelled = await EXECUTOR.run_io('orders', ORDER_MATCHER.cancel, ctx.message.author.name, order_id)
+            await ctx.send(f'Order #{order_id} cancelled' if cancelled else f'You have no pending order #{order_id}')
+        except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
+    # portfolio value over time
+    @commands.command(name='history',
+                      help='- plots the value of a portfolio over time. example: $history billjohn')
+    async def history(self, ctx, *,
+                      username: str=commands.parameter(default=None, description='- discord username (defaults to you)')):
+        try:
+            username = username or ctx.message.author.name
+            if await EXECUTOR.run_io('history', check_user_exists, username):
+                history = await EXECUTOR.run_io('history', get_performance_history, username)
+                png = await EXECUTOR.render_cached('history', history_plot_key(username, history),
+                                                   render_history_plot, username, history, STARTING_FUNDS)
+
+                message = discord.Embed(color=0xa3a3ff,
+                                        title=f":chart_with_upwards_trend: {username}'s Portfolio History :chart_with_upwards_trend:")
+                file = discord.File(io.BytesIO(png), filename="history_plot.png")
+                message.set_image(url=f'attachment://history_plot.png')
+                await ctx.send(file=file, embed=message)
+            else:
+                await ctx.send(f'{username} does not have a profile! Please create one with ***$create*** first.')
+
+        except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
+    # recent trades
+    @commands.command(name='transactions',
+                      help='- shows your most recent trades. example: $transactions QBTS')
+    async def transactions(self, ctx,
+                           ticker: str=commands.parameter(default=None, description='- stock ticker (defaults to every ticker)')):
+        try:
+            ledger = await EXECUTOR.run_io('transactions', get_ledger, ctx.message.author.name, ticker)
+            if len(ledger) == 0:
+                await ctx.send('No transactions found!')
+                return
+
+            response = ''
+            for row in ledger.tail(10).itertuples():
+                response += f"> {row.date.date()} **{row.status}** {row.shares} {row.ticker} at ${round(row.price, 2)}\n"
+
+            message = discord.Embed(color=0xa3a3ff,
+                                    title=f":receipt: {ctx.message.author.name}'s Recent Transactions :receipt:",
+                                    description=response)
+            await ctx.send(embed=message)
+        except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
 
     # leaderboard
     @commands.command(name='rankings',
-                      help='- see how you stack up against the competition! example: $rankings')
-    async def rankings(self, ctx):
+                      help='- see how you stack up against the competition! example: $rankings 2, $rankings me, $rankings billjohn')
+    async def rankings(self, ctx,
+                       view: str=commands.parameter(default='1', description='- page number, me for your rank and neighbors, or a username')):
         try:
-            response = f"Here are the current rankings as of {dt.datetime.now().strftime('%A %b %d %Y, %H:%M:%S')}\n\n"
-            rank = get_leaderboard()
+            snapshot = PRICE_REFRESHER.snapshot
+            if snapshot is None:
+                await ctx.send('Prices are still loading, please try again in a moment')
+                return
 
-            sorted_items = sorted(rank.items(), key=lambda x: x[1], reverse=True)
-            for i, (name, value) in enumerate(sorted_items):
-                response += f"> {i+1}. {name} - ${value} \n"
+            board = await EXECUTOR.run_io('rankings', LEADERBOARDS.board, snapshot)
+            pages = max(1, -(-len(board) // RANKINGS_PAGE_SIZE))
+            if view.isdigit():
+                page = min(max(int(view), 1), pages)
+                entries = board.page(page, RANKINGS_PAGE_SIZE)
+                footer = f'page {page} of {pages}, {len(board)} players. $rankings <page> for more, $rankings me for your rank'
+                highlight = None
+            else:
+                highlight = ctx.message.author.name if view.lower() == 'me' else view
+                entries = board.around(highlight, RANKINGS_NEIGHBORS)
+                if not entries:
+                    await ctx.send(f'{highlight} does not have a profile! Please create one with ***$create*** first.')
+                    return
+                footer = f'{len(board)} players'
+
+            response = f"Here are the current rankings as of {dt.datetime.now().strftime('%A %b %d %Y, %H:%M:%S')} (prices as of {price_age(snapshot)})\n\n"
+            for rank, name, value in entries:
+                entry = f"{rank}. {name} - ${value:.2f}"
+                response += f"> **{entry}**\n" if name == highlight else f"> {entry}\n"
 
             message = discord.Embed(color=0xa3a3ff,
                                         title=":sparkles: Portfolio Value Leaderboard :sparkles:",
                                         description=response)
+            estimated = board.estimated()
+            if estimated:
+                footer += f". No price yet for {', '.join(estimated)}, valued at the average price paid"
+            message.set_footer(text=footer)
             
             await ctx.send(embed=message)
         except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
+    # daily leaderboard
+    @commands.command(name='daily',
+                      help="- rankings by the last trading day's performance and its biggest movers. example: $daily")
+    async def daily(self, ctx):
+        try:
+            daily = await EXECUTOR.run_io('daily', day_performance)
+            if daily is None:
+                await ctx.send('Not enough trading days recorded yet, check back after the next close!')
+                return
+
+            # portfolios without a percent change (previous value of 0) go last
+            performance = sorted(daily['performance'].items(), key=lambda x: (x[1]['percent_change'] is not None, x[1]['percent_change'] or 0), reverse=True)
+            response = f"Here is how everyone did on {daily['date']}\n\n"
+            for i, (name, day) in enumerate(performance):
+                percent = 'n/a' if day['percent_change'] is None else f"{day['percent_change']:+}%"
+                response += f"> {i+1}. {name} - {percent} (${day['change']:+,.2f}) \n"
+
+            # movers by dollar amount, the percent ranking favours small portfolios
+            gainer = max(performance, key=lambda x: x[1]['change'])
+            loser = min(performance, key=lambda x: x[1]['change'])
+            response += f"\n:rocket: Biggest gain: **{gainer[0]}** ${gainer[1]['change']:+,.2f}"
+            response += f"\n:small_red_triangle_down: Biggest loss: **{loser[0]}** ${loser[1]['change']:+,.2f}"
+
+            message = discord.Embed(color=0xa3a3ff,
+                                    title=":calendar: Daily Leaderboard :calendar:",
+                                    description=response)
+            await ctx.send(embed=message)
+        except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
 
+
+def describe_order(order: dict) -> str:
+    """Describes a pending order, e.g. 'sell 10 QBTS, stop $3.8 limit $3.7'"""
+    prices = []
+    if order['stop_price'] is not None:
+        prices.append(f"stop ${order['stop_price']}{' (reached)' if order['triggered'] else ''}")
+    if order['limit_price'] is not None:
+        prices.append(f"limit ${order['limit_price']}")
+    return f"{order['side']} {order['shares']} {order['ticker']}, {' '.join(prices)}"
+
+
+def price_age(snapshot) -> str:
+    """Describes when the prices of a snapshot were downloaded, e.g. 14:02:10 (45s ago)"""
+    age = int(snapshot.age())
+    if age < 120:
+        ago = f'{age}s ago'
+    elif age < 2*3600:
+        ago = f'{age//60}m ago'
+    else:
+        ago = f'{age//3600}h ago'
+    return f"{snapshot.timestamp.strftime('%H:%M:%S')} ET ({ago})"
+
+
 async def setup(bot):
     await bot.add_cog(PortfolioGame(bot))
\ No newline at end of file
@@ -1,11 +1,18 @@
+import io
+import asyncio
 from datetime import date
 import discord
+import numpy as np
 from discord.ext import commands
 
-from functions.stock_info import (plot_ticker, get_info, stock_worth, get_news, get_price)
+from functions.stock_info import (get_history, get_info, stock_worth, get_news, get_price, price_plot_key, growth_plot_key)
+from functions.backtest import (parse_portfolio, strategy_months, load_backtest_prices, sweep, start_date_runs, ticker_runs,
+                                backtest as run_backtest)
+from functions.plotting import render_price_plot, render_growth_plot, render_backtest_plot, last_point
+from functions.executor import EXECUTOR
 
 #constants
-from functions.constants import PRICE_PLOT_PATH, GROWTH_PLOT_PATH, VALID_PERIODS
+from functions.constants import VALID_PERIODS, REFERENCE_INDICES, DEFAULT_INDEX, BACKTEST_STRATEGIES, BACKTEST_FREQUENCIES
 
 class StockData(commands.Cog):
     def __init__(self, bot) -> None:
@@ -18,10 +25,12 @@ class StockData(commands.Cog):
                     ticker: str=commands.parameter(description='- Stock ticker'), 
                     period: str=commands.parameter(description=f'- Time period {VALID_PERIODS}')):
         try:
-            plot_ticker(ticker, period)
-            await ctx.send(file=discord.File(PRICE_PLOT_PATH))
+            history = await EXECUTOR.run_io_shared('stonk', ('history', ticker.upper(), period), get_history, ticker, period)
+            png = await EXECUTOR.render_cached('stonk', price_plot_key(ticker, period, history), render_price_plot, ticker.upper(), history)
+            await ctx.send(file=discord.File(io.BytesIO(png), filename='price_plot.png'))
 
         except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
 
     @commands.command(name='price',
@@ -29,9 +38,11 @@ class StockData(commands.Cog):
     async def price(self, ctx,
                     ticker: str=commands.parameter(description='- Stock ticker')):
         try:
-            await ctx.send(f'Current price of **{ticker}: ${round(get_price(ticker), 2)}**')
+            price = await EXECUTOR.run_io_shared('price', ('price', ticker.upper()), get_price, ticker)
+            await ctx.send(f'Current price of **{ticker}: ${round(price, 2)}**')
 
         except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
 
     @commands.command(name='stonknews',
@@ -39,11 +50,12 @@ class StockData(commands.Cog):
     async def news(self, ctx, 
                    ticker: str=commands.parameter(description='- Stock ticker')):
         try:
-            news = get_news(ticker)
+            news = await EXECUTOR.run_io_shared('stonknews', ('news', ticker.upper()), get_news, ticker)
             await ctx.send(f'> **{ticker} in the news:** {news[1]}\n'
                         f'> {news[0]}')
             
         except Exception as e:
+            ctx.command_failed = True
             print(e)
             await ctx.send('No news available for ticker')
 
@@ -68,28 +80,88 @@ class StockData(commands.Cog):
     #         await ctx.send('Summary not available')
 
     @commands.command(name='stonkworth',
-                      help='- What an investment in the past would be worth today... example: $stonkworth QBTS 1000 2020-01-01')
+                      help='- What an investment in the past would be worth today... example: $stonkworth QBTS 1000 2020-01-01 nasdaq')
     async def worth(self, ctx,
                     ticker: str=commands.parameter(description="- stock ticker"),
                     amount: int=commands.parameter(description="- amount of initial investment"),
-                    start_date: str=commands.parameter(description="- initial investment date (YYYY-MM-DD)")):
+                    start_date: str=commands.parameter(description="- initial investment date (YYYY-MM-DD)"),
+                    index: str=commands.parameter(default=DEFAULT_INDEX, description=f"- index to compare against {list(REFERENCE_INDICES)}")):
         try:
             y,m,d = [int(x) for x in start_date.split('-')]
             start_date = date(y,m,d)
-            summary = stock_worth(ticker, amount, start_date)
+            summary = await EXECUTOR.run_io('stonkworth', stock_worth, ticker, amount, start_date, index)
+            png = await EXECUTOR.render_cached('stonkworth', growth_plot_key(ticker, start_date, summary),
+                                               render_growth_plot, summary['plot_title'], summary['growth'])
 
             await ctx.send(f"""> If you invested ${amount} in {ticker} stock on {start_date}...
             > Today, this investment would be worth: **${round(summary['current_value'], 2)}**
             > Average annual returns: {round(summary['annual_returns'], 2)}%
             > Total percent increase in price: {round(summary['percent_increase'], 2)}%
             > Total profit: ${round(summary['total_profit'], 2)}
-            > During the same time period, the **S&P500 index** grew {round(summary['snp_percent_increase'], 2)}%. With annual returns of {round(summary['snp_annual_returns'], 2)}%
-            > Meaning the same investment would be worth ${round(summary['snp_current_value'], 2)}
+            > During the same time period, the **{summary['index_name']} index** grew {round(summary['index_percent_increase'], 2)}%. With annual returns of {round(summary['index_annual_returns'], 2)}%
+            > Meaning the same investment would be worth ${round(summary['index_current_value'], 2)}
             > {summary['recommendation']}""")
 
-            await ctx.send(file=discord.File(GROWTH_PLOT_PATH))
+            await ctx.send(file=discord.File(io.BytesIO(png), filename='growth_plot.png'))
 
         except Exception as e:
+            ctx.command_failed = True
+            await ctx.send(e)
+
+
+    @commands.command(name='backtest',
+                      help='- Backtest a portfolio against an index... example: $backtest AAPL:60,MSFT:40 10000 2005-01-01 rebalance quarterly')
+    async def backtest(self, ctx,
+                       portfolio: str=commands.parameter(description="- comma separated tickers, optionally with weights (AAPL:60,MSFT:40)"),
+                       amount: int=commands.parameter(description="- total amount invested"),
+                       start_date: str=commands.parameter(description="- first investment date (YYYY-MM-DD)"),
+                       strategy: str=commands.parameter(default='lump', description=f"- {BACKTEST_STRATEGIES}"),
+                       frequency: str=commands.parameter(default='monthly', description=f"- how often dca invests or rebalance resets the weights {list(BACKTEST_FREQUENCIES)}"),
+                       index: str=commands.parameter(default=DEFAULT_INDEX, description=f"- index to compare against {list(REFERENCE_INDICES)}")):
+        try:
+            y,m,d = [int(x) for x in start_date.split('-')]
+            start_date = date(y,m,d)
+            tickers, weights = parse_portfolio(portfolio)
+            strategy, frequency = strategy.lower(), frequency.lower()
+            strategy_months(strategy, frequency)
+
+            # the download runs on the thread pool, the simulation on the process pool
+            loaded = await EXECUTOR.run_io('backtest', load_backtest_prices, tickers, start_date, index)
+            dates, prices = loaded['dates'], loaded['prices']
+            result = await EXECUTOR.run_cpu('backtest', run_backtest, tickers, weights, amount, dates, prices, loaded['index_name'], strategy, frequency)
+            key = ('backtest', tuple(tickers), tuple(weights.round(6)), amount, str(start_date), strategy, frequency, result['index_name']) + last_point(result['values'].Portfolio)
+
+            # the same portfolio started at the beginning of every period since start_date, and every ticker held on its own,
+            # in one sweep spread over the process pool next to the plot
+            columns = list(range(len(tickers)))
+            starts = start_date_runs(dates, columns, weights, amount, strategy, result['months'])
+            singles = ticker_runs(tickers, amount, strategy, result['months']) if len(tickers) > 1 else []
+            runs, png = await asyncio.gather(sweep(dates, prices, starts + singles),
+                                             EXECUTOR.render_cached('backtest', key, render_backtest_plot, result['plot_title'], result['values']))
+            rolling, alone = runs[:len(starts)], runs[len(starts):]
+
+            summary, reference = result['portfolio'], result['index']
+            allocation = ', '.join(f'{ticker} {round(100*weight, 1)}%' for ticker, weight in zip(tickers, weights))
+            response = f"""> Investing ${amount} in {allocation} from {start_date} ({strategy}{'' if strategy == 'lump' else f', {frequency}'})...
+            > Today, this portfolio would be worth: **${round(summary['final_value'], 2)}** (${round(summary['invested'], 2)} invested)
+            > Annual returns: {round(summary['annual_return'], 2)}%, volatility: {round(summary['volatility'], 2)}%, sharpe: {round(summary['sharpe'], 2)}
+            > Worst drop from a high: {round(summary['max_drawdown'], 2)}%
+            > The same strategy in the **{result['index_name']} index** would be worth ${round(reference['final_value'], 2)}, with annual returns of {round(reference['annual_return'], 2)}%"""
+
+            if rolling:
+                annual = np.array([run['annual_return'] for run in rolling])
+                response += f"""
+            > Starting any {frequency[:-2]} since then, annual returns ranged from {round(annual.min(), 2)}% to {round(annual.max(), 2)}% (median {round(float(np.median(annual)), 2)}%, {len(annual)} start dates)"""
+
+            if alone:
+                response += f"""
+            > On their own: {', '.join(f"{ticker} {round(run['annual_return'], 2)}%" for ticker, run in zip(tickers, alone))} annual returns"""
+
+            await ctx.send(response)
+            await ctx.send(file=discord.File(io.BytesIO(png), filename='backtest_plot.png'))
+
+        except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
 
 
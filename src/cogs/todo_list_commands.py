@@ -1,6 +1,7 @@
 from datetime import date
 from discord.ext import commands
 
+from functions.prompts import wait_for_reply
 from functions.todo_list import get_list, add_item, mark_complete
 
 class ToDoList(commands.Cog):
@@ -23,6 +24,7 @@ class ToDoList(commands.Cog):
             await ctx.send(get_list(user))
 
         except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
         
     @commands.command(name='complete',
@@ -32,15 +34,14 @@ class ToDoList(commands.Cog):
             data = get_list(ctx.message.author.name)
             await ctx.send(data + 'Which item have you completed? (enter index)')
 
-            response = await self.bot.wait_for('message',
-                                               check=lambda message:message.author == ctx.author and message.channel.id == ctx.channel.id,
-                                               timeout=20.0)
+            response = await wait_for_reply(self.bot, ctx)
             
             mark_complete(ctx.message.author.name, int(response.content)-1)
             
             await ctx.send('nice')
 
         except Exception as e:
+            ctx.command_failed = True
             await ctx.send(e)
     
     
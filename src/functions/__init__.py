@@ -1,4 +1,13 @@
-from . import constants
-from . import portfolio_game
-from . import stock_info
-from . import todo_list
\ No newline at end of file
+import importlib
+
+# submodules are imported when first used (functions.stock_info, from functions import storage...),
+# so importing one of them does not pull in every heavy dependency of the others
+__all__ = ['analytics', 'backtest', 'constants', 'executor', 'guilds', 'history_store', 'index_store', 'lazy', 'leaderboard', 'ledger', 'market_hours', 'metrics',
+           'nav', 'order_book', 'quote_cache', 'performance', 'plotting', 'portfolio_game', 'price_refresher', 'render_cache',
+           'single_flight', 'startup', 'stock_info', 'storage', 'ticker_store', 'todo_list', 'user_locks']
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
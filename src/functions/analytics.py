@@ -0,0 +1,64 @@
+import numpy as np
+
+TRADING_DAYS = 252
+
+
+def daily_returns(close: np.ndarray) -> np.ndarray:
+    """Computes the daily returns of one or many price series.
+        The first day has a return of 0
+
+        Args:
+            close (np.ndarray): closing prices, 1d for a single series or 2d with one column per series
+
+        Return:
+            np.ndarray: daily returns with the same shape as close
+    """
+    close = np.asarray(close, dtype=float)
+    returns = np.zeros_like(close)
+    returns[1:] = close[1:] / close[:-1] - 1
+    return returns
+
+
+def cumulative_growth(close: np.ndarray) -> np.ndarray:
+    """Computes the percent increase of one or many price series relative to their first price
+
+        Args:
+            close (np.ndarray): closing prices, 1d for a single series or 2d with one column per series
+
+        Return:
+            np.ndarray: percent increase with the same shape as close
+    """
+    close = np.asarray(close, dtype=float)
+    return 100 * (close / close[0] - 1)
+
+
+def annualized_return(returns: np.ndarray):
+    """Compounds the average daily return over a year of trading days
+
+        Args:
+            returns (np.ndarray): daily returns, 1d for a single series or 2d with one column per series
+
+        Return:
+            float or np.ndarray: annual return in percent, one value per series
+    """
+    return 100 * ((1 + np.mean(returns, axis=0))**TRADING_DAYS - 1)
+
+
+def summarize_growth(close: np.ndarray) -> dict:
+    """Computes returns, growth and annual return of one or many price series in one pass
+
+        Args:
+            close (np.ndarray): closing prices, 1d for a single series or 2d with one column per series
+
+        Return:
+            dict: returns, percent_increase (series), annual_returns and total_increase (per series)
+    """
+    returns = daily_returns(close)
+    growth = cumulative_growth(close)
+
+    return {
+        'returns': returns,
+        'percent_increase': growth,
+        'annual_returns': annualized_return(returns),
+        'total_increase': growth[-1]
+    }
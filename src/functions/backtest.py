@@ -0,0 +1,287 @@
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from functions.analytics import TRADING_DAYS
+from functions.executor import EXECUTOR
+from functions.history_store import HISTORY_STORE
+from functions.index_store import INDEX_STORE
+
+# constants
+from functions.constants import (DEFAULT_INDEX, IO_WORKERS, CPU_WORKERS,
+                                 BACKTEST_STRATEGIES, BACKTEST_FREQUENCIES, BACKTEST_MAX_TICKERS)
+
+
+def parse_portfolio(portfolio: str) -> tuple:
+    """Parses a portfolio of tickers and weights, e.g. 'AAPL:60,MSFT:40' or 'AAPL,MSFT' for equal weights
+
+        Args:
+            portfolio (str): comma separated tickers, each optionally followed by :weight
+
+        Return:
+            tuple: list of tickers and np.ndarray of weights summing to 1
+    """
+    tickers, weights = [], []
+    for entry in portfolio.split(','):
+        if not entry.strip():
+            continue
+        ticker, _, weight = entry.strip().partition(':')
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            raise Exception(f'Could not read the weight of {ticker}, write the portfolio as e.g. AAPL:60,MSFT:40')
+        if not math.isfinite(weight) or weight <= 0:
+            raise Exception(f'The weight of {ticker} must be a positive number')
+        tickers.append(ticker.upper())
+        weights.append(weight)
+
+    if not tickers:
+        raise Exception('The portfolio is empty')
+    if len(set(tickers)) != len(tickers):
+        raise Exception('Every ticker can only be in the portfolio once')
+    if len(tickers) > BACKTEST_MAX_TICKERS:
+        raise Exception(f'Portfolios can have at most {BACKTEST_MAX_TICKERS} tickers')
+
+    weights = np.array(weights, dtype=float)
+    return tickers, weights / weights.sum()
+
+
+def load_prices(tickers: list, start_date: date = None) -> tuple:
+    """Loads the closes of several tickers as one matrix, aligned on the trading days they all have.
+        Closes from the history store are yahoo's adjusted closes, re-downloaded whenever a dividend or split changes them,
+        so growth approximates reinvesting dividends (the reference indices are price indices without dividends)
+
+        Args:
+            tickers (list): list of tickers
+            start_date (date): first date to include, None for the full history
+
+        Return:
+            tuple: np.ndarray of dates (datetime64[D]) and np.ndarray of closes with one column per ticker
+    """
+    with ThreadPoolExecutor(max_workers=min(IO_WORKERS, len(tickers)), thread_name_prefix='bot-backtest') as pool:
+        histories = list(pool.map(lambda ticker: HISTORY_STORE.get(ticker, start_date).Close, tickers))
+
+    # a day missing from one ticker (e.g. a different exchange holiday) carries its last close forward
+    closes = pd.concat(histories, axis=1, keys=range(len(tickers))).sort_index().ffill().dropna()
+    if len(closes) < 2:
+        raise Exception(f'Not enough shared history for {", ".join(tickers)} after {start_date}')
+    return closes.index.to_numpy().astype('datetime64[D]'), closes.to_numpy(dtype=float)
+
+
+def period_starts(dates: np.ndarray, months: int) -> np.ndarray:
+    """Finds the first trading day of every period of a number of months
+
+        Args:
+            dates (np.ndarray): trading days (datetime64[D])
+            months (int): length of a period
+
+        Return:
+            np.ndarray: row of the first trading day of each period
+    """
+    month = dates.astype('datetime64[M]').astype(np.int64)
+    period = (month - month[0]) // months
+    return np.flatnonzero(np.diff(period, prepend=-1))
+
+
+def simulate(dates: np.ndarray, prices: np.ndarray, weights: np.ndarray, amount: float, strategy: str, months: int) -> tuple:
+    """Simulates a strategy over a price matrix without any python loop over days
+
+        lump: the amount is split by weight on the first day and held
+        dca: the amount is split into equal contributions invested by weight at the start of every period
+        rebalance: like lump, but the holdings are reset to the weights at the start of every period
+
+        Args:
+            dates (np.ndarray): trading days (datetime64[D])
+            prices (np.ndarray): closes with one column per ticker
+            weights (np.ndarray): weight of every ticker, summing to 1
+            amount (float): total amount invested
+            strategy (str): one of BACKTEST_STRATEGIES
+            months (int): length of a period for dca and rebalance
+
+        Return:
+            tuple: np.ndarray of portfolio values and np.ndarray of the amount invested so far, one per day
+    """
+    if strategy == 'dca':
+        starts = period_starts(dates, months)
+        contribution = amount / len(starts)
+        bought = np.zeros_like(prices)
+        bought[starts] = contribution * weights / prices[starts]
+        values = np.einsum('ij,ij->i', prices, np.cumsum(bought, axis=0))
+
+        invested = np.zeros(len(dates))
+        invested[starts] = contribution
+        return values, np.cumsum(invested)
+
+    # between two rebalances the holdings are fixed, so a day's value is the value at the last rebalance
+    # times the weighted growth of every ticker since then
+    starts = period_starts(dates, months) if strategy == 'rebalance' else np.array([0])
+    segment = np.searchsorted(starts, np.arange(len(dates)), side='right') - 1
+    growth = (prices / prices[starts][segment]) @ weights
+    start_values = amount * np.concatenate([[1.0], np.cumprod((prices[starts[1:]] / prices[starts[:-1]]) @ weights)])
+    return start_values[segment] * growth, np.full(len(dates), float(amount))
+
+
+def measure(dates: np.ndarray, values: np.ndarray, invested: np.ndarray) -> dict:
+    """Computes the performance of a simulated portfolio.
+        Daily returns leave out new contributions, so dca is measured on its investments and not its deposits
+
+        Args:
+            dates (np.ndarray): trading days (datetime64[D])
+            values (np.ndarray): portfolio value of every day
+            invested (np.ndarray): amount invested so far on every day
+
+        Return:
+            dict: final_value, invested, profit, total_return, annual_return, volatility and max_drawdown
+                in percent, and sharpe (risk free rate of 0)
+    """
+    contributions = np.diff(invested, prepend=0)
+    returns = np.zeros_like(values)
+    returns[1:] = (values[1:] - contributions[1:]) / values[:-1] - 1
+
+    wealth = np.cumprod(1 + returns)
+    years = (dates[-1] - dates[0]).astype(np.int64) / 365.25
+    deviation = returns[1:].std()
+
+    return {
+        'final_value': float(values[-1]),
+        'invested': float(invested[-1]),
+        'profit': float(values[-1] - invested[-1]),
+        'total_return': float(100 * (values[-1] / invested[-1] - 1)),
+        'annual_return': float(100 * (wealth[-1]**(1 / years) - 1)) if years > 0 else 0.0,
+        'volatility': float(100 * deviation * np.sqrt(TRADING_DAYS)),
+        'max_drawdown': float(100 * (wealth / np.maximum.accumulate(wealth) - 1).min()),
+        'sharpe': float(returns[1:].mean() / deviation * np.sqrt(TRADING_DAYS)) if deviation > 0 else 0.0
+    }
+
+
+def run_backtests(dates: np.ndarray, prices: np.ndarray, runs: list) -> list:
+    """Runs many backtests over one price matrix, run on the process pool by sweep
+
+        Args:
+            dates (np.ndarray): trading days (datetime64[D])
+            prices (np.ndarray): closes with one column per ticker
+            runs (list): list of (columns, weights, first_row, amount, strategy, months) tuples
+
+        Return:
+            list: results of measure, one per run
+    """
+    results = []
+    for columns, weights, first, amount, strategy, months in runs:
+        window = prices[first:, columns]
+        values, invested = simulate(dates[first:], window, weights, amount, strategy, months)
+        results.append(measure(dates[first:], values, invested))
+    return results
+
+
+async def sweep(dates: np.ndarray, prices: np.ndarray, runs: list, command: str = 'backtest', workers: int = CPU_WORKERS) -> list:
+    """Fans a parameter sweep out across the process pool, every worker gets the price matrix once and a share of the runs
+
+        Args:
+            dates (np.ndarray): trading days (datetime64[D])
+            prices (np.ndarray): closes with one column per ticker
+            runs (list): list of (columns, weights, first_row, amount, strategy, months) tuples
+            command (str): name of the command the work belongs to
+            workers (int): number of chunks
+
+        Return:
+            list: results of measure, in the order of runs
+    """
+    chunks = [runs[i::workers] for i in range(workers) if runs[i::workers]]
+    results = await asyncio.gather(*[EXECUTOR.run_cpu(command, run_backtests, dates, prices, chunk) for chunk in chunks])
+
+    # chunks were dealt round robin, put the results back in order
+    ordered = [None] * len(runs)
+    for i, chunk in enumerate(results):
+        ordered[i::len(chunks)] = chunk
+    return ordered
+
+
+def start_date_runs(dates: np.ndarray, columns: list, weights: np.ndarray, amount: float, strategy: str, months: int) -> list:
+    """Builds a sweep of the same portfolio started at the beginning of every period that leaves at least a year of history
+
+        Return:
+            list: list of (columns, weights, first_row, amount, strategy, months) tuples
+    """
+    starts = period_starts(dates, months)
+    return [(columns, weights, int(first), amount, strategy, months) for first in starts if len(dates) - first > TRADING_DAYS]
+
+
+def ticker_runs(tickers: list, amount: float, strategy: str, months: int) -> list:
+    """Builds a sweep of every ticker held on its own
+
+        Return:
+            list: list of (columns, weights, first_row, amount, strategy, months) tuples
+    """
+    return [([i], np.ones(1), 0, amount, strategy, months) for i in range(len(tickers))]
+
+
+def strategy_months(strategy: str, frequency: str) -> int:
+    """Checks a strategy and frequency, so a bad one fails before any download
+
+        Args:
+            strategy (str): one of BACKTEST_STRATEGIES
+            frequency (str): one of BACKTEST_FREQUENCIES
+
+        Return:
+            int: months between two investments or rebalances
+    """
+    if strategy not in BACKTEST_STRATEGIES:
+        raise Exception(f'Strategy must be one of {", ".join(BACKTEST_STRATEGIES)}')
+    if frequency not in BACKTEST_FREQUENCIES:
+        raise Exception(f'Frequency must be one of {", ".join(BACKTEST_FREQUENCIES)}')
+    return BACKTEST_FREQUENCIES[frequency]
+
+
+def load_backtest_prices(tickers: list, start_date: date, index: str = DEFAULT_INDEX) -> dict:
+    """Loads the closes of a portfolio and of a market index, run on the thread pool before backtest
+
+        Args:
+            tickers (list): list of tickers
+            start_date (date): date of the first investment
+            index (str): index to compare against, one of REFERENCE_INDICES
+
+        Return:
+            dict: dates, prices (the index is the last column) and index_name
+    """
+    reference = INDEX_STORE.get(index)
+    dates, prices = load_prices(tickers + [reference.ticker], start_date)
+    return {'dates': dates, 'prices': prices, 'index_name': reference.label}
+
+
+def backtest(tickers: list, weights: np.ndarray, amount: float, dates: np.ndarray, prices: np.ndarray, index_name: str,
+             strategy: str = 'lump', frequency: str = 'monthly') -> dict:
+    """Backtests a portfolio against the same strategy in a market index.
+        Only numpy work, run on the process pool with the prices from load_backtest_prices
+
+        Args:
+            tickers (list): list of tickers
+            weights (np.ndarray): weight of every ticker, summing to 1
+            amount (float): total amount invested
+            dates (np.ndarray): trading days (datetime64[D])
+            prices (np.ndarray): closes with one column per ticker and the index last
+            index_name (str): label of the index
+            strategy (str): one of BACKTEST_STRATEGIES
+            frequency (str): one of BACKTEST_FREQUENCIES, how often dca invests or the portfolio is rebalanced
+
+        Return:
+            dict: portfolio and index results of measure, months for sweeps,
+                values of both over time for render_backtest_plot and the plot title
+    """
+    months = strategy_months(strategy, frequency)
+
+    values, invested = simulate(dates, prices[:, :-1], weights, amount, strategy, months)
+    index_values, _ = simulate(dates, prices[:, -1:], np.ones(1), amount, strategy, months)
+
+    return {
+        'portfolio': measure(dates, values, invested),
+        'index': measure(dates, index_values, invested),
+        'index_name': index_name,
+        'months': months,
+        'values': pd.DataFrame({'Portfolio': values, index_name: index_values, 'Invested': invested},
+                               index=pd.DatetimeIndex(dates, name='Date')),
+        'plot_title': f'{strategy} {", ".join(tickers)} from {pd.Timestamp(dates[0]).date()}'
+    }
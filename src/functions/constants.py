@@ -1,16 +1,88 @@
 # used for stock data
-PRICE_PLOT_PATH = 'C:/Users/Yang/Documents/Projects/discord bot/figures/price_plot.jpg'
-GROWTH_PLOT_PATH = 'C:/Users/Yang/Documents/Projects/discord bot/figures/growth_plot.jpg'
 VALID_PERIODS = ['1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max']
 INCLUDE_FIELDS = ['longName', 'financialCurrency', 'lastPrice', 'dayHigh', 'dayLow', 'fiftyDayAverage', 'marketCap', 'yearHigh', 'yearLow', 'yearChange']
 
+# used in history store (ttl in seconds), a stored close that moved by more than the tolerance means yahoo re-adjusted the history
+HISTORY_STORE_PATH = 'C:/Users/Yang/Documents/Projects/discord bot/market_data/history'
+HISTORY_TTL_MARKET_OPEN = 15*60
+ADJUSTMENT_TOLERANCE = 1e-6
+
+# used in ticker store (ttl in seconds), invalid symbols are remembered for a shorter time
+TICKER_STORE_PATH = 'C:/Users/Yang/Documents/Projects/discord bot/market_data/tickers.db'
+TICKER_TTL = 30*24*60*60
+TICKER_INVALID_TTL = 24*60*60
+
+# used in index store, name: (ticker, label) of the indices stonkworth compares against
+REFERENCE_INDICES = {
+    'sp500': ('^GSPC', 'S&P 500'),
+    'nasdaq': ('^IXIC', 'Nasdaq Composite'),
+    'total': ('^W5000', 'Wilshire 5000 Total Market')
+}
+DEFAULT_INDEX = 'sp500'
+
+# used in backtests (strategies, and how many months apart dca invests or a portfolio is rebalanced)
+BACKTEST_STRATEGIES = ['lump', 'dca', 'rebalance']
+BACKTEST_FREQUENCIES = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+BACKTEST_MAX_TICKERS = 20
+
+# used in plot cache (number of images)
+PLOT_CACHE_SIZE = 64
+
+# used in quote cache (ttl in seconds)
+QUOTE_CACHE_SIZE = 512
+QUOTE_TTL_MARKET_OPEN = 30
+QUOTE_TTL_MARKET_CLOSED = 30*60
+
+# used in price refresher (intervals in seconds)
+REFRESH_INTERVAL_MARKET_OPEN = 60
+REFRESH_INTERVAL_MARKET_CLOSED = 30*60
+
+# used in command prompts (seconds to wait for the user's answer)
+PROMPT_TIMEOUT = 20.0
+
+# used in command executor (timeout in seconds)
+IO_WORKERS = 8
+CPU_WORKERS = 2
+COMMAND_TIMEOUT = 30
+DEFAULT_COMMAND_CONCURRENCY = 4
+COMMAND_CONCURRENCY = {
+    'stonk': 2,
+    'stonkworth': 2,
+    'summary': 2,
+    'rankings': 1,
+    'history': 2,
+    'backtest': 2,
+    'refresh': 1
+}
+
+# used in metrics (bucket bounds in seconds, port None to disable the http endpoint)
+METRICS_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+METRICS_PATH = 'C:/Users/Yang/Documents/Projects/discord bot/metrics.prom'
+METRICS_INTERVAL = 60
+METRICS_PORT = None
+
+# used in guild partitions, the guild whose data stays in the default files (DATABASE_PATH, TODO_LIST_PATH)
+# set it to the id of the server the bot ran in before data was split per guild, other guilds get their own files
+LEGACY_GUILD_ID = None
+
 # used in portfolio game
+DATABASE_PATH = 'C:/Users/Yang/Documents/Projects/discord bot/user_data/portfolios.db'
+# old pysondb files, only read when migrating to DATABASE_PATH
 PORTFOLIO_DATA_PATH = 'C:/Users/Yang/Documents/Projects/discord bot/user_data/portfolios.json'
 TRANSACTIONS_PATH = 'C:/Users/Yang/Documents/Projects/discord bot/user_data/transactions.json'
 STARTING_FUNDS = 10000
+BENCHMARK_TICKER = '^GSPC'
+# end of day portfolio values are recorded this long after the close (seconds)
+NAV_RECORD_DELAY = 15*60
+
+# used in $rankings (entries per page, neighbors shown above and below a user)
+RANKINGS_PAGE_SIZE = 10
+RANKINGS_NEIGHBORS = 3
 
-#used in portfolio game commands
-STOCK_TABLE_PATH = 'C:/Users/Yang/Documents/Projects/discord bot/figures/stock_table.jpg'
+# used in order book
+ORDER_KINDS = ['limit', 'stop', 'stop_limit']
 
 # used in todo list
-TODO_LIST_PATH = "C:/Users/Yang/Documents/Projects/discord bot/user_data/todo.json"
\ No newline at end of file
+TODO_LIST_PATH = "C:/Users/Yang/Documents/Projects/discord bot/user_data/todo.json"
+# operations appended to the log before it is compacted into TODO_LIST_PATH
+TODO_COMPACT_OPS = 1000
\ No newline at end of file
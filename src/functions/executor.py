@@ -0,0 +1,176 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from functions.metrics import METRICS
+from functions.render_cache import PLOT_CACHE
+
+# constants
+from functions.constants import (IO_WORKERS, CPU_WORKERS, COMMAND_TIMEOUT,
+                                 COMMAND_CONCURRENCY, DEFAULT_COMMAND_CONCURRENCY)
+
+
+class CommandExecutor:
+    """Runs blocking work for bot commands away from the event loop.
+        Network bound work goes to a thread pool and cpu bound rendering to a process pool.
+        Each command is limited in how many calls can run at once and how long they can take
+    """
+    def __init__(self, io_workers: int = IO_WORKERS, cpu_workers: int = CPU_WORKERS,
+                 timeout: float = COMMAND_TIMEOUT) -> None:
+        self.timeout = timeout
+        self._workers = {'io': io_workers, 'cpu': cpu_workers}
+        self._pools = {}
+        self._semaphores = {}
+        self._waiting = {}
+        self._in_flight = {'io': 0, 'cpu': 0}
+        self._shared = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, kind: str):
+        # pools are created on first use so importing this module stays cheap
+        if kind not in self._pools:
+            if kind == 'io':
+                self._pools[kind] = ThreadPoolExecutor(max_workers=self._workers[kind], thread_name_prefix='bot-io')
+            else:
+                self._pools[kind] = ProcessPoolExecutor(max_workers=self._workers[kind])
+        return self._pools[kind]
+
+    def _semaphore(self, command: str) -> asyncio.Semaphore:
+        if command not in self._semaphores:
+            self._semaphores[command] = asyncio.Semaphore(COMMAND_CONCURRENCY.get(command, DEFAULT_COMMAND_CONCURRENCY))
+            self._waiting[command] = 0
+        return self._semaphores[command]
+
+    def _done(self, kind: str, loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore, future) -> None:
+        with self._lock:
+            self._in_flight[kind] -= 1
+        # runs on the worker, the semaphore belongs to the event loop
+        try:
+            loop.call_soon_threadsafe(semaphore.release)
+        except RuntimeError:
+            # the loop was closed while the work was running
+            pass
+
+    async def _run(self, kind: str, command: str, func, *args, **kwargs):
+        semaphore = self._semaphore(command)
+
+        self._waiting[command] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[command] -= 1
+
+        try:
+            call = functools.partial(func, *args, **kwargs)
+            if kind == 'io':
+                # threads see the context of the command (e.g. its guild), processes only get the arguments
+                call = functools.partial(contextvars.copy_context().run, call)
+            future = self._pool(kind).submit(call)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        # the slot is only released once the work is done, a caller that timed out does not free it for more work
+        with self._lock:
+            self._in_flight[kind] += 1
+        future.add_done_callback(functools.partial(self._done, kind, asyncio.get_running_loop(), semaphore))
+
+        # includes time spent queued behind other work in the pool
+        with METRICS.timed(f'executor.{kind}', command):
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                raise Exception(f'${command} took too long to respond, please try again later')
+
+    async def run_io(self, command: str, func, *args, **kwargs):
+        """Runs network or disk bound work on the thread pool
+
+            Args:
+                command (str): name of the command the work belongs to
+                func (callable): blocking function to run
+                *args, **kwargs: arguments passed to func
+
+            Return:
+                the result of func
+        """
+        return await self._run('io', command, func, *args, **kwargs)
+
+    async def run_io_shared(self, command: str, key: tuple, func, *args):
+        """Runs network bound work on the thread pool, joining an identical call that is already running.
+            Waiters share the result or the exception of the running call and do not take a slot of the command
+
+            Args:
+                command (str): name of the command the work belongs to
+                key (tuple): identifies the call, e.g. ('price', 'AAPL')
+                func (callable): blocking function to run
+                *args: arguments passed to func
+
+            Return:
+                the result of func, shared by every caller so it should not be modified
+        """
+        task = self._shared.get(key)
+        if task is None:
+            task = self._shared[key] = asyncio.ensure_future(self.run_io(command, func, *args))
+            task.add_done_callback(lambda _: self._shared.pop(key, None))
+        # shielded so one caller being cancelled does not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    async def run_cpu(self, command: str, func, *args, **kwargs):
+        """Runs cpu bound work on the process pool.
+            func and its arguments must be picklable (module level functions)
+
+            Args:
+                command (str): name of the command the work belongs to
+                func (callable): blocking function to run
+                *args, **kwargs: arguments passed to func
+
+            Return:
+                the result of func
+        """
+        return await self._run('cpu', command, func, *args, **kwargs)
+
+    async def render_cached(self, command: str, key: tuple, func, *args) -> bytes:
+        """Gets an image from PLOT_CACHE, rendering it on the process pool if it is not cached
+
+            Args:
+                command (str): name of the command the work belongs to
+                key (tuple): cache key of the image
+                func (callable): module level function returning png bytes
+                *args: arguments passed to func
+
+            Return:
+                bytes: png image
+        """
+        png = PLOT_CACHE.get(key)
+        if png is None:
+            with METRICS.timed('render', func.__name__):
+                png = await self.run_cpu(command, func, *args)
+            PLOT_CACHE.put(key, png)
+        return png
+
+    def stats(self) -> dict:
+        """Reports how saturated the pools are
+
+            Return:
+                dict: jobs in flight and queued per pool, and callers waiting per command
+        """
+        with self._lock:
+            in_flight = dict(self._in_flight)
+
+        return {
+            'in_flight': in_flight,
+            'queued': {kind: max(0, in_flight[kind] - self._workers[kind]) for kind in in_flight},
+            'waiting': {command: count for command, count in self._waiting.items() if count}
+        }
+
+    def shutdown(self) -> None:
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+
+
+# shared by all cogs
+EXECUTOR = CommandExecutor()
+METRICS.register_gauge('executor', EXECUTOR.stats)
@@ -0,0 +1,91 @@
+import contextvars
+import os
+
+# constants
+from functions.constants import LEGACY_GUILD_ID
+
+# guild of the command being handled, set by main.py before every command.
+# The command executor copies it into its worker threads, so storage lookups made on behalf
+# of a command go to that guild's partition without passing the guild around
+CURRENT_GUILD = contextvars.ContextVar('current_guild', default=None)
+
+
+def current_guild() -> int:
+    """Gets the guild of the command being handled
+
+        Return:
+            int: guild id, None for direct messages and work outside of a command
+    """
+    return CURRENT_GUILD.get()
+
+
+def partition_key(guild_id: int = None):
+    """Gets the partition a guild's data is stored in.
+        Direct messages and the guild the bot ran in before partitioning (LEGACY_GUILD_ID) share the default partition
+
+        Args:
+            guild_id (int): guild id, defaults to the guild of the current command
+
+        Return:
+            int: guild id of the partition, None for the default partition
+    """
+    guild_id = current_guild() if guild_id is None else guild_id
+    return None if guild_id == LEGACY_GUILD_ID else guild_id
+
+
+def default_guilds() -> list:
+    """Gets the guilds served by a process that was not told its guilds, i.e. only the default partition
+
+        Return:
+            list: [None], None stands for the default partition
+    """
+    return [None]
+
+
+def partition_path(path: str, guild_id: int) -> str:
+    """Gets the file of a guild's partition, next to the default file in a guilds folder,
+        e.g. user_data/portfolios.db -> user_data/guilds/1234/portfolios.db
+
+        Args:
+            path (str): file of the default partition
+            guild_id (int): guild id of the partition, None for the default partition
+
+        Return:
+            str: file of the partition
+    """
+    if guild_id is None:
+        return path
+
+    folder = os.path.join(os.path.dirname(path), 'guilds', str(guild_id))
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, os.path.basename(path))
+
+
+def guild_shard(guild_id: int, shard_count: int) -> int:
+    """Gets the shard discord sends a guild's events to
+
+        Args:
+            guild_id (int): guild id
+            shard_count (int): total number of shards
+
+        Return:
+            int: shard id
+    """
+    return (guild_id >> 22) % shard_count
+
+
+def process_shards(process: int, processes: int, shard_count: int) -> list:
+    """Splits the shards between bot processes, every process gets every processes-th shard.
+        The shard of LEGACY_GUILD_ID goes to process 0 with shard 0 (which gets every direct message),
+        so the whole default partition is served by one process
+
+        Args:
+            process (int): index of the process
+            processes (int): number of processes
+            shard_count (int): total number of shards
+
+        Return:
+            list: shard ids run by the process
+    """
+    legacy = guild_shard(LEGACY_GUILD_ID, shard_count) if LEGACY_GUILD_ID is not None else 0
+    return [shard for shard in range(shard_count) if (0 if shard == legacy else shard % processes) == process]
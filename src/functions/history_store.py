@@ -0,0 +1,249 @@
+import json
+import os
+import shutil
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from functions.lazy import lazy_import
+from functions.metrics import METRICS
+from functions.market_hours import market_now, is_stale
+
+# constants
+from functions.constants import HISTORY_STORE_PATH, HISTORY_TTL_MARKET_OPEN, VALID_PERIODS, ADJUSTMENT_TOLERANCE
+
+# imported on first use, yfinance is slow to import
+yf = lazy_import('yfinance')
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+ACTIONS = ['Dividends', 'Stock Splits']
+
+
+class HistoryStore:
+    """Local store of daily price history.
+        Every ticker is saved as one .npy file per column (memory mapped on read) in a versioned folder,
+        meta.json points to the current version and records which dates have been downloaded.
+        Only date ranges that are missing locally are requested from yahoo, unless a dividend or split
+        re-adjusted the earlier closes, then the whole stored range is downloaded again
+    """
+    def __init__(self, path: str = HISTORY_STORE_PATH) -> None:
+        self.path = path
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, ticker: str) -> threading.Lock:
+        with self._locks_lock:
+            if ticker not in self._locks:
+                self._locks[ticker] = threading.Lock()
+            return self._locks[ticker]
+
+    def _read_meta(self, ticker: str) -> dict:
+        path = os.path.join(self.path, ticker, 'meta.json')
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'r') as read_path:
+            return json.load(read_path)
+
+    def _read(self, ticker: str, meta: dict) -> dict:
+        folder = os.path.join(self.path, ticker, str(meta['version']))
+        return {column: np.load(os.path.join(folder, f'{column}.npy'), mmap_mode='r') for column in ['Date'] + COLUMNS}
+
+    def _write(self, ticker: str, meta: dict, columns: dict) -> None:
+        # a new version is written in full before meta.json is swapped, so a crash never leaves a half written history
+        version = meta['version'] + 1 if 'version' in meta else 0
+        folder = os.path.join(self.path, ticker, str(version))
+        os.makedirs(folder, exist_ok=True)
+
+        for column, values in columns.items():
+            np.save(os.path.join(folder, f'{column}.npy'), values)
+
+        new_meta = dict(meta, version=version)
+        meta_path = os.path.join(self.path, ticker, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as write_path:
+            json.dump(new_meta, write_path)
+        os.replace(meta_path + '.tmp', meta_path)
+
+        meta.update(new_meta)
+        self._remove_old_versions(ticker, version)
+
+    def _remove_old_versions(self, ticker: str, current: int) -> int:
+        # on windows a version still memory mapped by a reader cannot be deleted yet,
+        # it is retried on the next write of the ticker and by cleanup at startup. Newer folders may still
+        # be written by another process, only versions older than the current one are removed
+        removed = 0
+        for name in os.listdir(os.path.join(self.path, ticker)):
+            folder = os.path.join(self.path, ticker, name)
+            if not name.isdigit() or int(name) >= current or not os.path.isdir(folder):
+                continue
+            try:
+                shutil.rmtree(folder)
+                removed += 1
+            except OSError as e:
+                print(f'failed to remove old history of {ticker} ({folder}): {e}')
+        return removed
+
+    def cleanup(self) -> int:
+        """Removes every version folder that meta.json no longer points to, left behind when readers still had it open
+
+            Return:
+                int: number of folders removed
+        """
+        if not os.path.isdir(self.path):
+            return 0
+
+        removed = 0
+        for ticker in os.listdir(self.path):
+            with self._lock(ticker):
+                meta = self._read_meta(ticker)
+                if meta is not None and 'version' in meta:
+                    removed += self._remove_old_versions(ticker, meta['version'])
+        return removed
+
+    @staticmethod
+    def _download(ticker: str, start: date = None, end: date = None) -> tuple:
+        data = yf.Ticker(ticker)
+        with METRICS.timed('yfinance', 'history'):
+            if start is None:
+                history = data.history(period='max')
+            else:
+                history = data.history(start=start, end=end)
+
+        if len(history) == 0:
+            empty = {column: np.array([], dtype='datetime64[D]' if column == 'Date' else float) for column in ['Date'] + COLUMNS}
+            return empty, empty['Date']
+
+        history = history.dropna(subset=['Close'])
+        columns = {'Date': history.index.tz_localize(None).normalize().to_numpy().astype('datetime64[D]')}
+        for column in COLUMNS:
+            columns[column] = history[column].to_numpy(dtype=float)
+
+        # a dividend or split makes yahoo re-adjust every earlier close
+        events = np.zeros(len(history), dtype=bool)
+        for column in ACTIONS:
+            if column in history:
+                events |= history[column].fillna(0).to_numpy() != 0
+        return columns, columns['Date'][events]
+
+    @staticmethod
+    def _adjusted(stored: dict, new: dict, day: np.datetime64) -> bool:
+        # the close of a day both downloads have only changes when yahoo re-adjusted the history
+        old_row = np.searchsorted(stored['Date'], day)
+        new_row = np.searchsorted(new['Date'], day)
+        if old_row == len(stored['Date']) or new_row == len(new['Date']) or stored['Date'][old_row] != day or new['Date'][new_row] != day:
+            return False
+        return not np.isclose(stored['Close'][old_row], new['Close'][new_row], rtol=ADJUSTMENT_TOLERANCE)
+
+    @staticmethod
+    def _merge(old: dict, new: dict) -> dict:
+        # rows from the new download replace stored rows of the same date
+        keep = ~np.isin(old['Date'], new['Date'])
+        merged = {column: np.concatenate([np.asarray(old[column])[keep], new[column]]) for column in old}
+        order = np.argsort(merged['Date'], kind='stable')
+        return {column: values[order] for column, values in merged.items()}
+
+    @staticmethod
+    def _is_stale(meta: dict) -> bool:
+        return is_stale(datetime.fromisoformat(meta['checked']), HISTORY_TTL_MARKET_OPEN)
+
+    def _ensure(self, ticker: str, start: date = None) -> dict:
+        meta = self._read_meta(ticker) or {}
+        columns = self._read(ticker, meta) if 'version' in meta else None
+        tomorrow = market_now().date() + timedelta(days=1)
+        updated = False
+
+        # nothing stored yet
+        if columns is None:
+            columns, _ = self._download(ticker, start, tomorrow)
+            if len(columns['Date']) == 0:
+                raise Exception('Ticker not found')
+            meta['start'] = None if start is None else str(start)
+            updated = True
+
+        else:
+            # requested range starts before the stored history, the download overlaps the first stored day
+            if meta['start'] is not None and (start is None or start < date.fromisoformat(meta['start'])):
+                first = columns['Date'][0]
+                older, events = self._download(ticker, start, pd.Timestamp(first).date() + timedelta(days=1))
+                meta['start'] = None if start is None else str(start)
+                if len(events) or self._adjusted(columns, older, first):
+                    columns, _ = self._download(ticker, start, tomorrow)
+                else:
+                    columns = self._merge(older, columns)
+                updated = True
+
+            # newest rows may be missing or still changing. The download starts at the second to last stored day,
+            # a finished session whose close only changes if a dividend or split re-adjusted the history
+            if self._is_stale(meta):
+                check = columns['Date'][max(len(columns['Date']) - 2, 0)]
+                newer, events = self._download(ticker, pd.Timestamp(check).date(), tomorrow)
+                # events on days already stored were handled when those days were downloaded
+                if (events > columns['Date'][-1]).any() or self._adjusted(columns, newer, check):
+                    start = None if meta['start'] is None else date.fromisoformat(meta['start'])
+                    columns, _ = self._download(ticker, start, tomorrow)
+                else:
+                    columns = self._merge(columns, newer)
+                updated = True
+
+        if updated:
+            meta['checked'] = market_now().isoformat()
+            self._write(ticker, meta, columns)
+            columns = self._read(ticker, meta)
+
+        return columns
+
+    def get(self, ticker: str, start: date = None, end: date = None) -> pd.DataFrame:
+        """Gets the daily price history of a ticker, downloading only what is missing locally
+
+            Args:
+                ticker (str): the stocks ticker
+                start (date): first date to include, None for the full history
+                end (date): last date to include, None for up to today
+
+            Return:
+                pd.DataFrame: dataframe of Open, High, Low, Close and Volume indexed by date
+        """
+        ticker = ticker.upper()
+        with self._lock(ticker):
+            columns = self._ensure(ticker, start)
+
+        dates = columns['Date']
+        first = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'D'), side='left')
+        last = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'D'), side='right')
+
+        history = pd.DataFrame({column: np.array(columns[column][first:last]) for column in COLUMNS},
+                               index=pd.DatetimeIndex(np.array(dates[first:last]), name='Date'))
+        return history
+
+    def get_period(self, ticker: str, period: str) -> pd.DataFrame:
+        """Gets the daily price history of a ticker for one of the VALID_PERIODS
+
+            Args:
+                ticker (str): the stocks ticker
+                period (str): 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd or max
+
+            Return:
+                pd.DataFrame: dataframe of Open, High, Low, Close and Volume indexed by date
+        """
+        if period not in VALID_PERIODS:
+            raise Exception('Period not defined')
+
+        today = market_now().date()
+        if period == 'max':
+            return self.get(ticker)
+        elif period == 'ytd':
+            return self.get(ticker, date(today.year, 1, 1))
+        elif period.endswith('d'):
+            # trading days, look back far enough to cover weekends and holidays
+            days = int(period[:-1])
+            return self.get(ticker, today - timedelta(days=2*days + 7)).tail(days)
+        elif period.endswith('mo'):
+            return self.get(ticker, (pd.Timestamp(today) - pd.DateOffset(months=int(period[:-2]))).date())
+        else:
+            return self.get(ticker, (pd.Timestamp(today) - pd.DateOffset(years=int(period[:-1]))).date())
+
+
+# shared by every history lookup
+HISTORY_STORE = HistoryStore()
@@ -0,0 +1,128 @@
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from functions.analytics import TRADING_DAYS
+from functions.history_store import HISTORY_STORE
+from functions.market_hours import market_now, is_stale
+
+# constants
+from functions.constants import REFERENCE_INDICES, DEFAULT_INDEX, HISTORY_TTL_MARKET_OPEN
+
+
+class ReferenceIndex:
+    """Full close history of a market index with prefix sums of its daily returns,
+        so the growth from any start date to today takes two lookups instead of a pass over the history
+
+        prefix_log[i] is the sum of log returns up to day i, so the growth since day i is exp(prefix_log[-1] - prefix_log[i]).
+        prefix_returns[i] is the sum of simple returns up to day i, used for the average daily return
+    """
+    def __init__(self, name: str, ticker: str, label: str, history: pd.DataFrame) -> None:
+        self.name = name
+        self.ticker = ticker
+        self.label = label
+        self.loaded = market_now()
+
+        self.dates = history.index.to_numpy().astype('datetime64[D]')
+        self.close = history.Close.to_numpy(dtype=float)
+
+        returns = np.zeros_like(self.close)
+        returns[1:] = self.close[1:] / self.close[:-1] - 1
+        self.prefix_returns = np.cumsum(returns)
+        self.prefix_log = np.cumsum(np.log1p(returns))
+
+    def _start(self, start_date: date) -> int:
+        i = int(np.searchsorted(self.dates, np.datetime64(start_date, 'D'), side='left'))
+        if i >= len(self.dates) - 1:
+            raise Exception(f'Not enough {self.label} history after {start_date}')
+        return i
+
+    def growth(self, start_date: date) -> dict:
+        """Computes the growth of the index from the first trading day on or after start_date
+
+            Args:
+                start_date (date): date of initial investment
+
+            Return:
+                dict: total_increase and annual_returns in percent, same as summarize_growth
+        """
+        i = self._start(start_date)
+        days = len(self.dates) - i
+
+        # the first day of the window has a return of 0, as in daily_returns
+        mean_return = (self.prefix_returns[-1] - self.prefix_returns[i]) / days
+
+        return {
+            'total_increase': 100 * np.expm1(self.prefix_log[-1] - self.prefix_log[i]),
+            'annual_returns': 100 * ((1 + mean_return)**TRADING_DAYS - 1)
+        }
+
+    def value(self, amount: float, start_date: date) -> float:
+        """Computes what an investment in the index would be worth today
+
+            Args:
+                amount (float): amount of initial investment
+                start_date (date): date of initial investment
+
+            Return:
+                float: current value of the investment
+        """
+        return amount * np.exp(self.prefix_log[-1] - self.prefix_log[self._start(start_date)])
+
+    def percent_increase(self, start_date: date) -> pd.Series:
+        """Gets the percent increase of the index over time, used for plotting
+
+            Args:
+                start_date (date): date of initial investment
+
+            Return:
+                pd.Series: percent increase indexed by date
+        """
+        i = self._start(start_date)
+        return pd.Series(100 * np.expm1(self.prefix_log[i:] - self.prefix_log[i]),
+                         index=pd.DatetimeIndex(self.dates[i:], name='Date'), name=self.label)
+
+
+class IndexStore:
+    """In memory ReferenceIndex of every index in REFERENCE_INDICES.
+        Indices are loaded from HISTORY_STORE on first use and rebuilt when new closes come in
+    """
+    def __init__(self, indices: dict = REFERENCE_INDICES) -> None:
+        self.indices = indices
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str = DEFAULT_INDEX) -> ReferenceIndex:
+        """Gets a reference index, loading it if it is missing or out of date
+
+            Args:
+                name (str): one of REFERENCE_INDICES
+
+            Return:
+                ReferenceIndex: the precomputed index
+        """
+        name = name.lower()
+        if name not in self.indices:
+            raise Exception(f'Index not defined, choose one of {list(self.indices)}')
+
+        index = self._loaded.get(name)
+        if index is not None and not is_stale(index.loaded, HISTORY_TTL_MARKET_OPEN):
+            return index
+
+        with self._lock:
+            index = self._loaded.get(name)
+            if index is None or is_stale(index.loaded, HISTORY_TTL_MARKET_OPEN):
+                ticker, label = self.indices[name]
+                index = self._loaded[name] = ReferenceIndex(name, ticker, label, HISTORY_STORE.get(ticker).dropna(subset=['Close']))
+            return index
+
+    def warm(self) -> None:
+        """Loads every index ahead of the first command"""
+        for name in self.indices:
+            self.get(name)
+
+
+# shared by every stonkworth comparison
+INDEX_STORE = IndexStore()
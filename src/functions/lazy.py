@@ -0,0 +1,48 @@
+import importlib
+import importlib.util
+import sys
+import threading
+
+_lock = threading.Lock()
+
+
+def lazy_import(name: str):
+    """Imports a top level module on first attribute access instead of right away.
+        Used for heavy dependencies that are not needed until the first command runs
+
+        usage:
+            yf = lazy_import('yfinance')
+            ...
+            yf.Ticker(ticker)  # yfinance is imported here
+
+        Args:
+            name (str): name of the module
+
+        Return:
+            module: the module, loaded when one of its attributes is first used
+    """
+    with _lock:
+        if name in sys.modules:
+            return sys.modules[name]
+
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
+
+
+def load(*names: str) -> None:
+    """Finishes importing modules ahead of their first use, e.g. while the bot is idle
+
+        Args:
+            *names (str): names of the modules
+    """
+    for name in names:
+        # any attribute access makes a lazy module run its code
+        getattr(importlib.import_module(name), '__file__', None)
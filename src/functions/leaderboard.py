@@ -0,0 +1,258 @@
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from functions.executor import EXECUTOR
+from functions.guilds import partition_key
+from functions.metrics import METRICS
+from functions.nav import value_portfolios
+from functions.stock_info import get_prices
+from functions.storage import get_storage
+
+
+class RankIndex:
+    """Usernames ordered by portfolio value, highest first, ties broken by username.
+        Looking up a rank is a binary search and reading a page or the neighbors of a user is a slice,
+        so reads take the same time however many players there are. An update moves one entry of a flat list
+    """
+    def __init__(self, values: dict = None) -> None:
+        self._values = dict(values or {})
+        self._keys = sorted((-value, username) for username, value in self._values.items())
+
+    def update(self, username: str, value: float) -> None:
+        """Sets the value of a user, adding them if needed
+
+            Args:
+                username (str): user's name
+                value (float): portfolio value
+        """
+        old = self._values.get(username)
+        if old == value:
+            return
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, username))]
+        insort(self._keys, (-value, username))
+        self._values[username] = value
+
+    def rank(self, username: str) -> int:
+        """Gets the rank of a user
+
+            Args:
+                username (str): user's name
+
+            Return:
+                int: rank starting at 1, None if the user is not ranked
+        """
+        value = self._values.get(username)
+        if value is None:
+            return None
+        return bisect_left(self._keys, (-value, username)) + 1
+
+    def slice(self, start: int, count: int) -> list:
+        """Gets consecutive entries of the ranking
+
+            Args:
+                start (int): rank of the first entry, starting at 1
+                count (int): number of entries
+
+            Return:
+                list: list of (rank, username, value) tuples
+        """
+        start = max(start, 1)
+        return [(start + i, username, -value) for i, (value, username) in enumerate(self._keys[start - 1:start - 1 + count])]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class Leaderboard:
+    """Portfolio values of every user of one guild partition, kept up to date incrementally.
+        A trade revalues its user, a price snapshot only revalues holders of tickers whose price changed
+    """
+    def __init__(self, funds: dict, holdings: dict, snapshot=None) -> None:
+        self.snapshot = snapshot
+        # held tickers without any price, valued at their average price until a snapshot has them
+        self.unpriced = set()
+        self._holdings = defaultdict(dict)
+        self._holders = defaultdict(set)
+        self._lock = threading.Lock()
+
+        users = set(funds['username'])
+        for username, ticker, shares, average_price in zip(holdings['username'], holdings['ticker'], holdings['shares'], holdings['average_price']):
+            if username not in users:
+                continue
+            self._holdings[username][ticker] = (shares, average_price)
+            self._holders[ticker].add(username)
+
+        # every portfolio is valued in one vectorized pass to start with
+        prices = self._prices(list(self._holders))
+        self.index = RankIndex(value_portfolios(funds, holdings, prices))
+        self._funds = dict(zip(funds['username'], funds['funds_available']))
+
+    def _prices(self, tickers: list) -> dict:
+        # tickers the snapshot does not have yet (e.g. just bought) are fetched once per snapshot
+        prices = self.snapshot.get_many(tickers) if self.snapshot is not None else {}
+        missing = [ticker for ticker in tickers if ticker not in prices and ticker not in self.unpriced]
+        if missing:
+            try:
+                prices.update(get_prices(missing, missing_ok=True))
+            except Exception as e:
+                print(f'failed to price {", ".join(missing)}: {e}')
+            self.unpriced.update(ticker for ticker in missing if ticker not in prices)
+        return prices
+
+    def _value(self, username: str) -> float:
+        holdings = self._holdings.get(username, {})
+        prices = self._prices(list(holdings))
+        return round(self._funds[username] + sum(shares * prices.get(ticker, average_price)
+                                                  for ticker, (shares, average_price) in holdings.items()), 2)
+
+    def update_user(self, username: str, funds_available: float, portfolio: dict) -> None:
+        """Revalues a user after a trade or when their profile is created
+
+            Args:
+                username (str): user's name
+                funds_available (float): funds after the trade
+                portfolio (dict): dictionary of ticker to holding after the trade
+        """
+        with self._lock:
+            for ticker in self._holdings.pop(username, {}):
+                self._holders[ticker].discard(username)
+            for ticker, holding in portfolio.items():
+                self._holdings[username][ticker] = (holding['shares'], holding['average_price'])
+                self._holders[ticker].add(username)
+
+            self._funds[username] = funds_available
+            self.index.update(username, self._value(username))
+
+    def apply_snapshot(self, snapshot) -> int:
+        """Revalues the holders of every ticker whose price changed since the previous snapshot
+
+            Args:
+                snapshot (PriceSnapshot): the new snapshot
+
+            Return:
+                int: number of users revalued
+        """
+        with self._lock:
+            previous = self.snapshot.prices if self.snapshot is not None else {}
+            # holders of tickers that had no price get another try with the new snapshot
+            changed = [ticker for ticker in self._holders if snapshot.prices.get(ticker) != previous.get(ticker) or ticker in self.unpriced]
+            affected = set(username for ticker in changed for username in self._holders[ticker])
+
+            self.snapshot = snapshot
+            self.unpriced = set()
+            for username in affected:
+                self.index.update(username, self._value(username))
+            return len(affected)
+
+    def estimated(self) -> list:
+        """Gets the held tickers without any price, their holdings are valued at their average price
+
+            Return:
+                list: sorted tickers
+        """
+        with self._lock:
+            return sorted(ticker for ticker in self.unpriced if self._holders[ticker])
+
+    def page(self, page: int, size: int) -> list:
+        """Gets a page of the ranking
+
+            Args:
+                page (int): page number, starting at 1
+                size (int): entries per page
+
+            Return:
+                list: list of (rank, username, value) tuples
+        """
+        with self._lock:
+            return self.index.slice((page - 1) * size + 1, size)
+
+    def around(self, username: str, radius: int) -> list:
+        """Gets a user and their neighbors in the ranking
+
+            Args:
+                username (str): user's name
+                radius (int): number of neighbors above and below
+
+            Return:
+                list: list of (rank, username, value) tuples, empty if the user is not ranked
+        """
+        with self._lock:
+            rank = self.index.rank(username)
+            if rank is None:
+                return []
+            return self.index.slice(rank - radius, 2 * radius + 1 if rank > radius else rank + radius)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+class Leaderboards:
+    """Keeps the leaderboard of every guild partition. A board is built from the database the first time it is read,
+        after that trades and price snapshots keep it current
+    """
+    def __init__(self) -> None:
+        self._boards = {}
+        self._lock = threading.Lock()
+        self.revalued = 0
+
+    def board(self, snapshot, guild_id: int = None) -> Leaderboard:
+        """Gets the leaderboard of a guild, building it on first use
+
+            Args:
+                snapshot (PriceSnapshot): latest snapshot, used to value the portfolios when the board is built
+                guild_id (int): guild id, defaults to the guild of the current command
+
+            Return:
+                Leaderboard: leaderboard of the guild's partition
+        """
+        key = partition_key(guild_id)
+        with self._lock:
+            if key not in self._boards:
+                funds, holdings = get_storage(guild_id).get_positions()
+                self._boards[key] = Leaderboard(funds, holdings, snapshot)
+            return self._boards[key]
+
+    def on_trade(self, username: str, funds_available: float, portfolio: dict) -> None:
+        """Revalues a user of the current guild after a trade, boards that were never read are left to be built later
+
+            Args:
+                username (str): user's name
+                funds_available (float): funds after the trade
+                portfolio (dict): dictionary of ticker to holding after the trade
+        """
+        board = self._boards.get(partition_key())
+        if board is not None:
+            board.update_user(username, funds_available, portfolio)
+
+    async def on_snapshot(self, snapshot, guild_ids: list = ()) -> None:
+        """Revalues the users affected by a new price snapshot on every board
+
+            Args:
+                snapshot (PriceSnapshot): the new snapshot
+                guild_ids (list): guilds served by this process
+        """
+        with self._lock:
+            boards = list(self._boards.values())
+        for board in boards:
+            self.revalued += await EXECUTOR.run_io('leaderboard', board.apply_snapshot, snapshot)
+
+    def stats(self) -> dict:
+        """Summarizes the leaderboards
+
+            Return:
+                dict: number of boards, ranked users and users revalued by snapshots
+        """
+        with self._lock:
+            boards = list(self._boards.values())
+        return {
+            'boards': len(boards),
+            'users': sum(len(board) for board in boards),
+            'revalued': self.revalued
+        }
+
+
+# updated by trades and the price refresher, read by $rankings
+LEADERBOARDS = Leaderboards()
+METRICS.register_gauge('leaderboards', LEADERBOARDS.stats)
@@ -0,0 +1,76 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from functions.storage import get_storage
+
+
+def get_ledger(username: str = None, ticker: str = None, start: date = None, end: date = None) -> pd.DataFrame:
+    """Gets the transactions ledger as a columnar dataframe, filtered by user, ticker and date range
+
+        Args:
+            username (str): only transactions of this user, None for every user
+            ticker (str): only transactions of this ticker, None for every ticker
+            start (date): first date to include, None for the first transaction
+            end (date): last date to include, None for the last transaction
+
+        Return:
+            pd.DataFrame: one row per transaction (id, date, username, ticker, price, shares, status, remaining_funds)
+    """
+    columns = get_storage().query_transactions(username,
+                                                ticker.upper() if ticker else None,
+                                                str(start) if start else None,
+                                                str(end) if end else None)
+
+    return pd.DataFrame({
+        'id': np.array(columns['id'], dtype=np.int64),
+        'date': pd.to_datetime(pd.Series(columns['date'], dtype=object)).astype('datetime64[s]'),
+        'username': pd.Categorical(columns['username']),
+        'ticker': pd.Categorical(columns['ticker']),
+        'price': np.array(columns['price'], dtype=float),
+        'shares': np.array(columns['shares'], dtype=np.int64),
+        'status': pd.Categorical(columns['status'], categories=['buy', 'sell']),
+        'remaining_funds': np.array(columns['remaining_funds'], dtype=float)
+    })
+
+
+def to_arrow(ledger: pd.DataFrame):
+    """Converts a ledger to an arrow table, username, ticker and status are dictionary encoded
+
+        Args:
+            ledger (pd.DataFrame): ledger from get_ledger
+
+        Return:
+            pyarrow.Table: the ledger
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise Exception('pyarrow needs to be installed to export the ledger')
+
+    return pa.Table.from_pandas(ledger, preserve_index=False)
+
+
+def export_ledger(path, username: str = None, ticker: str = None, start: date = None, end: date = None) -> int:
+    """Writes the transactions ledger to a parquet file
+
+        Args:
+            path (str or file): file to write, or a binary file object
+            username (str): only transactions of this user, None for every user
+            ticker (str): only transactions of this ticker, None for every ticker
+            start (date): first date to include, None for the first transaction
+            end (date): last date to include, None for the last transaction
+
+        Return:
+            int: number of transactions written
+    """
+    table = to_arrow(get_ledger(username, ticker, start, end))
+
+    import pyarrow.parquet as pq
+    pq.write_table(table, path)
+    return table.num_rows
+
+
+if __name__ == "__main__":
+    print(f'exported {export_ledger("transactions.parquet")} transactions to transactions.parquet')
@@ -0,0 +1,114 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+# regular trading session of US exchanges
+MARKET_TIMEZONE = ZoneInfo('America/New_York')
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+
+
+def market_now() -> datetime:
+    """Gets the current time in the exchange's timezone
+
+        Return:
+            datetime: current time in New York
+    """
+    return datetime.now(MARKET_TIMEZONE)
+
+
+def is_market_open(now: datetime = None) -> bool:
+    """Checks if the market is currently in its regular session.
+        Holidays are not accounted for, so they are treated as a normal weekday
+
+        Args:
+            now (datetime): time to check, defaults to the current time
+
+        Return:
+            bool: True if the market is open
+    """
+    now = now.astimezone(MARKET_TIMEZONE) if now else market_now()
+
+    if now.weekday() >= 5:
+        return False
+
+    return MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+def last_market_close(now: datetime = None) -> datetime:
+    """Gets the most recent closing time of the market (holidays are treated as trading days)
+
+        Args:
+            now (datetime): time to check from, defaults to the current time
+
+        Return:
+            datetime: time of the last close in New York
+    """
+    now = now.astimezone(MARKET_TIMEZONE) if now else market_now()
+    close = now.replace(hour=MARKET_CLOSE.hour, minute=MARKET_CLOSE.minute, second=0, microsecond=0)
+
+    if close > now:
+        close -= timedelta(days=1)
+    while close.weekday() >= 5:
+        close -= timedelta(days=1)
+
+    return close
+
+
+def next_market_open(now: datetime = None) -> datetime:
+    """Gets the next opening time of the market (holidays are treated as trading days)
+
+        Args:
+            now (datetime): time to check from, defaults to the current time
+
+        Return:
+            datetime: time of the next open in New York
+    """
+    now = now.astimezone(MARKET_TIMEZONE) if now else market_now()
+    opening = now.replace(hour=MARKET_OPEN.hour, minute=MARKET_OPEN.minute, second=0, microsecond=0)
+
+    if opening <= now:
+        opening += timedelta(days=1)
+    while opening.weekday() >= 5:
+        opening += timedelta(days=1)
+
+    return opening
+
+
+def next_market_close(now: datetime = None) -> datetime:
+    """Gets the next closing time of the market (holidays are treated as trading days)
+
+        Args:
+            now (datetime): time to check from, defaults to the current time
+
+        Return:
+            datetime: time of the next close in New York
+    """
+    now = now.astimezone(MARKET_TIMEZONE) if now else market_now()
+    close = now.replace(hour=MARKET_CLOSE.hour, minute=MARKET_CLOSE.minute, second=0, microsecond=0)
+
+    if close <= now:
+        close += timedelta(days=1)
+    while close.weekday() >= 5:
+        close += timedelta(days=1)
+
+    return close
+
+
+def is_stale(checked: datetime, ttl_open: float, now: datetime = None) -> bool:
+    """Checks if data fetched at a given time may be out of date.
+        While the market is open data expires after ttl_open seconds, after close it stays
+        fresh until the next close
+
+        Args:
+            checked (datetime): time the data was fetched
+            ttl_open (float): seconds the data stays fresh while the market is open
+            now (datetime): time to check at, defaults to the current time
+
+        Return:
+            bool: True if the data should be fetched again
+    """
+    now = now.astimezone(MARKET_TIMEZONE) if now else market_now()
+
+    if is_market_open(now):
+        return (now - checked).total_seconds() > ttl_open
+    return checked < last_market_close(now)
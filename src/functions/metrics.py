@@ -0,0 +1,230 @@
+import asyncio
+import bisect
+import functools
+import os
+import threading
+import time
+
+# constants
+from functions.constants import METRICS_BUCKETS
+
+
+class Histogram:
+    """Latency histogram with fixed bucket bounds (in seconds), as used by prometheus"""
+    def __init__(self, buckets: list = METRICS_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile as the upper bound of the bucket it falls in
+
+            Args:
+                q (float): quantile between 0 and 1
+
+            Return:
+                float: estimated latency in seconds, inf if it is past the last bucket
+        """
+        if self.count == 0:
+            return 0.0
+
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Process wide registry of latency histograms, grouped into families
+        (command, yfinance, db, render...) and named within each family.
+        Recording is a lock and a bisect, cheap enough to leave on permanently
+    """
+    def __init__(self) -> None:
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, family: str, name: str, seconds: float, error: bool = False) -> None:
+        """Records one call
+
+            Args:
+                family (str): group of the metric, e.g. command or yfinance
+                name (str): name within the group, e.g. stonk or history
+                seconds (float): how long the call took
+                error (bool): whether the call failed
+        """
+        with self._lock:
+            histogram = self._histograms.get((family, name))
+            if histogram is None:
+                histogram = self._histograms[(family, name)] = Histogram()
+            histogram.observe(seconds, error)
+
+    def timed(self, family: str, name: str):
+        """Times a block or function, recording an error if it raises
+
+            usage:
+                with METRICS.timed('yfinance', 'info'):
+                    ...
+
+                @METRICS.timed('db', 'get_profile')
+                def get_profile(...):
+        """
+        return _Timer(self, family, name)
+
+    def register_gauge(self, name: str, func) -> None:
+        """Registers a function whose dictionary of numbers is reported with the metrics,
+            e.g. the stats of a cache
+
+            Args:
+                name (str): prefix of the reported values
+                func (callable): returns a dictionary of name to number
+        """
+        self._gauges[name] = func
+
+    def snapshot(self) -> dict:
+        """Summarizes everything recorded so far
+
+            Return:
+                dict: histograms keyed by (family, name), and gauge values keyed by name
+        """
+        with self._lock:
+            histograms = {key: {
+                'count': histogram.count,
+                'errors': histogram.errors,
+                'mean': histogram.sum / histogram.count if histogram.count else 0.0,
+                'p50': histogram.quantile(0.5),
+                'p95': histogram.quantile(0.95)
+            } for key, histogram in sorted(self._histograms.items())}
+
+        gauges = {}
+        for name, func in self._gauges.items():
+            gauges[name] = _flatten(func())
+
+        return {'histograms': histograms, 'gauges': gauges}
+
+    def prometheus_text(self) -> str:
+        """Renders every metric in the prometheus text exposition format
+
+            Return:
+                str: metrics text
+        """
+        lines = ['# TYPE bot_latency_seconds histogram']
+        errors = ['# TYPE bot_errors_total counter']
+        with self._lock:
+            for (family, name), histogram in sorted(self._histograms.items()):
+                labels = f'family="{family}",name="{name}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'bot_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'bot_latency_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'bot_latency_seconds_count{{{labels}}} {histogram.count}')
+                errors.append(f'bot_errors_total{{{labels}}} {histogram.errors}')
+        lines += errors
+
+        lines.append('# TYPE bot_gauge gauge')
+        for name, values in self.snapshot()['gauges'].items():
+            for key, value in values.items():
+                lines.append(f'bot_gauge{{source="{name}",name="{key}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str) -> None:
+        """Writes the prometheus text to a file, replacing it atomically
+
+            Args:
+                path (str): file to write
+        """
+        with open(path + '.tmp', 'w') as write_path:
+            write_path.write(self.prometheus_text())
+        os.replace(path + '.tmp', path)
+
+    async def export_periodically(self, path: str, interval: float) -> None:
+        """Writes the prometheus text to a file every interval seconds, forever
+
+            Args:
+                path (str): file to write
+                interval (float): seconds between writes
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.write_prometheus, path)
+            except Exception as e:
+                print(f'failed to write metrics: {e}')
+            await asyncio.sleep(interval)
+
+    async def serve(self, port: int) -> asyncio.AbstractServer:
+        """Serves the prometheus text over http on localhost
+
+            Args:
+                port (int): port to listen on
+
+            Return:
+                asyncio.AbstractServer: the running server
+        """
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            try:
+                await reader.readuntil(b'\r\n\r\n')
+                body = self.prometheus_text().encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                             + f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+                await writer.drain()
+            except Exception:
+                pass
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, '127.0.0.1', port)
+
+
+class _Timer:
+    def __init__(self, metrics: Metrics, family: str, name: str) -> None:
+        self.metrics = metrics
+        self.family = family
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        self.metrics.observe(self.family, self.name, time.perf_counter() - self.start, exc_type is not None)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = True
+            try:
+                result = func(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                self.metrics.observe(self.family, self.name, time.perf_counter() - start, error)
+        return wrapper
+
+
+def _flatten(values: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}_'))
+        elif isinstance(value, (int, float)):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+# shared by the whole bot
+METRICS = Metrics()
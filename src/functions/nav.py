@@ -0,0 +1,104 @@
+import asyncio
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from functions.executor import EXECUTOR
+from functions.guilds import default_guilds
+from functions.market_hours import market_now, is_market_open, last_market_close, next_market_close
+from functions.metrics import METRICS
+from functions.stock_info import download_prices
+from functions.storage import get_storages
+
+# constants
+from functions.constants import NAV_RECORD_DELAY
+
+
+def value_portfolios(funds: dict, holdings: dict, prices: dict) -> dict:
+    """Values every portfolio in one vectorized pass over all holdings.
+        Holdings without a price are valued at their average price
+
+        Args:
+            funds (dict): username and funds_available columns, from Storage.get_positions
+            holdings (dict): username, ticker, shares and average_price columns, from Storage.get_positions
+            prices (dict): dictionary of tickers and their prices
+
+        Return:
+            dict: dictionary of username to portfolio value
+    """
+    users = funds['username']
+    owners = pd.Categorical(holdings['username'], categories=users).codes
+
+    price = pd.Series(prices, dtype=float).reindex(holdings['ticker']).to_numpy()
+    price = np.where(np.isnan(price), np.asarray(holdings['average_price'], dtype=float), price)
+    market_value = np.asarray(holdings['shares'], dtype=float) * price
+
+    # holdings of users without a profile get code -1 and are left out
+    known = owners >= 0
+    values = np.asarray(funds['funds_available'], dtype=float) + np.bincount(owners[known], weights=market_value[known], minlength=len(users))
+    return dict(zip(users, np.round(values, 2).tolist()))
+
+
+@METRICS.timed('refresh', 'nav')
+def record_nav(day: str = None, guild_ids: list = (None,)) -> int:
+    """Values every portfolio at the latest closing prices and stores it as the net asset value of the day.
+        Prices of every guild's holdings are downloaded together
+
+        Args:
+            day (str): trading day to record (YYYY-MM-DD), defaults to the day of the last close
+            guild_ids (list): guilds to record, None for the default partition
+
+        Return:
+            int: number of portfolios recorded
+    """
+    day = day or str(last_market_close().date())
+    storages = get_storages(guild_ids)
+    positions = [storage.get_positions() for storage in storages]
+
+    tickers = sorted(set(ticker for _, holdings in positions for ticker in holdings['ticker']))
+    prices = download_prices(tickers, missing_ok=True) if tickers else {}
+
+    recorded = 0
+    for storage, (funds, holdings) in zip(storages, positions):
+        values = value_portfolios(funds, holdings, prices)
+        storage.write_nav(day, values)
+        recorded += len(values)
+    return recorded
+
+
+def next_nav_time():
+    """Gets when the next end of day values should be recorded, a little after the close so final prices are in
+
+        Return:
+            datetime: time of the next recording in New York
+    """
+    now = market_now()
+    record = last_market_close(now) + timedelta(seconds=NAV_RECORD_DELAY)
+    if record <= now:
+        record = next_market_close(now) + timedelta(seconds=NAV_RECORD_DELAY)
+    return record
+
+
+async def record_nav_daily(guilds=None) -> None:
+    """Records the end of day values after every close, forever.
+        A day missed while the bot was offline is recorded at startup if the market is still closed
+
+        Args:
+            guilds (callable): returns the ids of the guilds served by this process, None for the default partition
+    """
+    guilds = guilds or default_guilds
+    last_close = last_market_close()
+    missed = any(str(last_close.date()) not in storage.get_nav_dates(1) for storage in get_storages(guilds()))
+    if missed and not is_market_open() and market_now() >= last_close + timedelta(seconds=NAV_RECORD_DELAY):
+        try:
+            await EXECUTOR.run_io('nav', record_nav, None, guilds())
+        except Exception as e:
+            print(f'failed to record portfolio values: {e}')
+
+    while True:
+        await asyncio.sleep((next_nav_time() - market_now()).total_seconds())
+        try:
+            await EXECUTOR.run_io('nav', record_nav, None, guilds())
+        except Exception as e:
+            print(f'failed to record portfolio values: {e}')
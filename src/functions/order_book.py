@@ -0,0 +1,298 @@
+import heapq
+import threading
+from collections import defaultdict
+from datetime import date
+
+from functions.executor import EXECUTOR
+from functions.guilds import CURRENT_GUILD, partition_key
+from functions.metrics import METRICS
+from functions.portfolio_game import buy_stock, sell_stock, check_user_exists, check_user_owns_stock, get_stock_info
+from functions.storage import get_storage
+from functions.ticker_store import TICKER_STORE
+from functions.user_locks import USER_LOCKS
+
+# constants
+from functions.constants import ORDER_KINDS
+
+
+def _trigger(order: dict) -> tuple:
+    """Gets the price that fills (or, for stops, triggers) an order and the direction the price has to cross it in
+
+        Args:
+            order (dict): pending order
+
+        Return:
+            tuple: (price, rising), rising is True if the order fires once the price is at or above it
+    """
+    if order['kind'] == 'limit' or order['triggered']:
+        # buy limits wait for the price to drop, sell limits for it to rise
+        return order['limit_price'], order['side'] == 'sell'
+    # buy stops wait for the price to rise, sell stops for it to drop
+    return order['stop_price'], order['side'] == 'buy'
+
+
+class OrderBook:
+    """Pending orders of one guild partition, indexed per ticker by the price that fires them.
+        Every ticker has a min heap of orders that fire once the price rises to their trigger and a max heap
+        of orders that fire once it drops to theirs, so a price tick only pops the orders it crossed.
+        Cancelled orders are left in the heaps and skipped when they reach the top
+    """
+    def __init__(self, orders: list = ()) -> None:
+        self.orders = {}
+        self._rising = defaultdict(list)
+        self._falling = defaultdict(list)
+        self._lock = threading.Lock()
+        for order in orders:
+            self.add(order)
+
+    def add(self, order: dict) -> None:
+        """Adds a pending order, or re-indexes a stop-limit order whose stop was reached
+
+            Args:
+                order (dict): pending order
+        """
+        price, rising = _trigger(order)
+        with self._lock:
+            self.orders[order['id']] = order
+            if rising:
+                heapq.heappush(self._rising[order['ticker']], (price, order['id'], order['triggered']))
+            else:
+                heapq.heappush(self._falling[order['ticker']], (-price, order['id'], order['triggered']))
+
+    def remove(self, order_id: int) -> dict:
+        """Removes a pending order
+
+            Args:
+                order_id (int): id of the order
+
+            Return:
+                dict: the removed order, None if there is no such order
+        """
+        with self._lock:
+            return self.orders.pop(order_id, None)
+
+    def user_orders(self, username: str) -> list:
+        """Gets the pending orders of a user
+
+            Args:
+                username (str): user's name
+
+            Return:
+                list: list of orders in the order they were placed
+        """
+        with self._lock:
+            return sorted((order for order in self.orders.values() if order['username'] == username), key=lambda order: order['id'])
+
+    def tickers(self) -> list:
+        """Gets every ticker with a pending order
+
+            Return:
+                list: list of tickers
+        """
+        with self._lock:
+            return list(set(order['ticker'] for order in self.orders.values()))
+
+    def crossed(self, ticker: str, price: float) -> list:
+        """Pops every order of a ticker whose trigger the price has reached
+
+            Args:
+                ticker (str): the stocks ticker
+                price (float): latest price of the stock
+
+            Return:
+                list: list of crossed orders, they stay in the book until removed
+        """
+        crossed = []
+        with self._lock:
+            for heap, sign in ((self._rising.get(ticker), 1), (self._falling.get(ticker), -1)):
+                while heap and heap[0][0] <= sign * price:
+                    _, order_id, stage = heapq.heappop(heap)
+                    order = self.orders.get(order_id)
+                    # entries of cancelled orders and of stops that were since re-indexed are stale
+                    if order is not None and order['triggered'] == stage:
+                        crossed.append(order)
+        return crossed
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+
+class OrderMatcher:
+    """Keeps the order book of every guild partition and fills pending orders against each new price snapshot.
+        Fills go through buy_stock and sell_stock under the user's lock, so they are recorded in the ledger like any trade
+    """
+    def __init__(self) -> None:
+        self._books = {}
+        self._lock = threading.Lock()
+        self.fills = 0
+        self.rejections = 0
+
+    def book(self, guild_id: int = None) -> OrderBook:
+        """Gets the order book of a guild, loading its pending orders on first use
+
+            Args:
+                guild_id (int): guild id, defaults to the guild of the current command
+
+            Return:
+                OrderBook: order book of the guild's partition
+        """
+        key = partition_key(guild_id)
+        with self._lock:
+            if key not in self._books:
+                self._books[key] = OrderBook(get_storage(guild_id).get_orders())
+            return self._books[key]
+
+    def place(self, username: str, side: str, ticker: str, shares: int, kind: str, limit_price: float = None, stop_price: float = None) -> dict:
+        """Places a pending order for a given user
+
+            Args:
+                username (str): user's name
+                side (str): 'buy' or 'sell'
+                ticker (str): the stocks ticker
+                shares (int): number of shares
+                kind (str): 'limit', 'stop' or 'stop_limit'
+                limit_price (float): worst price the order fills at, for limit and stop-limit orders
+                stop_price (float): price that turns the order into a market (stop) or limit (stop-limit) order
+
+            Return:
+                dict: the placed order
+        """
+        ticker = ticker.upper()
+        if side not in ('buy', 'sell'):
+            raise Exception('Orders are either buy or sell')
+        if kind not in ORDER_KINDS:
+            raise Exception(f'Order type must be one of {", ".join(ORDER_KINDS)}')
+        if shares <= 0:
+            raise Exception('Orders need at least one share')
+        if kind != 'stop' and (not limit_price or limit_price <= 0):
+            raise Exception('Limit price must be positive')
+        if kind != 'limit' and (not stop_price or stop_price <= 0):
+            raise Exception('Stop price must be positive')
+        if not check_user_exists(username):
+            raise Exception('You do not have a profile! Create one with ***$create***')
+        if side == 'sell':
+            if not check_user_owns_stock(username, ticker):
+                raise Exception(f'You do not own any shares of {ticker}!')
+            if get_stock_info(username, ticker)['shares'] < shares:
+                raise Exception('You dont own that many shares!')
+        else:
+            TICKER_STORE.get(ticker)
+
+        order = {
+            'date': str(date.today()),
+            'username': username,
+            'ticker': ticker,
+            'side': side,
+            'kind': kind,
+            'shares': shares,
+            'limit_price': limit_price if kind != 'stop' else None,
+            'stop_price': stop_price if kind != 'limit' else None,
+            'triggered': 0
+        }
+        # the book is loaded before the order is stored so it is not indexed twice
+        book = self.book()
+        order['id'] = get_storage().add_order(order)
+        book.add(order)
+        return order
+
+    def cancel(self, username: str, order_id: int) -> bool:
+        """Cancels a pending order of a given user
+
+            Args:
+                username (str): user's name
+                order_id (int): id of the order
+
+            Return:
+                bool: True if the order was cancelled
+        """
+        if not get_storage().remove_order(order_id, username):
+            return False
+        self.book().remove(order_id)
+        return True
+
+    def user_orders(self, username: str) -> list:
+        """Gets the pending orders of a user in the guild of the current command
+
+            Args:
+                username (str): user's name
+
+            Return:
+                list: list of orders in the order they were placed
+        """
+        return self.book().user_orders(username)
+
+    def _fill(self, order: dict, price: float) -> None:
+        # removing the order first makes sure one cancelled in the meantime is not filled
+        if not get_storage().remove_order(order['id']):
+            return
+
+        try:
+            if order['side'] == 'buy':
+                buy_stock(order['username'], order['ticker'], order['shares'], price)
+            else:
+                sell_stock(order['username'], order['ticker'], order['shares'], price)
+            self.fills += 1
+        except Exception as e:
+            # an order that cannot be filled (funds spent or shares sold since it was placed) is dropped
+            self.rejections += 1
+            print(f'dropped order {order["id"]} of {order["username"]}: {e}')
+
+    async def match(self, snapshot, guild_ids: list = ()) -> int:
+        """Fills the orders crossed by a new price snapshot in every guild partition of this process.
+            Stop-limit orders whose stop is reached are re-indexed by their limit price and fill in the same pass if it is met
+
+            Args:
+                snapshot (PriceSnapshot): the new snapshot
+                guild_ids (list): guilds served by this process, None for the default partition
+
+            Return:
+                int: number of orders filled or dropped
+        """
+        guilds = {partition_key(guild_id): guild_id for guild_id in guild_ids}
+        handled = 0
+        with METRICS.timed('refresh', 'orders'):
+            for guild_id in guilds.values():
+                token = CURRENT_GUILD.set(guild_id)
+                try:
+                    handled += await self._match_partition(snapshot, guild_id)
+                finally:
+                    CURRENT_GUILD.reset(token)
+        return handled
+
+    async def _match_partition(self, snapshot, guild_id: int) -> int:
+        book = self.book(guild_id)
+        handled = 0
+        for ticker, price in snapshot.get_many(book.tickers()).items():
+            crossed = book.crossed(ticker, price)
+            while crossed:
+                for order in crossed:
+                    if order['kind'] == 'stop_limit' and not order['triggered']:
+                        await EXECUTOR.run_io('orders', get_storage().trigger_order, order['id'])
+                        book.add(dict(order, triggered=1))
+                        continue
+
+                    async with USER_LOCKS(order['username']):
+                        await EXECUTOR.run_io('orders', self._fill, order, price)
+                    book.remove(order['id'])
+                    handled += 1
+                crossed = book.crossed(ticker, price)
+        return handled
+
+    def stats(self) -> dict:
+        """Summarizes the matcher
+
+            Return:
+                dict: number of pending orders, fills and dropped orders
+        """
+        with self._lock:
+            books = list(self._books.values())
+        return {
+            'pending': sum(len(book) for book in books),
+            'fills': self.fills,
+            'rejections': self.rejections
+        }
+
+
+# fed by the price refresher, used by the order commands
+ORDER_MATCHER = OrderMatcher()
+METRICS.register_gauge('order_matcher', ORDER_MATCHER.stats)
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+
+def replay_ledger(transactions: list, closes: pd.DataFrame, starting_funds: float) -> pd.DataFrame:
+    """Replays a transactions ledger against daily closing prices to get the value of a portfolio on every day.
+        Trades are scattered into a date by ticker matrix and holdings come from its cumulative sum,
+        so the cost does not depend on how many days pass between trades
+
+        Args:
+            transactions (list): list of transaction dictionaries (date, ticker, price, shares, status)
+            closes (pd.DataFrame): closing prices indexed by trading day with one column per ticker
+            starting_funds (float): cash the portfolio started with
+
+        Return:
+            pd.DataFrame: dataframe of Cash, Holdings (market value of shares) and Value indexed by trading day
+    """
+    dates = closes.index.to_numpy()
+    tickers = {ticker: i for i, ticker in enumerate(closes.columns)}
+
+    trades = np.zeros((len(dates), len(tickers)))
+    cash_flow = np.zeros(len(dates))
+
+    if transactions:
+        # trades made on a non trading day count from the next trading day
+        trade_dates = pd.to_datetime([transaction['date'] for transaction in transactions]).to_numpy()
+        rows = np.minimum(np.searchsorted(dates, trade_dates, side='left'), len(dates) - 1)
+        cols = np.array([tickers[transaction['ticker']] for transaction in transactions])
+        shares = np.array([transaction['shares'] * (1 if transaction['status'] == 'buy' else -1) for transaction in transactions], dtype=float)
+        prices = np.array([transaction['price'] for transaction in transactions], dtype=float)
+
+        np.add.at(trades, (rows, cols), shares)
+        cash_flow = np.bincount(rows, weights=-shares*prices, minlength=len(dates))
+
+    holdings = np.cumsum(trades, axis=0)
+    cash = starting_funds + np.cumsum(cash_flow)
+    market_value = (holdings * np.nan_to_num(closes.ffill().to_numpy())).sum(axis=1)
+
+    return pd.DataFrame({'Cash': cash, 'Holdings': market_value, 'Value': cash + market_value}, index=closes.index)
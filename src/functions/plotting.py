@@ -0,0 +1,219 @@
+import hashlib
+import io
+
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+from functions.analytics import annualized_return
+
+# used in table rendering (pixels)
+TABLE_FONT_SIZE = 14
+TABLE_PADDING = 8
+TABLE_HEADER_COLOR = (230, 230, 250)
+TABLE_STRIPE_COLOR = (245, 245, 245)
+TABLE_LINE_COLOR = (200, 200, 200)
+
+
+def new_figure(figsize: tuple):
+    """Creates a matplotlib figure that is not registered with pyplot.
+        matplotlib takes about half a second to import, so it is only loaded by the first render
+
+        Args:
+            figsize (tuple): width and height in inches
+
+        Return:
+            matplotlib.figure.Figure: empty figure
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize)
+
+
+def to_png(fig) -> bytes:
+    """Renders a figure to png bytes in memory
+
+        Args:
+            fig (matplotlib.figure.Figure): figure to render
+
+        Return:
+            bytes: png image
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    # figures are not registered with pyplot, dropping the canvas frees them
+    fig.clear()
+    return buffer.getvalue()
+
+
+def last_point(data) -> tuple:
+    """Identifies the newest data point of a series, used in plot cache keys
+
+        Args:
+            data (pd.Series or pd.DataFrame): data indexed by date
+
+        Return:
+            tuple: timestamp and value of the last row, and number of rows
+    """
+    if len(data) == 0:
+        return (None, None, 0)
+    value = data.iloc[-1]
+    value = tuple(value) if isinstance(value, pd.Series) else value
+    return (str(data.index[-1]), value, len(data))
+
+
+def content_hash(data: pd.DataFrame) -> str:
+    """Hashes the values and index of a dataframe, used in plot cache keys
+
+        Args:
+            data (pd.DataFrame): data to hash
+
+        Return:
+            str: hex digest
+    """
+    return hashlib.sha1(pd.util.hash_pandas_object(data).to_numpy().tobytes()).hexdigest()
+
+
+def render_price_plot(ticker: str, history: pd.DataFrame) -> bytes:
+    """Plots a stock's close and daily returns
+
+        Args:
+            ticker (str): The ticker of a stock
+            history (pd.DataFrame): history with Close and Returns columns
+
+        Return:
+            bytes: png image
+    """
+    annual_returns = round(annualized_return(history.Returns.to_numpy()), 2)
+
+    fig = new_figure((12,5))
+    ax1, ax2 = fig.subplots(2,1)
+    fig.subplots_adjust(hspace=0.5)
+    ax1.set_title(f'Adjusted close of {ticker}')
+    ax1.plot(history.Close)
+    ax1.set_ylabel('Price')
+    ax1.grid(True)
+    ax2.set_title(f'Returns of {ticker}')
+    ax2.plot(history.Returns)
+    ax2.plot(history.Returns*0, '--')
+    ax2.set_ylabel('Returns')
+    ax2.grid(True)
+    fig.text(.5, 0.02, f'Average annual returns for given period: {annual_returns}%', ha='center')
+
+    return to_png(fig)
+
+
+def render_growth_plot(title: str, growth: pd.DataFrame) -> bytes:
+    """Plots the percent increase of one or more series
+
+        Args:
+            title (str): title of the plot
+            growth (pd.DataFrame): percent increase indexed by date, one column per labelled series
+
+        Return:
+            bytes: png image
+    """
+    fig = new_figure((10,5))
+    ax = fig.subplots()
+    for label in growth.columns:
+        ax.plot(growth[label].dropna(), label=label)
+    ax.set_ylabel('Percentage increase')
+    ax.set_title(title)
+    ax.legend()
+
+    return to_png(fig)
+
+
+def render_backtest_plot(title: str, values: pd.DataFrame) -> bytes:
+    """Plots the value of a backtested portfolio next to the index and the amount invested
+
+        Args:
+            title (str): title of the plot
+            values (pd.DataFrame): Portfolio, index and Invested values indexed by date, from backtest
+
+        Return:
+            bytes: png image
+    """
+    fig = new_figure((10,5))
+    ax = fig.subplots()
+    for label in values.columns:
+        if label == 'Invested':
+            ax.plot(values[label], label=label, color='gray', linestyle='--')
+        else:
+            ax.plot(values[label], label=label)
+    ax.set_ylabel('Value ($)')
+    ax.set_title(title)
+    ax.grid(True)
+    ax.legend()
+
+    return to_png(fig)
+
+
+def render_history_plot(username: str, history: pd.DataFrame, starting_funds: float) -> bytes:
+    """Plots the value of a portfolio over time
+
+        Args:
+            username (str): users name
+            history (pd.DataFrame): performance history with Value and Cash columns
+            starting_funds (float): funds the portfolio started with
+
+        Return:
+            bytes: png image
+    """
+    fig = new_figure((10,5))
+    ax = fig.subplots()
+    ax.plot(history.Value, label='Portfolio value')
+    ax.plot(history.Cash, '--', label='Cash')
+    ax.axhline(starting_funds, color='grey', linewidth=0.8)
+    ax.set_ylabel('Value ($)')
+    ax.set_title(f"{username}'s portfolio value since {history.index[0].date()}")
+    ax.grid(True)
+    ax.legend()
+
+    return to_png(fig)
+
+
+def render_table(columns: list, rows: list) -> bytes:
+    """Draws a table straight onto an image, numbers are right aligned
+
+        Args:
+            columns (list): column headers
+            rows (list): list of rows, each a list of cell values
+
+        Return:
+            bytes: png image
+    """
+    font = ImageFont.load_default(size=TABLE_FONT_SIZE)
+    cells = [[str(header) for header in columns]] + [[str(cell) for cell in row] for row in rows]
+    numeric = [all(isinstance(row[i], (int, float)) for row in rows) for i in range(len(columns))]
+
+    # size every column to its widest cell
+    measure = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+    widths = [max(measure.textlength(row[i], font=font) for row in cells) + 2*TABLE_PADDING for i in range(len(columns))]
+    row_height = TABLE_FONT_SIZE + 2*TABLE_PADDING
+
+    image = Image.new('RGB', (int(sum(widths)) + 1, row_height*len(cells) + 1), 'white')
+    draw = ImageDraw.Draw(image)
+
+    for r, row in enumerate(cells):
+        top = r*row_height
+        if r == 0 or r % 2 == 0:
+            draw.rectangle([0, top, image.width, top + row_height], fill=TABLE_HEADER_COLOR if r == 0 else TABLE_STRIPE_COLOR)
+
+        left = 0
+        for i, cell in enumerate(row):
+            if numeric[i] and r > 0:
+                x = left + widths[i] - TABLE_PADDING - draw.textlength(cell, font=font)
+            else:
+                x = left + TABLE_PADDING
+            draw.text((x, top + TABLE_PADDING), cell, fill='black', font=font)
+            # faux bold header by drawing it twice
+            if r == 0:
+                draw.text((x + 1, top + TABLE_PADDING), cell, fill='black', font=font)
+            left += widths[i]
+
+        draw.line([0, top + row_height, image.width, top + row_height], fill=TABLE_LINE_COLOR)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='png', optimize=False)
+    return buffer.getvalue()
@@ -1,11 +1,16 @@
-import yfinance as yf
 from datetime import date
-from pysondb import db
 import pandas as pd
-from matplotlib import pyplot as plt
+
+from functions.history_store import HISTORY_STORE
+from functions.leaderboard import LEADERBOARDS
+from functions.performance import replay_ledger
+from functions.plotting import content_hash
+from functions.stock_info import get_prices
+from functions.storage import get_storage
+from functions.ticker_store import TICKER_STORE
 
 # constants
-from functions.constants import STARTING_FUNDS, PORTFOLIO_DATA_PATH, TRANSACTIONS_PATH
+from functions.constants import STARTING_FUNDS, BENCHMARK_TICKER
 
 
 class UserProfile:
@@ -36,8 +41,7 @@ def check_user_exists(username: str) -> bool:
         Return:
             bool: boolean of whether the user exists in file
     """
-    profiles = db.getDb(PORTFOLIO_DATA_PATH)
-    return profiles.getByQuery({'username': username}) != []
+    return get_storage().user_exists(username)
 
 
 def create_user_profile(username: str) -> bool:
@@ -49,13 +53,11 @@ def create_user_profile(username: str) -> bool:
         Return:
             bool: True if profile was created, False if it already exists
     """
-    profiles = db.getDb(PORTFOLIO_DATA_PATH)
-
-    if profiles.getByQuery({'username': username}):
-        return False
-    else:
-        profiles.add(UserProfile(username).__dict__)
-        return True
+    profile = UserProfile(username).__dict__
+    created = get_storage().add_profile(profile)
+    if created:
+        LEADERBOARDS.on_trade(username, profile['funds_available'], profile['portfolio'])
+    return created
 
 
 def get_profile(username: str) -> dict:
@@ -67,8 +69,7 @@ def get_profile(username: str) -> dict:
         Return:
             dict: dictionary of user's profile, returns None if user does not exist
     """
-    profiles = db.getDb(PORTFOLIO_DATA_PATH)
-    return profiles.getByQuery({'username': username})[0]
+    return get_storage().get_profile(username)
 
 
 def get_current_prices(tickers: list) -> dict:
@@ -79,26 +80,53 @@ def get_current_prices(tickers: list) -> dict:
         return:
             dict: dictionary of tickers and their current prices
     """
-    tickers = [ticker.upper() for ticker in tickers]
-    response = yf.Tickers(tickers)
+    return get_prices(tickers)
+
+
+def snapshot_prices(snapshot, portfolio: dict) -> tuple:
+    """Prices a portfolio from a price snapshot.
+        Holdings the snapshot does not know yet (e.g. just bought) are fetched once,
+        the ones without any price are valued at their average price
+
+        Args:
+            snapshot (PriceSnapshot): snapshot published by the price refresher
+            portfolio (dict): dictionary of ticker to holding
+
+        Return:
+            tuple: dictionary of tickers and their prices, and list of tickers valued at their average price
+    """
+    prices = snapshot.get_many(list(portfolio))
+    missing = [ticker for ticker in portfolio if ticker not in prices]
+    if missing:
+        try:
+            prices.update(get_prices(missing, missing_ok=True))
+        except Exception as e:
+            print(f'failed to price {", ".join(missing)}: {e}')
 
-    return {ticker: response.tickers[ticker].info['currentPrice'] for ticker in tickers}
+    estimated = [ticker for ticker in portfolio if ticker not in prices]
+    return {ticker: prices.get(ticker, portfolio[ticker]['average_price']) for ticker in portfolio}, estimated
 
 
-def profile_summary(username: str) -> dict:
+def profile_summary(username: str, snapshot=None) -> dict:
     """Sends a brief summary of the user's profile
     
         Args:
             username (str): users name
+            snapshot (PriceSnapshot): prices to use, None to fetch current prices
             
         Return:
-            dict: dictionary of user's profile, returns None if user does not exist
+            dict: dictionary of user's profile with current_stock_values, current_value and estimated
+                (tickers valued at their average price), returns None if user does not exist
     """
     profile = get_profile(username)
 
     if profile:
         stocks_owned = list(profile['portfolio'].keys())
-        profile['current_stock_values'] = get_current_prices(stocks_owned)
+        if snapshot is None:
+            profile['current_stock_values'] = get_current_prices(stocks_owned)
+            profile['estimated'] = []
+        else:
+            profile['current_stock_values'], profile['estimated'] = snapshot_prices(snapshot, profile['portfolio'])
         profile['current_value'] = profile['funds_available'] + sum([profile['portfolio'][ticker]['shares']*profile['current_stock_values'][ticker] for ticker in profile['portfolio']])
         return profile
     else:
@@ -118,27 +146,9 @@ def get_available_funds(username: str) -> float:
     return profile['funds_available'] if profile else None
 
 
-def record_transaction(username: str, ticker: str, price: float, shares: int, status: str) -> None:
-    """Records a stock transaction
-
-        Args:
-            user (str): users name
-            ticker (str): the stocks ticker
-            price (float): current price of stock
-            shares (int): the amount of shares in transaction
-            status (str): the status of the transaction (buy/sell)
-    """
-    profile = get_profile(username)
-
-    # assumes 'buy stock' has already been called so the remaining funds is already updated
-    remaining_funds = profile['funds_available']
-
-    transactions = db.getDb(TRANSACTIONS_PATH)
-    transactions.add(Transaction(username, ticker.upper(), price, shares, status, remaining_funds).__dict__)
-
-
 def buy_stock(username: str, ticker: str, amount: int, price: float) -> None:
-    """Buys a stock for a given user. Assumed that the user has enough funds for the transaction
+    """Buys a stock for a given user. The profile is read once and the updated holding and
+        transaction are written together. Callers should serialize trades of the same user (see USER_LOCKS)
     
         Args:
             user (str): users name
@@ -153,31 +163,27 @@ def buy_stock(username: str, ticker: str, amount: int, price: float) -> None:
         new_funds = round(profile['funds_available'] - (amount * price), 2)
         portfolio = profile['portfolio']
 
+        if new_funds < 0:
+            raise Exception(f'You cant afford {amount} shares right now')
+
         # ticker is in portfolio
         if ticker in portfolio:
             portfolio[ticker]['average_price'] = (portfolio[ticker]['average_price']*portfolio[ticker]['shares'] + price*amount)/(amount+portfolio[ticker]['shares'])
             portfolio[ticker]['shares'] += amount
         # ticker is not in portfolio
         else:
-            stock = yf.Ticker(ticker.upper())
+            metadata = TICKER_STORE.get(ticker)
             portfolio[ticker] = {
-                'name': stock.info['longName'],
+                'name': metadata['name'],
                 'shares': amount,
                 'average_price': price,
-                'currency': stock.info['financialCurrency']
+                'currency': metadata['currency']
             }
         
-        updated_profile = {
-            'funds_available': new_funds,
-            'portfolio': portfolio
-        }
-
-        # update database
-        profiles = db.getDb(PORTFOLIO_DATA_PATH)
-        profiles.updateById(pk=profile['id'], new_data=updated_profile)
-
-        # record transaction
-        record_transaction(username, ticker, price, amount, 'buy')
+        # update database and record transaction
+        transaction = Transaction(username, ticker, price, amount, 'buy', new_funds)
+        get_storage().apply_trade(username, new_funds, ticker, portfolio[ticker], transaction.__dict__)
+        LEADERBOARDS.on_trade(username, new_funds, portfolio)
     else:
         raise Exception('User does not exist')
 
@@ -191,8 +197,8 @@ def check_user_owns_stock(username: str, ticker: str) -> bool:
             
         Return:
             bool: boolean of whether the user owns the stock"""
-    profile = db.getDb(PORTFOLIO_DATA_PATH).getByQuery({'username': username})
-    return ticker.upper() in profile[0]['portfolio']
+    profile = get_profile(username)
+    return profile is not None and ticker.upper() in profile['portfolio']
 
 
 def get_stock_info(username: str, ticker: str) -> dict:
@@ -204,12 +210,12 @@ def get_stock_info(username: str, ticker: str) -> dict:
         
         Return:
             dict: dictionary of the average price and number of shares"""
-    profile = db.getDb(PORTFOLIO_DATA_PATH).getByQuery({'username': username})
-    return profile[0]['portfolio'][ticker.upper()]
+    return get_profile(username)['portfolio'][ticker.upper()]
 
 
 def sell_stock(username: str, ticker: str, amount: int, price: float) -> None:
-    """Sells a stock for a given user. Assumed that the user own enough shares for transaction
+    """Sells a stock for a given user. The profile is read once and the updated holding and
+        transaction are written together. Callers should serialize trades of the same user (see USER_LOCKS)
     
         Args:
             user (str): users name
@@ -225,6 +231,9 @@ def sell_stock(username: str, ticker: str, amount: int, price: float) -> None:
 
         # ticker is in portfolio
         if ticker in portfolio:
+            if amount > portfolio[ticker]['shares']:
+                raise Exception('You dont own that many shares!')
+
             portfolio[ticker]['shares'] -= amount
             
             if portfolio[ticker]['shares'] == 0:
@@ -233,68 +242,194 @@ def sell_stock(username: str, ticker: str, amount: int, price: float) -> None:
         else:
             raise Exception('User does not own this stock')
         
-        updated_profile = {
-            'funds_available': new_funds,
-            'portfolio': portfolio
-        }
+        # update database and record transaction
+        transaction = Transaction(username, ticker, price, amount, 'sell', new_funds)
+        get_storage().apply_trade(username, new_funds, ticker, portfolio.get(ticker), transaction.__dict__)
+        LEADERBOARDS.on_trade(username, new_funds, portfolio)
+    else:
+        raise Exception('User does not exist')
 
-        # update database
-        profiles = db.getDb(PORTFOLIO_DATA_PATH)
-        profiles.updateById(pk=profile['id'], new_data=updated_profile)
 
-        # record transaction
-        record_transaction(username, ticker, price, amount, 'sell')
-    else:
+def parse_order(order: str) -> list:
+    """Parses a basket of trades, e.g. 'buy AAPL 10, sell TSLA 5, buy MSFT 3'
+
+        Args:
+            order (str): comma separated trades, each one 'buy' or 'sell', a ticker and a whole number of shares
+
+        Return:
+            list: list of (status, ticker, amount) tuples in the order given
+    """
+    legs = []
+    for leg in order.split(','):
+        parts = leg.split()
+        if not parts:
+            continue
+        if len(parts) != 3 or parts[0].lower() not in ('buy', 'sell') or not parts[2].isdigit() or int(parts[2]) == 0:
+            raise Exception(f'Could not read "{leg.strip()}", write every trade as buy/sell, ticker and shares, e.g. buy AAPL 10')
+        legs.append((parts[0].lower(), parts[1].upper(), int(parts[2])))
+
+    if not legs:
+        raise Exception('The order is empty')
+    return legs
+
+
+def execute_order(username: str, legs: list, prices: dict) -> float:
+    """Applies a basket of trades for a given user. Sells are applied before buys so their proceeds can pay
+        for the buys, funds only need to cover the basket as a whole. Every trade is written in one
+        database transaction, if any trade fails none are made. Callers should serialize trades of the same user (see USER_LOCKS)
+
+        Args:
+            user (str): users name
+            legs (list): list of (status, ticker, amount) tuples, from parse_order
+            prices (dict): dictionary of tickers and their current prices
+
+        Return:
+            float: funds available after the order
+    """
+    profile = get_profile(username)
+    if not profile:
         raise Exception('User does not exist')
 
+    funds = profile['funds_available']
+    portfolio = profile['portfolio']
+    traded = {}
+    transactions = []
+
+    for status, ticker, amount in sorted(legs, key=lambda leg: leg[0] != 'sell'):
+        price = prices[ticker]
+        if status == 'sell':
+            if ticker not in portfolio:
+                raise Exception(f'User does not own {ticker}')
+            if amount > portfolio[ticker]['shares']:
+                raise Exception(f'You dont own {amount} shares of {ticker}!')
+
+            funds = round(funds + amount * price, 2)
+            portfolio[ticker]['shares'] -= amount
+            if portfolio[ticker]['shares'] == 0:
+                del portfolio[ticker]
+        else:
+            funds = round(funds - amount * price, 2)
+            if funds < 0:
+                raise Exception(f'You cant afford this order, it costs ${round(-funds, 2)} more than you have')
+
+            if ticker in portfolio:
+                portfolio[ticker]['average_price'] = (portfolio[ticker]['average_price']*portfolio[ticker]['shares'] + price*amount)/(amount+portfolio[ticker]['shares'])
+                portfolio[ticker]['shares'] += amount
+            else:
+                metadata = TICKER_STORE.get(ticker)
+                portfolio[ticker] = {
+                    'name': metadata['name'],
+                    'shares': amount,
+                    'average_price': price,
+                    'currency': metadata['currency']
+                }
+
+        traded[ticker] = portfolio.get(ticker)
+        transactions.append(Transaction(username, ticker, price, amount, status, funds).__dict__)
+
+    get_storage().apply_trades(username, funds, traded, transactions)
+    LEADERBOARDS.on_trade(username, funds, portfolio)
+    return funds
+
 
 def get_performance_history(username: str) -> pd.DataFrame:
-    """Gets the historical performance of a users portfolio
+    """Gets the historical performance of a users portfolio by replaying their transactions
+        against daily closing prices since the profile was created
     
         Args:
             user (str): users name
         
         Return:
-            pd.DataFrame: dataframe of the portfolio performance history"""
-    transactions = db.getDb(TRANSACTIONS_PATH).getByQuery({'username': username})
-    
-    creation_date = get_profile(username)['create_date']
+            pd.DataFrame: dataframe of Cash, Holdings and Value on every trading day"""
+    profile = get_profile(username)
+    if not profile:
+        raise Exception('User does not exist')
+
+    transactions = get_storage().get_transactions(username)
+    start = date.fromisoformat(profile['create_date'])
+
+    # the s&p 500 provides the trading calendar, other tickers are aligned onto it
+    calendar = HISTORY_STORE.get(BENCHMARK_TICKER, start).index
+    if len(calendar) == 0:
+        raise Exception('No trading days since the profile was created yet')
 
     # get all unique tickers in transactions
-    tickers = list(set([transaction['ticker'] for transaction in transactions]))
+    tickers = sorted(set(transaction['ticker'] for transaction in transactions))
+    closes = pd.DataFrame({ticker: HISTORY_STORE.get(ticker, start).Close for ticker in tickers}, index=calendar, columns=tickers)
 
-    history = yf.download(tickers, start=creation_date, end=date.today())
+    return replay_ledger(transactions, closes, STARTING_FUNDS)
 
-    print(history)
 
+def history_plot_key(username: str, history: pd.DataFrame) -> tuple:
+    """Cache key of a portfolio history plot, changes with any change in the history
 
-def plot_history(username: str) -> None:
-    pass
+        Args:
+            user (str): users name
+            history (pd.DataFrame): performance history from get_performance_history
+
+        Return:
+            tuple: cache key
+    """
+    return ('history', username, content_hash(history))
 
 
-def get_leaderboard() -> dict:
+def get_leaderboard(snapshot=None) -> dict:
     """Generates a leaderboard of all users and their current portfolio values
     
+        Args:
+            snapshot (PriceSnapshot): prices to use, None to fetch current prices
+
         Return:
             dict: dictionary of all users and their current portfolio values"""
-    profiles = db.getDb(PORTFOLIO_DATA_PATH).getAll()
+    profiles = get_storage().get_all_profiles()
+
+    # every unique ticker is fetched once for all users
+    if snapshot is None:
+        tickers = set(ticker for profile in profiles for ticker in profile['portfolio'])
+        prices = get_current_prices(list(tickers))
+
     leaderboard = {}
     for profile in profiles:
-        stocks_owned = list(profile['portfolio'].keys())
-        prices = get_current_prices(stocks_owned)
+        if snapshot is not None:
+            prices, _ = snapshot_prices(snapshot, profile['portfolio'])
         leaderboard[profile['username']] = round(profile['funds_available'] + sum([profile['portfolio'][ticker]['shares']*prices[ticker] for ticker in profile['portfolio']]),2)
     
     return leaderboard
 
 
 def day_performance() -> dict:
-    pass
+    """Gets how much every portfolio gained or lost on the last trading day, from the two most recent
+        end of day values. Portfolios created that day are compared to the starting funds
+
+        Return:
+            dict: date of the last trading day and a dictionary of username to value, previous_value,
+                change and percent_change (None if the previous value was 0), None if less than two days were recorded
+    """
+    days = get_storage().get_nav_dates(2)
+    if len(days) < 2:
+        return None
+
+    today = get_storage().get_nav(days[0])
+    previous = get_storage().get_nav(days[1])
+
+    performance = {}
+    for username, value in today.items():
+        previous_value = previous.get(username, STARTING_FUNDS)
+        performance[username] = {
+            'value': value,
+            'previous_value': previous_value,
+            'change': round(value - previous_value, 2),
+            # a portfolio with nothing left has no percent change
+            'percent_change': round((value - previous_value) / previous_value * 100, 2) if previous_value else None
+        }
+
+    return {'date': days[0], 'performance': performance}
 
 def plot_comparison() -> None:
     pass
 
 if __name__ == "__main__":
-    get_performance_history('billjohn')
+    print(get_performance_history('billjohn'))
 
     pass
     
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+from datetime import datetime
+from types import MappingProxyType
+from typing import NamedTuple
+
+from functions.executor import EXECUTOR
+from functions.guilds import default_guilds
+from functions.market_hours import market_now, is_market_open, next_market_open
+from functions.metrics import METRICS
+from functions.quote_cache import QUOTE_CACHE
+from functions.stock_info import download_prices
+from functions.storage import get_storages
+
+# constants
+from functions.constants import REFRESH_INTERVAL_MARKET_OPEN, REFRESH_INTERVAL_MARKET_CLOSED
+
+
+class PriceSnapshot(NamedTuple):
+    """Prices of every held ticker as of one refresh, never modified once published"""
+    prices: MappingProxyType
+    timestamp: datetime
+
+    def age(self) -> float:
+        """Gets how old the snapshot is
+
+            Return:
+                float: seconds since the prices were downloaded
+        """
+        return (market_now() - self.timestamp).total_seconds()
+
+    def get_many(self, tickers: list) -> dict:
+        """Looks up several tickers without any upstream request.
+            Tickers bought after the snapshot was taken fall back to the quote cache
+
+            Args:
+                tickers (list): list of tickers
+
+            Return:
+                dict: dictionary of tickers and their prices, tickers with no known price are left out
+        """
+        prices = {}
+        for ticker in tickers:
+            ticker = ticker.upper()
+            price = self.prices.get(ticker)
+            if price is None:
+                price = QUOTE_CACHE.get(ticker)
+            if price is not None:
+                prices[ticker] = price
+        return prices
+
+
+class PriceRefresher:
+    """Keeps a snapshot of the prices of every ticker held by any user or with a pending order.
+        Each refresh downloads all of them in one batch, every minute while the market is
+        open and every half hour (or at the next open, whichever is sooner) while it is closed
+    """
+    def __init__(self, interval_open: float = REFRESH_INTERVAL_MARKET_OPEN,
+                 interval_closed: float = REFRESH_INTERVAL_MARKET_CLOSED) -> None:
+        # returns the ids of the guilds served by this process, set by run
+        self.guilds = default_guilds
+        self.interval_open = interval_open
+        self.interval_closed = interval_closed
+        self.snapshot = None
+        # coroutines awaited with every new snapshot and the guild ids, e.g. the order matcher
+        self.subscribers = []
+        self.refreshes = 0
+        self.failures = 0
+
+    def interval(self) -> float:
+        """Gets the time until the next refresh based on market hours
+
+            Return:
+                float: seconds to wait
+        """
+        now = market_now()
+        if is_market_open(now):
+            return self.interval_open
+        return min(self.interval_closed, (next_market_open(now) - now).total_seconds())
+
+    def subscribe(self, callback) -> None:
+        """Registers a coroutine function awaited after every refresh
+
+            Args:
+                callback (callable): called with the new snapshot and the guild ids served by this process
+        """
+        self.subscribers.append(callback)
+
+    @METRICS.timed('refresh', 'prices')
+    def refresh(self) -> PriceSnapshot:
+        """Downloads the prices of every ticker held or with a pending order in any guild and publishes them as a new snapshot.
+            Tickers that could not be priced keep their price from the previous snapshot
+
+            Return:
+                PriceSnapshot: the new snapshot
+        """
+        storages = get_storages(self.guilds())
+        tickers = sorted(set(ticker for storage in storages for ticker in storage.get_held_tickers() + storage.get_order_tickers()))
+        prices = download_prices(tickers, missing_ok=True) if tickers else {}
+
+        if self.snapshot is not None:
+            for ticker in tickers:
+                if ticker not in prices and ticker in self.snapshot.prices:
+                    prices[ticker] = self.snapshot.prices[ticker]
+
+        for ticker, price in prices.items():
+            QUOTE_CACHE.put(ticker, price)
+
+        self.snapshot = PriceSnapshot(MappingProxyType(prices), market_now())
+        self.refreshes += 1
+        return self.snapshot
+
+    async def run(self, guilds=None) -> None:
+        """Refreshes the snapshot forever and hands every new snapshot to the subscribers, a failed refresh keeps the previous snapshot
+
+            Args:
+                guilds (callable): returns the ids of the guilds served by this process, None for the default partition
+        """
+        self.guilds = guilds or default_guilds
+        while True:
+            try:
+                snapshot = await EXECUTOR.run_io('refresh', self.refresh)
+            except Exception as e:
+                self.failures += 1
+                print(f'failed to refresh prices: {e}')
+            else:
+                for callback in self.subscribers:
+                    try:
+                        await callback(snapshot, self.guilds())
+                    except Exception as e:
+                        print(f'failed to publish prices to {callback.__qualname__}: {e}')
+            await asyncio.sleep(self.interval())
+
+    def stats(self) -> dict:
+        """Summarizes the refresher
+
+            Return:
+                dict: number of refreshes and failures, size and age of the snapshot
+        """
+        return {
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'tickers': len(self.snapshot.prices) if self.snapshot else 0,
+            'age': self.snapshot.age() if self.snapshot else -1
+        }
+
+
+# started by main.py, read by $summary and $rankings
+PRICE_REFRESHER = PriceRefresher()
+METRICS.register_gauge('price_refresher', PRICE_REFRESHER.stats)
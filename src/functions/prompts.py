@@ -0,0 +1,25 @@
+import time
+
+# constants
+from functions.constants import PROMPT_TIMEOUT
+
+
+async def wait_for_reply(bot, ctx, timeout: float = PROMPT_TIMEOUT):
+    """Waits for the author of a command to answer its prompt in the same channel.
+        The time spent waiting on the user is left out of the command's latency (main.py times commands from ctx.start_time)
+
+        Args:
+            bot (commands.Bot): the bot
+            ctx (commands.Context): context of the command asking
+            timeout (float): seconds to wait before giving up
+
+        Return:
+            discord.Message: the reply
+    """
+    start = time.perf_counter()
+    try:
+        return await bot.wait_for('message',
+                                  check=lambda message:message.author == ctx.author and message.channel.id == ctx.channel.id,
+                                  timeout=timeout)
+    finally:
+        ctx.start_time += time.perf_counter() - start
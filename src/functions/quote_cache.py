@@ -0,0 +1,117 @@
+import time
+import threading
+from collections import OrderedDict
+
+from functions.market_hours import is_market_open
+from functions.metrics import METRICS
+
+# constants
+from functions.constants import QUOTE_CACHE_SIZE, QUOTE_TTL_MARKET_OPEN, QUOTE_TTL_MARKET_CLOSED
+
+
+class QuoteCache:
+    """Process wide LRU cache of ticker prices.
+        Entries expire after a short ttl while the market is open and a long one after close
+    """
+    def __init__(self, max_size: int = QUOTE_CACHE_SIZE,
+                 ttl_open: float = QUOTE_TTL_MARKET_OPEN, ttl_closed: float = QUOTE_TTL_MARKET_CLOSED) -> None:
+        self.max_size = max_size
+        self.ttl_open = ttl_open
+        self.ttl_closed = ttl_closed
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl(self) -> float:
+        """Gets the time to live of new entries based on market hours
+
+            Return:
+                float: ttl in seconds
+        """
+        return self.ttl_open if is_market_open() else self.ttl_closed
+
+    def get(self, ticker: str) -> float:
+        """Gets a cached price
+
+            Args:
+                ticker (str): the stocks ticker
+
+            Return:
+                float: cached price, None if missing or expired
+        """
+        ticker = ticker.upper()
+
+        with self._lock:
+            entry = self._entries.get(ticker)
+
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[ticker]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(ticker)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, ticker: str, price: float) -> None:
+        """Stores a price, evicting the least recently used entries if the cache is full
+
+            Args:
+                ticker (str): the stocks ticker
+                price (float): current price of stock
+        """
+        ticker = ticker.upper()
+        expires = time.monotonic() + self.ttl()
+
+        with self._lock:
+            self._entries[ticker] = (price, expires)
+            self._entries.move_to_end(ticker)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_many(self, tickers: list) -> tuple:
+        """Looks up several tickers at once
+
+            Args:
+                tickers (list): list of tickers
+
+            Return:
+                tuple: dictionary of cached prices and list of tickers that were not cached
+        """
+        found = {}
+        missing = []
+        for ticker in tickers:
+            price = self.get(ticker)
+            if price is None:
+                missing.append(ticker.upper())
+            else:
+                found[ticker.upper()] = price
+
+        return found, missing
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Summarizes cache usage
+
+            Return:
+                dict: size, hits, misses and hit ratio of the cache
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0
+            }
+
+
+# shared by every price lookup in the bot
+QUOTE_CACHE = QuoteCache()
+METRICS.register_gauge('quote_cache', QUOTE_CACHE.stats)
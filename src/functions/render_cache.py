@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+from functions.metrics import METRICS
+
+# constants
+from functions.constants import PLOT_CACHE_SIZE
+
+
+class RenderCache:
+    """LRU cache of rendered images keyed by what was plotted,
+        so identical requests reuse the png instead of rendering it again
+    """
+    def __init__(self, max_size: int = PLOT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> bytes:
+        """Gets a rendered image
+
+            Args:
+                key (tuple): identifies the plot and the data it was drawn from
+
+            Return:
+                bytes: png image, None if not cached
+        """
+        with self._lock:
+            png = self._entries.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key: tuple, png: bytes) -> None:
+        """Stores a rendered image, evicting the least recently used ones if the cache is full
+
+            Args:
+                key (tuple): identifies the plot and the data it was drawn from
+                png (bytes): png image
+        """
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Summarizes cache usage
+
+            Return:
+                dict: size, hits, misses and hit ratio of the cache
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0
+            }
+
+
+# shared by every plot the bot sends
+PLOT_CACHE = RenderCache()
+METRICS.register_gauge('plot_cache', PLOT_CACHE.stats)
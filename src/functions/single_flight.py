@@ -0,0 +1,81 @@
+import threading
+
+from functions.metrics import METRICS
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+        The first caller runs the function, callers arriving while it is still running wait for it
+        and get the same result, or the same exception if it failed.
+        Nothing is cached, the next call after it finishes runs the function again
+    """
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: tuple, func, *args):
+        """Runs func, or waits for the identical call that is already running
+
+            Args:
+                key (tuple): identifies the call, e.g. ('price', 'AAPL')
+                func (callable): function to run
+                *args: arguments passed to func
+
+            Return:
+                result of func, shared by every caller of the same flight so it should not be modified
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+            if call is None:
+                call = self._in_flight[key] = _Call()
+                leader = True
+                self.calls += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        """Summarizes coalescing
+
+            Return:
+                dict: calls that ran, calls that were coalesced into another and calls running now
+        """
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._in_flight)
+            }
+
+
+# shared by every upstream market data request
+SINGLE_FLIGHT = SingleFlight()
+METRICS.register_gauge('single_flight', SINGLE_FLIGHT.stats)
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+from functions.metrics import METRICS
+
+# constants
+from functions.constants import CPU_WORKERS
+
+
+class StartupTimer:
+    """Records how long each step of starting the bot takes (imports, loading cogs, connecting, warming up)
+        and prints them as one report. Steps are also recorded in METRICS under the startup family
+    """
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.steps = []
+
+    def record(self, group: str, name: str, seconds: float) -> None:
+        """Records one step
+
+            Args:
+                group (str): kind of step, e.g. import or cog
+                name (str): what was done, e.g. discord or stock_data_commands
+                seconds (float): how long it took
+        """
+        self.steps.append((group, name, seconds))
+        METRICS.observe('startup', f'{group}.{name}', seconds)
+
+    def timed(self, group: str, name: str):
+        """Times a block as one step
+
+            usage:
+                with STARTUP.timed('import', 'discord'):
+                    import discord
+        """
+        return _Step(self, group, name)
+
+    def elapsed(self) -> float:
+        """Gets the time since the process started importing the bot
+
+            Return:
+                float: seconds since start
+        """
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        """Summarizes every step recorded so far
+
+            Return:
+                str: one line per step and the total per group
+        """
+        lines = ['startup timings:']
+        totals = {}
+        for group, name, seconds in self.steps:
+            lines.append(f'  {group:<8} {name:<28} {seconds:>8.3f}s')
+            totals[group] = totals.get(group, 0) + seconds
+
+        lines.append('  ' + ', '.join(f'{group} {seconds:.3f}s' for group, seconds in totals.items()))
+        lines.append(f'  {self.elapsed():.3f}s since start')
+        return '\n'.join(lines)
+
+
+class _Step:
+    def __init__(self, timer: StartupTimer, group: str, name: str) -> None:
+        self.timer = timer
+        self.group = group
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        self.timer.record(self.group, self.name, time.perf_counter() - self.start)
+        return False
+
+
+def warm_renderer() -> None:
+    """Imports matplotlib and renders a blank figure, run on every process pool worker"""
+    from functions.plotting import new_figure, to_png
+    to_png(new_figure((1, 1)))
+
+
+def _load_yfinance() -> None:
+    from functions.lazy import load
+    load('yfinance')
+
+
+def _open_storage() -> None:
+    from functions.storage import get_storage
+    get_storage()
+
+
+def _load_todo_list() -> None:
+    from functions.todo_list import get_todo_log
+    get_todo_log()
+
+
+def _load_indices() -> None:
+    from functions.index_store import INDEX_STORE
+    INDEX_STORE.warm()
+
+
+def _clean_history() -> None:
+    from functions.history_store import HISTORY_STORE
+    HISTORY_STORE.cleanup()
+
+
+def _load_tickers(guild_ids: list) -> None:
+    from functions.storage import get_storages
+    from functions.ticker_store import TICKER_STORE
+    TICKER_STORE.prepopulate([ticker for storage in get_storages(guild_ids) for ticker in storage.get_held_tickers()])
+
+
+async def prewarm(guilds=None) -> None:
+    """Does the slow first time work of commands while the bot is idle after connecting:
+        finishes the lazy imports, starts the render processes, opens the databases, loads the market indices
+        and fetches the metadata of every held ticker, old history versions left behind by the last run are removed
+
+        Args:
+            guilds (callable): returns the ids of the guilds served by this process, None for the default partition
+    """
+    from functions.executor import EXECUTOR
+    from functions.guilds import default_guilds
+
+    async def step(name: str, run) -> None:
+        start = time.perf_counter()
+        try:
+            await run()
+        except Exception as e:
+            print(f'failed to prewarm {name}: {e}')
+        STARTUP.record('prewarm', name, time.perf_counter() - start)
+
+    await step('yfinance', lambda: EXECUTOR.run_io('prewarm', _load_yfinance))
+    await step('renderers', lambda: asyncio.gather(*[EXECUTOR.run_cpu('prewarm', warm_renderer) for _ in range(CPU_WORKERS)]))
+    await step('storage', lambda: EXECUTOR.run_io('prewarm', _open_storage))
+    await step('todo_list', lambda: EXECUTOR.run_io('prewarm', _load_todo_list))
+    await step('indices', lambda: EXECUTOR.run_io('prewarm', _load_indices))
+    await step('history', lambda: EXECUTOR.run_io('prewarm', _clean_history))
+    await step('tickers', lambda: EXECUTOR.run_io('prewarm', _load_tickers, (guilds or default_guilds)()))
+
+    print(STARTUP.report())
+
+
+# started when main.py is imported
+STARTUP = StartupTimer()
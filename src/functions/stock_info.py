@@ -1,13 +1,23 @@
 import random
 from datetime import date
 
-import numpy as np
 import pandas as pd
-import yfinance as yf
-from matplotlib import pyplot as plt
+
+from functions.analytics import daily_returns, summarize_growth
+from functions.history_store import HISTORY_STORE
+from functions.index_store import INDEX_STORE
+from functions.lazy import lazy_import
+from functions.metrics import METRICS
+from functions.plotting import last_point
+from functions.quote_cache import QUOTE_CACHE
+from functions.single_flight import SINGLE_FLIGHT
+from functions.ticker_store import TICKER_STORE
 
 # constants
-from functions.constants import VALID_PERIODS, PRICE_PLOT_PATH, GROWTH_PLOT_PATH, INCLUDE_FIELDS
+from functions.constants import VALID_PERIODS, INCLUDE_FIELDS, DEFAULT_INDEX
+
+# imported on first use, yfinance is slow to import
+yf = lazy_import('yfinance')
 
 
 def get_history(ticker: str, period: str) -> pd.DataFrame:
@@ -25,53 +35,36 @@ def get_history(ticker: str, period: str) -> pd.DataFrame:
         raise Exception('Period not defined')
 
     try:
-        data = yf.Ticker(ticker)
-        history = data.history(period=period).dropna()
-        returns = [(history.Close[x] / history.Close[x-1] - 1) for x in range(1,len(history.Close))]
-        returns.insert(0,0)
-        history['Returns'] = returns
-
-        if returns == [] or returns == [0]:
-            raise Exception('Ticker not found')
-        
-        return history
+        # concurrent requests of the same history share one load, each caller gets its own copy
+        history = SINGLE_FLIGHT.do(('history', ticker.upper(), period), _load_history, ticker, period)
+        return history.copy()
     
     except Exception as e:
         raise e
 
 
-def plot_ticker(ticker: str, period='ytd') -> None:
-    """Saves a plot of a stock's close and daily returns for a given period
-        plot is saved as PRICE_PLOT
+def _load_history(ticker: str, period: str) -> pd.DataFrame:
+    history = HISTORY_STORE.get_period(ticker, period).dropna()
+
+    if len(history) < 2:
+        raise Exception('Ticker not found')
+
+    history['Returns'] = daily_returns(history.Close.to_numpy())
+    return history
+
+
+def price_plot_key(ticker: str, period: str, history: pd.DataFrame) -> tuple:
+    """Cache key of a price plot, changes whenever a newer or updated close comes in
 
     Args:
         ticker (str): The ticker of a stock
-        period (str): The period for which stock data is plotted
-            valid periods: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max
-            (default is year to date)
-    """
-
-    try:
-        history = get_history(ticker, period)
-        annual_returns = 100*round((1+np.mean(history.Returns))**252 - 1, 4)
-
-        # plotting the data
-        fig, (ax1, ax2) = plt.subplots(2,1, figsize=(12,5))
-        fig.subplots_adjust(hspace=0.5)
-        ax1.set_title(f'Adjusted close of {ticker}')
-        ax1.plot(history.Close)
-        ax1.set_ylabel('Price')
-        ax1.grid(True)
-        ax2.set_title(f'Returns of {ticker}')
-        ax2.plot(history.Returns)
-        ax2.plot(history.Returns*0, '--')
-        ax2.set_ylabel('Returns')
-        ax2.grid(True)
-        fig.text(.5, 0.02, f'Average annual returns for given period: {annual_returns}%', ha='center')
-        fig.savefig(PRICE_PLOT_PATH)
+        period (str): The period of the plot
+        history (pd.DataFrame): the plotted history
 
-    except Exception as e:
-        raise e
+    Returns:
+        tuple: cache key
+    """
+    return ('price', ticker.upper(), period) + last_point(history.Close)
     
 
 def get_price(ticker: str) -> float:
@@ -84,14 +77,85 @@ def get_price(ticker: str) -> float:
             int: price of stock
     """
 
-    try:
-        data = yf.Ticker(ticker)
-        return data.info['currentPrice']
-    
-    except Exception as e:
-        print(e)
+    price = QUOTE_CACHE.get(ticker)
+    if price is not None:
+        return price
+
+    # symbols yahoo recently did not know are rejected without a request
+    if TICKER_STORE.is_invalid(ticker):
         raise Exception('Ticker not found')
 
+    # a burst of lookups of the same ticker makes one request
+    return SINGLE_FLIGHT.do(('price', ticker.upper()), _fetch_price, ticker)
+
+
+def _fetch_price(ticker: str) -> float:
+    # a quote download is much lighter than the full info payload
+    price = download_prices([ticker], missing_ok=True).get(ticker.upper())
+    if price is None:
+        # an empty download can also be a network error or rate limit, only the metadata lookup
+        # decides that a ticker does not exist (and remembers it as invalid)
+        TICKER_STORE.get(ticker)
+        raise Exception(f'Could not get the price of {ticker.upper()} right now, please try again later')
+
+    QUOTE_CACHE.put(ticker, price)
+    return price
+
+
+def get_prices(tickers: list, missing_ok: bool = False) -> dict:
+    """Checks the current price of a list of stocks, only tickers missing from the quote cache are requested
+        
+        Args:
+            tickers (list): list of tickers to get prices for
+            missing_ok (bool): leave out tickers without a price instead of raising
+        
+        Return:
+            dict: dictionary of tickers and their current prices
+    """
+    prices, missing = QUOTE_CACHE.get_many(tickers)
+
+    if missing:
+        for ticker, price in download_prices(missing, missing_ok).items():
+            prices[ticker] = price
+            QUOTE_CACHE.put(ticker, price)
+
+    return prices
+
+
+def download_prices(tickers: list, missing_ok: bool = False) -> dict:
+    """Fetches the latest price of every ticker in a single batched download
+        
+        Args:
+            tickers (list): list of tickers to get prices for
+            missing_ok (bool): leave out tickers without a price instead of raising
+        
+        Return:
+            dict: dictionary of tickers and their latest prices
+    """
+    tickers = sorted(set(ticker.upper() for ticker in tickers))
+    with METRICS.timed('yfinance', 'download'):
+        data = yf.download(tickers, period='5d', progress=False)
+
+    if len(data) == 0:
+        if missing_ok:
+            return {}
+        raise Exception(f'Ticker not found: {", ".join(tickers)}')
+
+    closes = data['Close']
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(tickers[0])
+    latest = closes.ffill().iloc[-1]
+
+    prices = {}
+    for ticker in tickers:
+        if ticker not in latest or pd.isna(latest[ticker]):
+            if missing_ok:
+                continue
+            raise Exception(f'Ticker not found: {ticker}')
+        prices[ticker] = float(latest[ticker])
+
+    return prices
+
 
 def get_info(ticker: str) -> dict:
     """Summarizes info about a stock
@@ -104,13 +168,18 @@ def get_info(ticker: str) -> dict:
     """
 
     try:
-        ticker = yf.Ticker(ticker)
-        return {x: y for x, y in ticker.info.items() if x in INCLUDE_FIELDS}
+        info = SINGLE_FLIGHT.do(('info', ticker.upper()), _fetch_info, ticker)
+        return {x: y for x, y in info.items() if x in INCLUDE_FIELDS}
 
     except Exception as e:
         raise e
 
 
+def _fetch_info(ticker: str) -> dict:
+    with METRICS.timed('yfinance', 'info'):
+        return yf.Ticker(ticker).info
+
+
 def get_news(ticker: str) -> tuple:
     """Sends a link to a news article related to the stock
 
@@ -122,26 +191,47 @@ def get_news(ticker: str) -> tuple:
     """
 
     try:
-        data = yf.Ticker(ticker)
-        i = random.randint(0, len(data.news)-1)
+        news = SINGLE_FLIGHT.do(('news', ticker.upper()), _fetch_news, ticker)
+        i = random.randint(0, len(news)-1)
 
-        return (data.news[i]['link'], data.news[i]['title'])
+        return (news[i]['link'], news[i]['title'])
     
     except Exception as e:
         raise e
 
 
-# TODO add dividends math...
-# TODO make more efficient (define a function to do calculations)
-def stock_worth(ticker: str, amount: int, start_date: date) -> dict:
+def _fetch_news(ticker: str) -> list:
+    with METRICS.timed('yfinance', 'news'):
+        return yf.Ticker(ticker).news
+
+
+def growth_plot_key(ticker: str, start_date: date, summary: dict) -> tuple:
+    """Cache key of a stock_worth plot, changes whenever a newer or updated close comes in
+
+    Args:
+        ticker (str): Ticker of a stock
+        start_date (date): Date of initial investment
+        summary (dict): summary returned by stock_worth
+
+    Returns:
+        tuple: cache key
+    """
+    return ('growth', ticker.upper(), str(start_date), summary['index_name']) + last_point(summary['growth'])
+
+
+def stock_worth(ticker: str, amount: int, start_date: date, index: str = DEFAULT_INDEX) -> dict:
     """Calculates the current value of a hypothetical investment in the past
-        Compares investment value to performance of s&p 500 index
-        Also saves a plot of % change in value
+        Compares investment value to performance of a market index (s&p 500 by default)
+        Also returns the % change in value of both for plotting.
+        Closes are yahoo's adjusted closes, kept consistent across dividends and splits by the history store,
+        so growth approximates reinvesting dividends. The indices are price indices and leave dividends out.
+        See functions.backtest for portfolios and other strategies
     
     Args:
         ticker (str): Ticker of a stock
         amount (int): Amount of initial investment
         start_date (date): Date of initial investment
+        index (str): Index to compare against, one of REFERENCE_INDICES
     
     Return:
         dict: dictionary of current investment value info
@@ -149,50 +239,37 @@ def stock_worth(ticker: str, amount: int, start_date: date) -> dict:
     """
 
     try:
-        ticker = yf.Ticker(ticker)
-        history = ticker.history(start=start_date, end=date.today())
-        buy_price = history.head(1).Close[0]
-        current_price = history.tail(1).Close[0]
-        returns = [(history.Close[x] / history.Close[x-1] - 1) for x in range(1, len(history.Close))]
-        returns.insert(0,0)
-        history['Returns'] = returns
-        history['PercentIncrease'] = [100*(history.Close[x]-buy_price)/buy_price for x in range(len(history.Close))]
+        ticker = ticker.upper()
+        history = HISTORY_STORE.get(ticker, start_date)
+        growth = summarize_growth(history.Close.to_numpy())
+        history['Returns'] = growth['returns']
+        history['PercentIncrease'] = growth['percent_increase']
 
         # calculating values
         summary = {}
-        summary['annual_returns'] = 100 * ((1 + np.mean(returns))**252 - 1)
-        summary['percent_increase'] = 100 * (current_price-buy_price) / buy_price
+        summary['annual_returns'] = growth['annual_returns']
+        summary['percent_increase'] = growth['total_increase']
         summary['current_value'] = (1 + summary['percent_increase']/100) * amount
         summary['total_profit'] = summary['current_value'] - amount
 
-        # s&p500
-        snp = yf.Ticker('^GSPC')
-        snp_history = snp.history(start=start_date, end=date.today())
-        snp_start_price = snp_history.head(1).Close[0]
-        snp_end_price = snp_history.tail(1).Close[0]
-        snp_returns = [(snp_history.Close[x] / snp_history.Close[x-1] - 1) for x in range(1,len(snp_history.Close))]
-        snp_returns.insert(0,0)
-        snp_history['Returns'] = snp_returns
-        snp_history['PercentIncrease'] = [100*(snp_history.Close[x]-snp_start_price)/snp_start_price for x in range(len(snp_history.Close))]
-        
-        summary['snp_annual_returns'] = 100 * ((1 + np.mean(snp_returns))**252 - 1)
-        summary['snp_percent_increase'] = 100*(snp_end_price/snp_start_price-1)
-        summary['snp_current_value'] = (1 + summary['snp_percent_increase']/100) * amount
-        summary['snp_total_profit'] = summary['snp_current_value'] - amount
+        # market index, precomputed so only the start date is looked up
+        reference = INDEX_STORE.get(index)
+        index_growth = reference.growth(start_date)
 
-        if summary['snp_current_value'] > summary['current_value']:
-            summary['recommendation'] = f"SMH... Should have just bought a market index fund. You would have had **${round(summary['snp_current_value'], 2)}** instead."
+        summary['index_name'] = reference.label
+        summary['index_annual_returns'] = index_growth['annual_returns']
+        summary['index_percent_increase'] = index_growth['total_increase']
+        summary['index_current_value'] = reference.value(amount, start_date)
+        summary['index_total_profit'] = summary['index_current_value'] - amount
+
+        if summary['index_current_value'] > summary['current_value']:
+            summary['recommendation'] = f"SMH... Should have just bought a market index fund. You would have had **${round(summary['index_current_value'], 2)}** instead."
         else:
-            summary['recommendation'] = f"{ticker.ticker} FTW!"
+            summary['recommendation'] = f"{ticker} FTW!"
         
-        #plotting
-        plt.figure(figsize=(10,5))
-        plt.plot(history.PercentIncrease, label=ticker.ticker)
-        plt.plot(snp_history.PercentIncrease, label='S&P 500')
-        plt.ylabel('Percentage increase')
-        plt.title(f'Percent price increase of {ticker.ticker} from {start_date}')
-        plt.legend()
-        plt.savefig(GROWTH_PLOT_PATH)
+        # plotted with render_growth_plot
+        summary['growth'] = pd.DataFrame({ticker: history.PercentIncrease, reference.label: reference.percent_increase(start_date)})
+        summary['plot_title'] = f'Percent price increase of {ticker} from {start_date}'
 
         return summary
 
@@ -201,10 +278,5 @@ def stock_worth(ticker: str, amount: int, start_date: date) -> dict:
         raise e
 
 
-# def calculate_values(data: pd.DataFrame) -> pd.DataFrame:
-#     """Calculates some summary values of a stock
-#         values calculated: """
-        
-
 # if __name__ == "__main__":
 #     stock_worth('T', 1000, '2012-03-15')
\ No newline at end of file
@@ -0,0 +1,503 @@
+import json
+import os
+import sqlite3
+import threading
+
+from functions.guilds import partition_key, partition_path
+from functions.metrics import METRICS
+
+# constants
+from functions.constants import DATABASE_PATH, PORTFOLIO_DATA_PATH, TRANSACTIONS_PATH
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    create_date TEXT NOT NULL,
+    funds_available REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_profiles_username ON profiles (username);
+
+CREATE TABLE IF NOT EXISTS holdings (
+    username TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    name TEXT,
+    shares INTEGER NOT NULL,
+    average_price REAL NOT NULL,
+    currency TEXT,
+    PRIMARY KEY (username, ticker)
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    username TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    price REAL NOT NULL,
+    shares INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    remaining_funds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_ticker_date ON transactions (username, ticker, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_ticker_date ON transactions (ticker, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date);
+
+CREATE TABLE IF NOT EXISTS nav (
+    date TEXT NOT NULL,
+    username TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (date, username)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    username TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    side TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    shares INTEGER NOT NULL,
+    limit_price REAL,
+    stop_price REAL,
+    triggered INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_orders_username ON orders (username);
+"""
+
+TRANSACTION_FIELDS = ['date', 'username', 'ticker', 'price', 'shares', 'status', 'remaining_funds']
+INSERT_TRANSACTION = f'INSERT INTO transactions ({", ".join(TRANSACTION_FIELDS)}) VALUES ({", ".join("?"*len(TRANSACTION_FIELDS))})'
+
+
+class Storage:
+    """SQLite store of user profiles, holdings and transactions.
+        Each thread gets its own connection, the database runs in WAL mode so reads never block on writes
+    """
+    def __init__(self, path: str = DATABASE_PATH) -> None:
+        self.path = path
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @METRICS.timed('db', 'read.user_exists')
+    def user_exists(self, username: str) -> bool:
+        """Checks if user has a profile
+
+            Args:
+                username (str): user's name
+
+            Return:
+                bool: boolean of whether the user exists
+        """
+        row = self._connection().execute('SELECT 1 FROM profiles WHERE username = ?', (username,)).fetchone()
+        return row is not None
+
+    @METRICS.timed('db', 'write.add_profile')
+    def add_profile(self, profile: dict) -> bool:
+        """Adds a new profile along with its holdings
+
+            Args:
+                profile (dict): profile with username, create_date, funds_available and portfolio
+
+            Return:
+                bool: True if profile was added, False if the username is taken
+        """
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute('INSERT INTO profiles (username, create_date, funds_available) VALUES (?, ?, ?)',
+                             (profile['username'], profile['create_date'], profile['funds_available']))
+                self._write_holdings(conn, profile['username'], profile['portfolio'])
+        except sqlite3.IntegrityError:
+            return False
+
+        return True
+
+    @METRICS.timed('db', 'read.get_profile')
+    def get_profile(self, username: str) -> dict:
+        """Retrieves a user's profile
+
+            Args:
+                username (str): user's name
+
+            Return:
+                dict: dictionary of user's profile, None if user does not exist
+        """
+        conn = self._connection()
+        row = conn.execute('SELECT * FROM profiles WHERE username = ?', (username,)).fetchone()
+        if row is None:
+            return None
+
+        profile = dict(row)
+        profile['portfolio'] = self._read_holdings(conn, username)
+        return profile
+
+    @METRICS.timed('db', 'read.get_all_profiles')
+    def get_all_profiles(self) -> list:
+        """Retrieves every profile
+
+            Return:
+                list: list of profile dictionaries
+        """
+        conn = self._connection()
+        profiles = {row['username']: dict(row, portfolio={}) for row in conn.execute('SELECT * FROM profiles')}
+
+        for row in conn.execute('SELECT * FROM holdings'):
+            if row['username'] in profiles:
+                profiles[row['username']]['portfolio'][row['ticker']] = self._holding(row)
+
+        return list(profiles.values())
+
+    @METRICS.timed('db', 'read.get_held_tickers')
+    def get_held_tickers(self) -> list:
+        """Retrieves every ticker held by at least one user
+
+            Return:
+                list: sorted list of tickers
+        """
+        rows = self._connection().execute('SELECT DISTINCT ticker FROM holdings ORDER BY ticker')
+        return [row['ticker'] for row in rows]
+
+    @METRICS.timed('db', 'write.update_profile')
+    def update_profile(self, username: str, funds_available: float, portfolio: dict) -> None:
+        """Overwrites a user's available funds and holdings
+
+            Args:
+                username (str): user's name
+                funds_available (float): new available funds
+                portfolio (dict): dictionary of ticker to holding
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute('UPDATE profiles SET funds_available = ? WHERE username = ?', (funds_available, username))
+            conn.execute('DELETE FROM holdings WHERE username = ?', (username,))
+            self._write_holdings(conn, username, portfolio)
+
+    @METRICS.timed('db', 'write.apply_trade')
+    def apply_trade(self, username: str, funds_available: float, ticker: str, holding: dict, transaction: dict) -> None:
+        """Writes the result of a trade in a single database transaction.
+            Only the traded holding is touched, the rest of the portfolio is left as is
+
+            Args:
+                username (str): user's name
+                funds_available (float): funds remaining after the trade
+                ticker (str): the stocks ticker
+                holding (dict): new holding of the ticker, None if the position was closed
+                transaction (dict): ledger entry with the TRANSACTION_FIELDS
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute('UPDATE profiles SET funds_available = ? WHERE username = ?', (funds_available, username))
+
+            if holding is None:
+                conn.execute('DELETE FROM holdings WHERE username = ? AND ticker = ?', (username, ticker))
+            else:
+                conn.execute('INSERT OR REPLACE INTO holdings (username, ticker, name, shares, average_price, currency) VALUES (?, ?, ?, ?, ?, ?)',
+                             (username, ticker, holding['name'], holding['shares'], holding['average_price'], holding['currency']))
+
+            conn.execute(INSERT_TRANSACTION,
+                         [transaction[field] for field in TRANSACTION_FIELDS])
+
+    @METRICS.timed('db', 'write.apply_trades')
+    def apply_trades(self, username: str, funds_available: float, holdings: dict, transactions: list) -> None:
+        """Writes the result of several trades in a single database transaction, either every trade is written or none
+
+            Args:
+                username (str): user's name
+                funds_available (float): funds remaining after the last trade
+                holdings (dict): new holding of every traded ticker, None if the position was closed
+                transactions (list): ledger entries with the TRANSACTION_FIELDS, in the order they were made
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute('UPDATE profiles SET funds_available = ? WHERE username = ?', (funds_available, username))
+
+            conn.executemany('DELETE FROM holdings WHERE username = ? AND ticker = ?',
+                             [(username, ticker) for ticker, holding in holdings.items() if holding is None])
+            conn.executemany('INSERT OR REPLACE INTO holdings (username, ticker, name, shares, average_price, currency) VALUES (?, ?, ?, ?, ?, ?)',
+                             [(username, ticker, holding['name'], holding['shares'], holding['average_price'], holding['currency'])
+                              for ticker, holding in holdings.items() if holding is not None])
+
+            conn.executemany(INSERT_TRANSACTION,
+                             [[transaction[field] for field in TRANSACTION_FIELDS] for transaction in transactions])
+
+    @METRICS.timed('db', 'read.get_transactions')
+    def get_transactions(self, username: str) -> list:
+        """Retrieves a user's transactions in the order they were made
+
+            Args:
+                username (str): user's name
+
+            Return:
+                list: list of transaction dictionaries
+        """
+        rows = self._connection().execute('SELECT * FROM transactions WHERE username = ? ORDER BY date, id', (username,))
+        return [dict(row) for row in rows]
+
+    @METRICS.timed('db', 'read.query_transactions')
+    def query_transactions(self, username: str = None, ticker: str = None, start: str = None, end: str = None) -> dict:
+        """Retrieves the transactions matching every given filter as columns.
+            Filters on user, ticker and date are served by the transaction indexes
+
+            Args:
+                username (str): only transactions of this user
+                ticker (str): only transactions of this ticker
+                start (str): first date to include (YYYY-MM-DD)
+                end (str): last date to include (YYYY-MM-DD)
+
+            Return:
+                dict: id and every TRANSACTION_FIELDS column as a list, in the order the transactions were made
+        """
+        filters = [('username = ?', username), ('ticker = ?', ticker), ('date >= ?', start), ('date <= ?', end)]
+        filters = [(condition, value) for condition, value in filters if value is not None]
+        where = ' WHERE ' + ' AND '.join(condition for condition, _ in filters) if filters else ''
+
+        return self._select_columns(['id'] + TRANSACTION_FIELDS, f'FROM transactions{where} ORDER BY date, id',
+                                    [value for _, value in filters])
+
+    @METRICS.timed('db', 'read.get_positions')
+    def get_positions(self) -> tuple:
+        """Retrieves every user's funds and holdings as columns, used to value all portfolios at once
+
+            Return:
+                tuple: dictionary of username and funds_available columns,
+                    and dictionary of username, ticker, shares and average_price columns
+        """
+        funds = self._select_columns(['username', 'funds_available'], 'FROM profiles ORDER BY id')
+        holdings = self._select_columns(['username', 'ticker', 'shares', 'average_price'], 'FROM holdings')
+        return funds, holdings
+
+    @METRICS.timed('db', 'write.write_nav')
+    def write_nav(self, day: str, values: dict) -> None:
+        """Stores the end of day value of every portfolio, replacing values already stored for that day
+
+            Args:
+                day (str): trading day (YYYY-MM-DD)
+                values (dict): dictionary of username to portfolio value
+        """
+        conn = self._connection()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO nav (date, username, value) VALUES (?, ?, ?)',
+                             [(day, username, value) for username, value in values.items()])
+
+    @METRICS.timed('db', 'read.get_nav')
+    def get_nav(self, day: str) -> dict:
+        """Retrieves the end of day value of every portfolio on a day
+
+            Args:
+                day (str): trading day (YYYY-MM-DD)
+
+            Return:
+                dict: dictionary of username to portfolio value
+        """
+        rows = self._connection().execute('SELECT username, value FROM nav WHERE date = ?', (day,))
+        return {row['username']: row['value'] for row in rows}
+
+    @METRICS.timed('db', 'read.get_nav_dates')
+    def get_nav_dates(self, limit: int = 2) -> list:
+        """Retrieves the most recent days with stored portfolio values
+
+            Args:
+                limit (int): number of days
+
+            Return:
+                list: days (YYYY-MM-DD), newest first
+        """
+        rows = self._connection().execute('SELECT DISTINCT date FROM nav ORDER BY date DESC LIMIT ?', (limit,))
+        return [row['date'] for row in rows]
+
+    @METRICS.timed('db', 'write.add_order')
+    def add_order(self, order: dict) -> int:
+        """Stores a pending order
+
+            Args:
+                order (dict): order with date, username, ticker, side, kind, shares, limit_price and stop_price
+
+            Return:
+                int: id of the order
+        """
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute('INSERT INTO orders (date, username, ticker, side, kind, shares, limit_price, stop_price) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                  (order['date'], order['username'], order['ticker'], order['side'], order['kind'],
+                                   order['shares'], order['limit_price'], order['stop_price']))
+        return cursor.lastrowid
+
+    @METRICS.timed('db', 'read.get_orders')
+    def get_orders(self, username: str = None) -> list:
+        """Retrieves pending orders in the order they were placed
+
+            Args:
+                username (str): only orders of this user, None for every user
+
+            Return:
+                list: list of order dictionaries
+        """
+        if username is None:
+            rows = self._connection().execute('SELECT * FROM orders ORDER BY id')
+        else:
+            rows = self._connection().execute('SELECT * FROM orders WHERE username = ? ORDER BY id', (username,))
+        return [dict(row) for row in rows]
+
+    @METRICS.timed('db', 'read.get_order_tickers')
+    def get_order_tickers(self) -> list:
+        """Retrieves every ticker with a pending order
+
+            Return:
+                list: list of tickers
+        """
+        rows = self._connection().execute('SELECT DISTINCT ticker FROM orders')
+        return [row['ticker'] for row in rows]
+
+    @METRICS.timed('db', 'write.trigger_order')
+    def trigger_order(self, order_id: int) -> None:
+        """Marks the stop of a stop-limit order as reached, from then on it waits for its limit price
+
+            Args:
+                order_id (int): id of the order
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute('UPDATE orders SET triggered = 1 WHERE id = ?', (order_id,))
+
+    @METRICS.timed('db', 'write.remove_order')
+    def remove_order(self, order_id: int, username: str = None) -> bool:
+        """Removes a pending order once it is filled or cancelled
+
+            Args:
+                order_id (int): id of the order
+                username (str): only remove the order if it belongs to this user
+
+            Return:
+                bool: True if the order was removed
+        """
+        conn = self._connection()
+        with conn:
+            if username is None:
+                cursor = conn.execute('DELETE FROM orders WHERE id = ?', (order_id,))
+            else:
+                cursor = conn.execute('DELETE FROM orders WHERE id = ? AND username = ?', (order_id, username))
+        return cursor.rowcount > 0
+
+    def migrate_from_pysondb(self, portfolio_path: str = PORTFOLIO_DATA_PATH, transactions_path: str = TRANSACTIONS_PATH) -> tuple:
+        """One shot import of the old pysondb json files. Profiles that already exist are skipped
+
+            Args:
+                portfolio_path (str): path of the pysondb portfolio file
+                transactions_path (str): path of the pysondb transactions file
+
+            Return:
+                tuple: number of profiles and transactions imported
+        """
+        profiles = _read_pysondb(portfolio_path)
+        transactions = _read_pysondb(transactions_path)
+
+        conn = self._connection()
+        imported = set()
+        with conn:
+            for profile in profiles:
+                cursor = conn.execute('INSERT OR IGNORE INTO profiles (username, create_date, funds_available) VALUES (?, ?, ?)',
+                                      (profile['username'], profile['create_date'], profile['funds_available']))
+                if cursor.rowcount:
+                    imported.add(profile['username'])
+                    self._write_holdings(conn, profile['username'], profile['portfolio'])
+
+            transactions = [transaction for transaction in transactions if transaction['username'] in imported]
+            conn.executemany(INSERT_TRANSACTION,
+                             [[transaction[field] for field in TRANSACTION_FIELDS] for transaction in transactions])
+
+        return len(imported), len(transactions)
+
+    def _select_columns(self, columns: list, query: str, params: list = ()) -> dict:
+        cursor = self._connection().cursor()
+        # plain tuples are transposed into columns, skipping the per row dictionaries
+        cursor.row_factory = None
+        rows = cursor.execute(f'SELECT {", ".join(columns)} {query}', params).fetchall()
+
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        return {column: list(value) for column, value in zip(columns, values)}
+
+    @staticmethod
+    def _holding(row: sqlite3.Row) -> dict:
+        return {
+            'name': row['name'],
+            'shares': row['shares'],
+            'average_price': row['average_price'],
+            'currency': row['currency']
+        }
+
+    def _read_holdings(self, conn: sqlite3.Connection, username: str) -> dict:
+        rows = conn.execute('SELECT * FROM holdings WHERE username = ?', (username,))
+        return {row['ticker']: self._holding(row) for row in rows}
+
+    @staticmethod
+    def _write_holdings(conn: sqlite3.Connection, username: str, portfolio: dict) -> None:
+        conn.executemany('INSERT INTO holdings (username, ticker, name, shares, average_price, currency) VALUES (?, ?, ?, ?, ?, ?)',
+                         [(username, ticker, stock['name'], stock['shares'], stock['average_price'], stock['currency'])
+                          for ticker, stock in portfolio.items()])
+
+
+def _read_pysondb(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+
+    with open(path, 'r') as read_path:
+        return json.load(read_path).get('data', [])
+
+
+# default partition, and one storage per guild partition
+_storage = None
+_guild_storages = {}
+_storage_lock = threading.Lock()
+
+def get_storage(guild_id: int = None) -> Storage:
+    """Gets the storage backend of a guild, creating its database on first use.
+        Every guild has its own database, so guilds never share profiles or block each other's writes
+
+        Args:
+            guild_id (int): guild id, defaults to the guild of the current command
+
+        Return:
+            Storage: storage backend
+    """
+    global _storage
+    key = partition_key(guild_id)
+    with _storage_lock:
+        if key is None:
+            if _storage is None:
+                _storage = Storage()
+            return _storage
+
+        if key not in _guild_storages:
+            _guild_storages[key] = Storage(partition_path(DATABASE_PATH, key))
+        return _guild_storages[key]
+
+
+def get_storages(guild_ids: list) -> list:
+    """Gets the storage of every partition holding data of the given guilds.
+        Used by background work that runs outside of a command and covers every guild of this process
+
+        Args:
+            guild_ids (list): guild ids, None for the default partition
+
+        Return:
+            list: storage backends, each partition once
+    """
+    storages = [get_storage(guild_id) for guild_id in guild_ids]
+    return list({id(storage): storage for storage in storages}.values())
+
+
+if __name__ == "__main__":
+    profiles, transactions = get_storage().migrate_from_pysondb()
+    print(f'migrated {profiles} profiles and {transactions} transactions')
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from functions.lazy import lazy_import
+from functions.metrics import METRICS
+from functions.quote_cache import QUOTE_CACHE
+from functions.single_flight import SINGLE_FLIGHT
+
+# constants
+from functions.constants import TICKER_STORE_PATH, TICKER_TTL, TICKER_INVALID_TTL, IO_WORKERS
+
+# imported on first use, yfinance is slow to import
+yf = lazy_import('yfinance')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickers (
+    ticker TEXT PRIMARY KEY,
+    name TEXT,
+    currency TEXT,
+    exchange TEXT,
+    valid INTEGER NOT NULL,
+    checked REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class TickerStore:
+    """Persistent store of ticker metadata (name, currency, exchange) shared by every guild.
+        Metadata rarely changes so it is kept for a long ttl, symbols yahoo does not know are
+        remembered as invalid for a shorter one so repeated typos never reach yahoo.
+        Every entry is also kept in memory, the database is only read once
+    """
+    def __init__(self, path: str = TICKER_STORE_PATH, ttl: float = TICKER_TTL, invalid_ttl: float = TICKER_INVALID_TTL) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.invalid_ttl = invalid_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    rows = self._connection().execute('SELECT * FROM tickers')
+                    self._entries = {row['ticker']: dict(row, valid=bool(row['valid'])) for row in rows}
+        return self._entries
+
+    def _fresh(self, entry: dict) -> bool:
+        ttl = self.ttl if entry['valid'] else self.invalid_ttl
+        return time.time() - entry['checked'] < ttl
+
+    def lookup(self, ticker: str) -> dict:
+        """Gets stored metadata without any upstream request
+
+            Args:
+                ticker (str): the stocks ticker
+
+            Return:
+                dict: name, currency, exchange and valid, None if not stored or expired
+        """
+        entry = self._load().get(ticker.upper())
+        if entry is None or not self._fresh(entry):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def is_invalid(self, ticker: str) -> bool:
+        """Checks if a ticker is known to not exist, without any upstream request
+
+            Args:
+                ticker (str): the stocks ticker
+
+            Return:
+                bool: True if yahoo recently did not know the ticker
+        """
+        entry = self._load().get(ticker.upper())
+        return entry is not None and not entry['valid'] and self._fresh(entry)
+
+    def get(self, ticker: str) -> dict:
+        """Gets the metadata of a ticker, fetching it if it is not stored or expired
+
+            Args:
+                ticker (str): the stocks ticker
+
+            Return:
+                dict: name, currency, exchange and valid
+        """
+        ticker = ticker.upper()
+        entry = self.lookup(ticker)
+        if entry is None:
+            entry = SINGLE_FLIGHT.do(('metadata', ticker), self._fetch, ticker)
+
+        if not entry['valid']:
+            raise Exception('Ticker not found')
+        return entry
+
+    def _fetch(self, ticker: str) -> dict:
+        with METRICS.timed('yfinance', 'info'):
+            info = yf.Ticker(ticker).info
+
+        # yahoo answers unknown symbols with an almost empty info dictionary
+        name = info.get('longName') or info.get('shortName')
+        entry = {
+            'ticker': ticker,
+            'name': name,
+            'currency': info.get('financialCurrency') or info.get('currency'),
+            'exchange': info.get('exchange'),
+            'valid': name is not None,
+            'checked': time.time()
+        }
+
+        # the same response has the price, so a trade of a new ticker makes no second request
+        price = info.get('currentPrice') or info.get('regularMarketPrice')
+        if price is not None:
+            QUOTE_CACHE.put(ticker, price)
+
+        self._save(entry)
+        return entry
+
+    def _save(self, entry: dict) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO tickers (ticker, name, currency, exchange, valid, checked) VALUES (?, ?, ?, ?, ?, ?)',
+                         (entry['ticker'], entry['name'], entry['currency'], entry['exchange'], int(entry['valid']), entry['checked']))
+        self._load()[entry['ticker']] = entry
+
+    def prepopulate(self, tickers: list, workers: int = IO_WORKERS) -> int:
+        """Fetches the metadata of every ticker that is not stored or expired, several at a time
+
+            Args:
+                tickers (list): list of tickers
+                workers (int): number of requests made at once
+
+            Return:
+                int: number of tickers fetched
+        """
+        missing = sorted(set(ticker.upper() for ticker in tickers if self.lookup(ticker) is None))
+
+        def fetch(ticker: str) -> None:
+            try:
+                SINGLE_FLIGHT.do(('metadata', ticker), self._fetch, ticker)
+            except Exception as e:
+                print(f'failed to fetch metadata of {ticker}: {e}')
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bot-metadata') as pool:
+            list(pool.map(fetch, missing))
+        return len(missing)
+
+    def stats(self) -> dict:
+        """Summarizes store usage
+
+            Return:
+                dict: number of stored and invalid tickers, hits and misses
+        """
+        entries = self._entries or {}
+        return {
+            'size': len(entries),
+            'invalid': sum(not entry['valid'] for entry in list(entries.values())),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+# shared by every guild
+TICKER_STORE = TickerStore()
+METRICS.register_gauge('ticker_store', TICKER_STORE.stats)
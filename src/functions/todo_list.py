@@ -1,64 +1,244 @@
 import json
+import os
+import threading
+
+from functions.guilds import partition_key, partition_path
+
+# constants
+from functions.constants import TODO_LIST_PATH, TODO_COMPACT_OPS
+
+
+class TodoLog:
+    """Todo lists kept in memory and persisted as a snapshot plus an append only log of operations.
+        Adding or completing an item appends one line to the log instead of rewriting every list.
+        Once the log grows past compact_ops entries it is folded into a new snapshot in the background
+
+        The snapshot ({"seq": n, "lists": {...}}) records the last operation it contains, so operations
+        still in the log after a crash are never applied twice. A plain {user: [items]} file, as written
+        before the log existed, is read as a snapshot of sequence 0
+    """
+    def __init__(self, path: str = TODO_LIST_PATH, compact_ops: int = TODO_COMPACT_OPS) -> None:
+        self.path = path
+        self.log_path = path + '.log'
+        self.compact_ops = compact_ops
+        self._lock = threading.Lock()
+        self._compacting = None
+
+        self.seq, self.lists, self._log_ops = self._load()
+        self._log = open(self.log_path, 'a')
+
+    def _read_snapshot(self) -> tuple:
+        if not os.path.exists(self.path):
+            return 0, {}
+
+        with open(self.path, 'r') as read_path:
+            data = json.load(read_path)
+
+        if set(data) == {'seq', 'lists'} and isinstance(data['seq'], int):
+            return data['seq'], data['lists']
+        return 0, data
+
+    @staticmethod
+    def _truncate_partial(path: str) -> None:
+        # drops a last line cut short by a crash, so new operations are not appended onto it
+        with open(path, 'rb+') as log:
+            data = log.read()
+            if data and not data.endswith(b'\n'):
+                log.truncate(data.rfind(b'\n') + 1)
+
+    def _load(self) -> tuple:
+        seq, lists = self._read_snapshot()
+        replayed = 0
+
+        # a log rotated by a compaction that did not finish is replayed before the current one
+        for path in [self.log_path + '.old', self.log_path]:
+            if not os.path.exists(path):
+                continue
+            self._truncate_partial(path)
+            with open(path, 'r') as read_path:
+                for line in read_path:
+                    op = json.loads(line)
+                    if op['seq'] > seq:
+                        self._apply(lists, op)
+                        seq = op['seq']
+                    replayed += 1
+
+        return seq, lists, replayed
+
+    @staticmethod
+    def _apply(lists: dict, op: dict) -> None:
+        if op['op'] == 'add':
+            lists.setdefault(op['user'], []).append(op['item'])
+        elif op['op'] == 'complete':
+            lists[op['user']].pop(op['index'])
+
+    def _append(self, op: dict) -> None:
+        self.seq += 1
+        op['seq'] = self.seq
+        self._log.write(json.dumps(op) + '\n')
+        self._log.flush()
+        self._apply(self.lists, op)
+
+        self._log_ops += 1
+        if self._log_ops >= self.compact_ops and self._compacting is None:
+            self._start_compaction()
+
+    def _start_compaction(self) -> None:
+        # called with the lock held: the log is rotated so new operations go to a fresh file
+        # while the snapshot is written from a copy of the lists.
+        # Operations were only flushed when they were acknowledged, they are on disk before the log is rotated
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._log.close()
+        if os.path.exists(self.log_path + '.old'):
+            # a previous compaction did not finish, its operations are kept for this one
+            with open(self.log_path + '.old', 'a') as old, open(self.log_path, 'r') as log:
+                old.write(log.read())
+                old.flush()
+                os.fsync(old.fileno())
+            os.remove(self.log_path)
+        else:
+            os.replace(self.log_path, self.log_path + '.old')
+        self._log = open(self.log_path, 'a')
+        self._log_ops = 0
+
+        snapshot = {'seq': self.seq, 'lists': {user: list(items) for user, items in self.lists.items()}}
+        self._compacting = threading.Thread(target=self._compact, args=(snapshot,), name='todo-compaction', daemon=True)
+        self._compacting.start()
+
+    def _compact(self, snapshot: dict) -> None:
+        try:
+            with open(self.path + '.tmp', 'w') as write_path:
+                json.dump(snapshot, write_path)
+                write_path.flush()
+                os.fsync(write_path.fileno())
+            os.replace(self.path + '.tmp', self.path)
+            os.remove(self.log_path + '.old')
+        except Exception as e:
+            print(f'failed to compact todo list: {e}')
+        finally:
+            with self._lock:
+                self._compacting = None
+
+    def compact(self) -> None:
+        """Folds the log into a new snapshot and waits for it to be written"""
+        with self._lock:
+            if self._compacting is None:
+                self._start_compaction()
+            compacting = self._compacting
+        compacting.join()
+
+    def get(self, user: str) -> list:
+        """Gets a copy of a user's todo list
+
+            Args:
+                user (str): the users name
+
+            Return:
+                list: list of todo items, None if the user does not have a list
+        """
+        with self._lock:
+            items = self.lists.get(user)
+            return None if items is None else list(items)
+
+    def add(self, user: str, item: str) -> None:
+        """Adds an item to a user's todo list
+
+            Args:
+                user (str): the users name
+                item (str): item to add to list
+        """
+        with self._lock:
+            self._append({'op': 'add', 'user': user, 'item': item})
+
+    def complete(self, user: str, index: int) -> None:
+        """Removes an item from a user's todo list
+
+            Args:
+                user (str): the users name
+                index (int): index of the item
+        """
+        with self._lock:
+            if user not in self.lists:
+                raise Exception(f"{user} does not have a todo list")
+            if index not in range(len(self.lists[user])):
+                raise ValueError('Index does not exist')
+            self._append({'op': 'complete', 'user': user, 'index': index})
+
+    def close(self) -> None:
+        with self._lock:
+            compacting = self._compacting
+            self._log.close()
+        if compacting is not None:
+            compacting.join()
+
+
+# default partition, and one todo log per guild partition
+_todo_log = None
+_guild_todo_logs = {}
+_todo_log_lock = threading.Lock()
+
+
+def get_todo_log(guild_id: int = None) -> TodoLog:
+    """Gets the todo log of a guild, loading it on first use
+
+        Args:
+            guild_id (int): guild id, defaults to the guild of the current command
+
+        Return:
+            TodoLog: todo lists of every user in the guild
+    """
+    global _todo_log
+    key = partition_key(guild_id)
+    with _todo_log_lock:
+        if key is None:
+            if _todo_log is None:
+                _todo_log = TodoLog()
+            return _todo_log
+
+        if key not in _guild_todo_logs:
+            _guild_todo_logs[key] = TodoLog(partition_path(TODO_LIST_PATH, key))
+        return _guild_todo_logs[key]
 
-from functions.constants import TODO_LIST_PATH
 
 def get_list(user: str) -> list:
     """Gets the user's current todo list
-    
+
     Args:
         user (str): the users name
-        
+
     Returns:
         list: list of todo items
     """
-    with open(TODO_LIST_PATH, 'r') as read_path:
-            data = json.load(read_path)
+    items = get_todo_log().get(user)
 
-    if user not in data:
+    if items is None:
         raise Exception(f"{user} does not have a todo list")
-    elif len(data.get(user)) == 0:
+    elif len(items) == 0:
         raise Exception(f"{user}'s todo list is empty")
     else:
         todo = f'Current TODO list for {user}\n'
-        for i, item in enumerate(data.get(user)):
+        for i, item in enumerate(items):
             todo += f'> {i+1}.{item}\n'
-        
+
         return todo
 
 
 def add_item(user: str, item: str) -> None:
     """Adds an item to the todo list
-    
+
     Args:
         user (str): the users name
         item (str): item to add to list
     """
-    with open(TODO_LIST_PATH, 'r') as read_path:
-            data = json.load(read_path)
-
-    if user in data:
-        data[user].append(item)
-    else:
-        data[user] = [item]
-    
-    with open(TODO_LIST_PATH, 'w') as write_path:
-        json.dump(data, write_path, indent=4)
-
+    get_todo_log().add(user, item)
 
 
 def mark_complete(user: str, index: int) -> None:
     """Marks a todo list item as complete
-    
+
     Args:
         user (str): the users name
         index (int): index of the item
     """
-    with open(TODO_LIST_PATH, 'r') as read_path:
-        data = json.load(read_path)
-    
-    if index not in range(len(data.get(user))):
-        raise ValueError('Index does not exist')
-    else:
-        data.get(user).pop(index)
-        with open(TODO_LIST_PATH, 'w') as write_path:
-            json.dump(data, write_path, indent=4)
+    get_todo_log().complete(user, index)
@@ -0,0 +1,34 @@
+import asyncio
+import weakref
+
+from functions.guilds import partition_key
+
+
+class UserLocks:
+    """Hands out one asyncio lock per user so trades of the same user run one at a time
+        while trades of different users run in parallel.
+        Users are told apart per guild partition, so a user of one guild never waits on another guild.
+        Locks are dropped once nobody holds a reference to them
+    """
+    def __init__(self) -> None:
+        self._locks = weakref.WeakValueDictionary()
+
+    def __call__(self, username: str) -> asyncio.Lock:
+        """Gets the lock of a user
+
+            Args:
+                username (str): user's name
+
+            Return:
+                asyncio.Lock: lock shared by every trade of the user
+        """
+        key = (partition_key(), username)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+
+# shared by all commands that modify a portfolio
+USER_LOCKS = UserLocks()
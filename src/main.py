@@ -1,8 +1,25 @@
 import os
+import sys
+import time
 import asyncio
-import discord
-from dotenv import load_dotenv
-from discord.ext import commands
+import subprocess
+
+# first so the imports below are included in the startup report
+from functions.startup import STARTUP, prewarm
+
+with STARTUP.timed('import', 'discord'):
+    import discord
+    from dotenv import load_dotenv
+    from discord.ext import commands
+
+with STARTUP.timed('import', 'functions'):
+    from functions.guilds import CURRENT_GUILD, partition_key, process_shards
+    from functions.metrics import METRICS
+    from functions.leaderboard import LEADERBOARDS
+    from functions.nav import record_nav_daily
+    from functions.order_book import ORDER_MATCHER
+    from functions.price_refresher import PRICE_REFRESHER
+    from functions.constants import METRICS_PATH, METRICS_INTERVAL, METRICS_PORT
 
 # # importing cogs
 # from cogs.general_commands import GeneralCommands
@@ -14,25 +31,52 @@ load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 GUILD = os.getenv('DISCORD_GUILD')
 
+# sharding, SHARD_COUNT shards split between SHARD_PROCESSES processes (SHARD_PROCESS is set for each child process)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0)) or None
+SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES', 1))
+SHARD_PROCESS = os.getenv('SHARD_PROCESS')
+SHARD_IDS = process_shards(int(SHARD_PROCESS), SHARD_PROCESSES, SHARD_COUNT) if SHARD_PROCESS is not None else None
+
 # intents
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-#bot command prefix
-bot = commands.Bot(command_prefix='$', intents=intents)
+#bot command prefix, discord picks the number of shards unless SHARD_COUNT is set
+bot = commands.AutoShardedBot(command_prefix='$', intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
 
 
 @bot.event
 async def on_ready():
     print('connection established!')
 
-    # print server info
+    # on_ready runs again after every reconnect, startup only happens once
+    if not hasattr(bot, 'prewarm'):
+        STARTUP.record('ready', 'connected', STARTUP.elapsed())
+        print(STARTUP.report())
+        bot.prewarm = asyncio.create_task(prewarm(guild_ids))
+
+    # print server info, the guild may be on a shard of another process
     guild = discord.utils.get(bot.guilds, name=GUILD)
-    print(
-        f'{bot.user} is connected to the following guild:\n'
-        f'{guild.name}(id: {guild.id}) \n'
-    )
+    if guild:
+        print(
+            f'{bot.user} is connected to the following guild:\n'
+            f'{guild.name}(id: {guild.id}) \n'
+        )
+    print(f'shards {sorted(bot.shards)} serving {len(bot.guilds)} guilds')
+
+
+@bot.before_invoke
+async def start_timer(ctx):
+    ctx.start_time = time.perf_counter()
+    # storage used by the command goes to the partition of its guild
+    CURRENT_GUILD.set(ctx.guild.id if ctx.guild else None)
+
+
+@bot.after_invoke
+async def record_latency(ctx):
+    # cogs reply to their own errors and flag ctx.command_failed, prompts (functions.prompts) move start_time past the wait for the user
+    METRICS.observe('command', ctx.command.qualified_name, time.perf_counter() - ctx.start_time, ctx.command_failed)
 
 
 @bot.event
@@ -50,12 +94,55 @@ async def on_member_join(member):
 async def load():
     for filename in os.listdir('C:/Users/Yang/Documents/Projects/discord bot/src/cogs'):
         if filename.endswith('.py'):
-            await bot.load_extension(f'cogs.{filename[:-3]}')
+            with STARTUP.timed('cog', filename[:-3]):
+                await bot.load_extension(f'cogs.{filename[:-3]}')
+
+
+def guild_ids() -> list:
+    # None is the default partition (direct messages and LEGACY_GUILD_ID). Direct messages come in on shard 0
+    # and process_shards puts the legacy guild's shard in the same process, so only that process serves it
+    default = [None] if SHARD_IDS is None or 0 in SHARD_IDS else []
+    return default + [guild.id for guild in bot.guilds if partition_key(guild.id) is not None]
 
 
 async def main():
     await load()
+
+    # prices of every held ticker are kept fresh in the background for $summary and $rankings,
+    # pending orders are matched against every new snapshot, then the leaderboards revalue the affected users
+    PRICE_REFRESHER.subscribe(ORDER_MATCHER.match)
+    PRICE_REFRESHER.subscribe(LEADERBOARDS.on_snapshot)
+    price_refresh = asyncio.create_task(PRICE_REFRESHER.run(guild_ids))
+    # end of day portfolio values for $daily
+    nav_record = asyncio.create_task(record_nav_daily(guild_ids))
+
+    # metrics are dumped to a file and optionally served on a local port, one of each per process
+    process = int(SHARD_PROCESS or 0)
+    metrics_path = METRICS_PATH if SHARD_PROCESS is None else f'{METRICS_PATH}.{process}'
+    metrics_export = asyncio.create_task(METRICS.export_periodically(metrics_path, METRICS_INTERVAL))
+    if METRICS_PORT:
+        await METRICS.serve(METRICS_PORT + process)
+
     await bot.start(TOKEN)
 
 
-asyncio.run(main())
\ No newline at end of file
+def run_shard_processes() -> None:
+    """Starts one bot process per group of shards and waits for them.
+        Guilds only ever talk to the process of their shard, and the default partition (direct messages and
+        LEGACY_GUILD_ID) is kept in the process of shard 0, so each storage partition has a single writer
+    """
+    if SHARD_COUNT is None:
+        raise SystemExit('SHARD_COUNT must be set to split shards between processes')
+
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=dict(os.environ, SHARD_PROCESS=str(process)))
+                 for process in range(SHARD_PROCESSES)]
+    for process in processes:
+        process.wait()
+
+
+# guarded so process pool workers can import this module without starting the bot
+if __name__ == '__main__':
+    if SHARD_PROCESSES > 1 and SHARD_PROCESS is None:
+        run_shard_processes()
+    else:
+        asyncio.run(main())
\ No newline at end of file